@@ -261,10 +261,13 @@ class base(object):
             raise_from(errors.CacheCorruption(
                 cpv, 'ValueError reading %r' % (eclass_string,)))
 
-    def validate_entry(self, cache_item, ebuild_hash_item, eclass_db):
+    def _validate_chf(self, cache_item, ebuild_hash_item):
         chf_hash = cache_item.get(self._chf_key)
-        if (chf_hash is None or
-            chf_hash != getattr(ebuild_hash_item, self.chf_type, None)):
+        return (chf_hash is not None and
+            chf_hash == getattr(ebuild_hash_item, self.chf_type, None))
+
+    def validate_entry(self, cache_item, ebuild_hash_item, eclass_db):
+        if not self._validate_chf(cache_item, ebuild_hash_item):
             return False
         eclass_data = cache_item.get('_eclasses_')
         if eclass_data is None:
@@ -275,6 +278,42 @@ class base(object):
         cache_item['_eclasses_'] = update
         return True
 
+    def validate_entries(self, ebuild_hashes, eclass_db):
+        """Validate a batch of entries, returning the stale cpvs.
+
+        This is the batch form of :obj:`validate_entry`; eclass validation
+        results are shared across the batch, thus entries inheriting the
+        same eclasses only check them against eclass_db once.
+
+        :param ebuild_hashes: mapping of cpv to the ebuild's chksum object
+            (typically :obj:`snakeoil.chksum.LazilyHashedPath`)
+        :param eclass_db: :obj:`pkgcore.ebuild.eclass_cache.base` instance
+            to validate eclass data against
+        :return: list of cpvs that are missing, corrupt, or stale
+        """
+        stale = []
+        eclass_results = {}
+        for cpv, ebuild_hash_item in ebuild_hashes.iteritems():
+            try:
+                cache_item = self[cpv]
+            except (KeyError, errors.CacheError):
+                stale.append(cpv)
+                continue
+            if not self._validate_chf(cache_item, ebuild_hash_item):
+                stale.append(cpv)
+                continue
+            eclass_data = cache_item.get('_eclasses_')
+            if eclass_data is None:
+                continue
+            key = tuple(eclass_data)
+            valid = eclass_results.get(key)
+            if valid is None:
+                valid = eclass_results[key] = (
+                    eclass_db.rebuild_cache_entry(eclass_data) is not None)
+            if not valid:
+                stale.append(cpv)
+        return stale
+
 
 class bulk(base):
 
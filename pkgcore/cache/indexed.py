@@ -0,0 +1,273 @@
+# License: GPL2/BSD
+
+"""
+single file, offset indexed backend
+
+All entries are stored in one append only file; each record is a
+``cpv<TAB>length`` header line followed by a flat_hash style key=value
+payload of that length.  Deletions are recorded as a header with a length
+of ``-``, and a later record for a cpv supersedes earlier ones.
+
+The file is memory mapped for reads; the offset index is built by walking
+the record headers, so loading the cache is a single open/mmap rather than
+a file access per entry.  Writers append under an exclusive lock, thus
+multiple processes can safely update the same cache.
+"""
+
+__all__ = ("database", "md5_cache")
+
+import errno
+import fcntl
+import mmap
+import os
+from pkgcore.cache import fs_template, errors
+from pkgcore.config import ConfigHint
+from snakeoil.osutils import pjoin
+from snakeoil.compatibility import raise_from
+
+
+class database(fs_template.FsBased):
+
+    """
+    stores all cache entries in a single, memory mapped file
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    autocommits = False
+    default_sync_rate = 100
+    eclass_chf_types = ('eclassdir', 'mtime')
+
+    filename = 'indexed-cache'
+    magic = 'pkgcore indexed cache 1\n'
+
+    def __init__(self, *args, **config):
+        super(database, self).__init__(*args, **config)
+        self._path = pjoin(self.location, self.filename)
+        # cpv -> serialized payload, or None for a pending deletion.
+        self._pending = {}
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        # cpv -> (offset, length) of the payload in the mmap.
+        self._index = {}
+        self._map = None
+        self._inode = None
+        self._scanned = 0
+        # count of superseded records and deletions; used to decide when
+        # to compact.
+        self._dead = 0
+
+    def _load(self):
+        if not self._loaded:
+            self._refresh()
+            self._loaded = True
+
+    def _refresh(self):
+        """update the index with any records written since we last looked"""
+        try:
+            f = open(self._path, 'rb')
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise_from(errors.GeneralCacheCorruption(e))
+            self._reset()
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if ((st.st_dev, st.st_ino) != self._inode
+                    or st.st_size < self._scanned):
+                # replaced via compaction; start from scratch.
+                self._reset()
+                self._inode = (st.st_dev, st.st_ino)
+            if not st.st_size or st.st_size == self._scanned:
+                return
+            self._map = mmap.mmap(f.fileno(), st.st_size,
+                access=mmap.ACCESS_READ)
+        self._scan()
+
+    def _scan(self):
+        m = self._map
+        end = len(m)
+        pos = self._scanned
+        if not pos:
+            if m[:len(self.magic)] != self.magic:
+                raise errors.GeneralCacheCorruption(
+                    "%s: invalid header" % (self._path,))
+            pos = len(self.magic)
+        index = self._index
+        dead = self._dead
+        try:
+            while pos < end:
+                header_end = m.find('\n', pos)
+                if header_end == -1:
+                    # trailing partial write; ignore it.
+                    break
+                cpv, length = m[pos:header_end].split('\t')
+                start = header_end + 1
+                if length == '-':
+                    index.pop(cpv, None)
+                    dead += 1
+                    pos = start
+                    continue
+                length = int(length)
+                if start + length > end:
+                    break
+                if cpv in index:
+                    dead += 1
+                index[cpv] = (start, length)
+                pos = start + length
+        except ValueError as e:
+            raise_from(errors.GeneralCacheCorruption(
+                "%s: invalid record at offset %i: %s" % (self._path, pos, e)))
+        self._scanned = pos
+        self._dead = dead
+
+    def _getitem(self, cpv):
+        if cpv in self._pending:
+            payload = self._pending[cpv]
+            if payload is None:
+                raise KeyError(cpv)
+        else:
+            self._load()
+            offset, length = self._index[cpv]
+            payload = self._map[offset:offset + length]
+        try:
+            return self._parse_data(payload.splitlines())
+        except (KeyError, ValueError) as e:
+            raise_from(errors.CacheCorruption(cpv, e))
+
+    def _parse_data(self, data):
+        d = self._cdict_kls()
+        known = self._known_keys
+        for x in data:
+            k, v = x.split("=", 1)
+            if k in known:
+                d[k] = v
+        d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        return d
+
+    def _setitem(self, cpv, values):
+        self._pending[cpv] = ''.join("%s=%s\n" % (k, v)
+            for k, v in values.iteritems())
+
+    def _delitem(self, cpv):
+        if cpv not in self:
+            raise KeyError(cpv)
+        self._pending[cpv] = None
+
+    def __contains__(self, cpv):
+        if cpv in self._pending:
+            return self._pending[cpv] is not None
+        self._load()
+        return cpv in self._index
+
+    def iterkeys(self):
+        self._load()
+        pending = self._pending
+        for cpv in self._index:
+            if cpv not in pending:
+                yield cpv
+        for cpv, payload in pending.iteritems():
+            if payload is not None:
+                yield cpv
+
+    def _lock(self):
+        """open and exclusively lock the cache file, creating it if needed"""
+        if not self._ensure_dirs():
+            raise errors.GeneralCacheCorruption(
+                "failed creating directory %r" % (self.location,))
+        while True:
+            try:
+                f = open(self._path, 'ab')
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                st = os.fstat(f.fileno())
+                try:
+                    current = os.stat(self._path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                    current = None
+            except EnvironmentError as e:
+                raise_from(errors.GeneralCacheCorruption(e))
+            if current is not None and (
+                    (st.st_dev, st.st_ino) == (current.st_dev, current.st_ino)):
+                break
+            # another process compacted the file while we were waiting on
+            # the lock; the inode we hold is orphaned.
+            f.close()
+        if not st.st_size:
+            f.write(self.magic)
+            f.flush()
+            self._ensure_access(self._path)
+        return f
+
+    def commit(self, force=False):
+        if self.readonly or not (self._pending or force):
+            return
+        f = self._lock()
+        try:
+            # pick up anything other writers appended.
+            self._refresh()
+            try:
+                if os.fstat(f.fileno()).st_size > self._scanned:
+                    # a torn record from an interrupted writer; appending
+                    # after it would leave our records unreachable.
+                    f.truncate(self._scanned)
+            except EnvironmentError as e:
+                raise_from(errors.GeneralCacheCorruption(e))
+            data = []
+            for cpv, payload in self._pending.iteritems():
+                if payload is None:
+                    if cpv in self._index:
+                        data.append("%s\t-\n" % (cpv,))
+                else:
+                    data.append("%s\t%i\n%s" % (cpv, len(payload), payload))
+            try:
+                f.write(''.join(data))
+                f.flush()
+            except EnvironmentError as e:
+                raise_from(errors.GeneralCacheCorruption(e))
+            self._pending.clear()
+            self._refresh()
+            self._loaded = True
+            if self._dead and (force or self._dead > len(self._index)):
+                self._compact()
+        finally:
+            f.close()
+
+    def _compact(self):
+        """rewrite the file, dropping superseded records and deletions
+
+        Must be called with the lock held.
+        """
+        m = self._map
+        fp = pjoin(self.location, ".update.%i.%s" % (os.getpid(), self.filename))
+        try:
+            with open(fp, 'wb') as f:
+                f.write(self.magic)
+                for cpv, (offset, length) in self._index.iteritems():
+                    f.write("%s\t%i\n" % (cpv, length))
+                    f.write(m[offset:offset + length])
+            self._ensure_access(fp)
+            os.rename(fp, self._path)
+        except EnvironmentError as e:
+            try:
+                os.remove(fp)
+            except EnvironmentError:
+                pass
+            raise_from(errors.GeneralCacheCorruption(e))
+        self._reset()
+        self._refresh()
+
+
+class md5_cache(database):
+
+    chf_type = 'md5'
+    eclass_chf_types = ('md5',)
+    chf_base = 16
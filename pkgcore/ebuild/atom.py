@@ -678,9 +678,20 @@ class transitive_use_atom(atom):
 
     is_simple = False
 
+    # atom -> (flags varied on, {flag states: evaluated atom})
+    _evaluated = {}
+    _evaluate_cache_size = 10000
+
     def _stripped_use(self):
         return str(self).split("[", 1)[0]
 
+    def _variable_flags(self):
+        """:return: frozenset of the flags the atom's conditional use deps
+        vary on"""
+        flags = (use.lstrip('!')[:-1] for use in self.use if use[-1] in '?=')
+        # strip use defaults, 'x(+)'
+        return frozenset(x[:-3] if x[-1] == ')' else x for x in flags)
+
     @staticmethod
     def _mk_conditional(flag, payload, negate=False):
         return Conditional('use', ContainmentMatch(flag, negate=negate),
@@ -784,6 +795,24 @@ class transitive_use_atom(atom):
             flags.append(real_flag)
 
     def evaluate_conditionals(self, parent_cls, parent_seq, enabled, tristate_filter=None):
+        # atoms are instance cached, thus shared across depsets; memoize the
+        # result on the state of the flags it varies on.
+        evaluated = transitive_use_atom._evaluated
+        entry = evaluated.get(self)
+        if entry is None:
+            if len(evaluated) >= self._evaluate_cache_size:
+                evaluated.clear()
+            entry = evaluated[self] = (self._variable_flags(), {})
+        flags, results = entry
+        key = (frozenset(x for x in flags if x in enabled),
+            None if tristate_filter is None else
+            frozenset(x for x in flags if x in tristate_filter))
+        a = results.get(key)
+        if a is None:
+            a = results[key] = self._evaluate(enabled, tristate_filter)
+        parent_seq.append(a)
+
+    def _evaluate(self, enabled, tristate_filter):
         new_flags = [use for use in self.use if use[-1] not in '?=']
         variable_flags = [use for use in self.use if use[-1] in '?=']
 
@@ -819,11 +848,9 @@ class transitive_use_atom(atom):
                 new_flags.append(flag)
 
         if not new_flags:
-            a = self._nontransitive_use_atom(self._stripped_use())
-        else:
-            a = self._nontransitive_use_atom("%s[%s]" %
-                (self._stripped_use(), ','.join(new_flags)))
-        parent_seq.append(a)
+            return self._nontransitive_use_atom(self._stripped_use())
+        return self._nontransitive_use_atom("%s[%s]" %
+            (self._stripped_use(), ','.join(new_flags)))
 
     iter_dnf_solutions = boolean.AndRestriction.iter_dnf_solutions
     cnf_solutions = boolean.AndRestriction.cnf_solutions
@@ -7,7 +7,7 @@ Turns a DepSet (depends, rdepends, SRC_URI, license, etc) into
 appropriate conditionals.
 """
 
-__all__ = ("DepSet", "stringify_boolean")
+__all__ = ("DepSet", "DepSetCache", "stringify_boolean")
 
 # TODO: move exceptions elsewhere, bind them to a base exception for pkgcore
 
@@ -30,11 +30,14 @@ class DepSet(boolean.AndRestriction):
     gentoo DepSet syntax parser
     """
 
-    __slots__ = ("element_class", "_node_conds", "_known_conditionals")
+    __slots__ = ("element_class", "_node_conds", "_known_conditionals",
+        "_relevant_flags", "_evaluated")
     type = packages.package_type
     negate = False
 
     _evaluate_collapse = True
+    # number of evaluate_depset results memoized per instance
+    _evaluate_cache_size = 32
 
     # do not enable instance caching w/out adjust evaluate_depset!
     __inst_caching__ = False
@@ -49,6 +52,8 @@ class DepSet(boolean.AndRestriction):
         sf(self, 'element_class', element_class)
         sf(self, 'restrictions', restrictions)
         sf(self, '_node_conds', node_conds)
+        sf(self, '_relevant_flags', None)
+        sf(self, '_evaluated', None)
 
     @classmethod
     def parse(cls, dep_str, element_class,
@@ -220,11 +225,48 @@ class DepSet(boolean.AndRestriction):
         if not self.has_conditionals:
             return self
 
+        # the result depends only on the state of the flags the depset
+        # references, so memoize on that.
+        relevant = self._get_relevant_flags()
+        key = (frozenset(x for x in relevant if x in cond_dict),
+            None if tristate_filter is None else
+            frozenset(x for x in relevant if x in tristate_filter))
+        evaluated = self._evaluated
+        if evaluated is None:
+            evaluated = {}
+            object.__setattr__(self, "_evaluated", evaluated)
+        else:
+            result = evaluated.get(key)
+            if result is not None:
+                return result
+
         results = []
         self.evaluate_conditionals(self.__class__, results,
             cond_dict, tristate_filter, force_collapse=True)
 
-        return self.__class__(tuple(results), self.element_class, False)
+        result = self.__class__(tuple(results), self.element_class, False)
+        if len(evaluated) >= self._evaluate_cache_size:
+            evaluated.clear()
+        evaluated[key] = result
+        return result
+
+    def _get_relevant_flags(self):
+        # unlike known_conditionals, transitive use atoms aren't expanded;
+        # that's exponential in the number of flags they vary on.
+        if self._relevant_flags is None:
+            flags = set()
+            nodes = expandable_chain(self.restrictions)
+            for node in nodes:
+                if isinstance(node, packages.Conditional):
+                    flags.update(node.restriction.vals)
+                    nodes.appendleft(node.payload)
+                elif isinstance(node, transitive_use_atom):
+                    flags.update(node._variable_flags())
+                elif (isinstance(node, boolean.base)
+                      and not isinstance(node, atom)):
+                    nodes.appendleft(node.restrictions)
+            object.__setattr__(self, "_relevant_flags", frozenset(flags))
+        return self._relevant_flags
 
     @staticmethod
     def find_cond_nodes(restriction_set, yield_non_conditionals=False):
@@ -311,6 +353,64 @@ class DepSet(boolean.AndRestriction):
         return self.restrictions[key]
 
 
+class DepSetCache(object):
+
+    """
+    bounded cache of parsed DepSets, keyed by the raw string
+
+    Many packages share identical dependency strings; since DepSets are
+    immutable the parsed result can be shared rather than reparsed.  Entries
+    are kept in two generations; once the current one holds max_size
+    entries it becomes the old generation, dropping the prior one.  Entries
+    used from the old generation are moved forward, so frequently used
+    strings survive.
+    """
+
+    def __init__(self, max_size=20000):
+        """
+        :param max_size: number of entries per generation; 0 disables caching
+        """
+        self.max_size = max_size
+        self.hits = self.misses = 0
+        self._current = {}
+        self._old = {}
+
+    def parse(self, settings, dep_str, element_class, **kwds):
+        """
+        :param settings: hashable identifying everything beyond dep_str that
+            determines the result- the EAPI, element_func, operators, etc
+        :return: :obj:`DepSet` instance, as :obj:`DepSet.parse` would
+        """
+        key = (settings, dep_str)
+        val = self._current.get(key)
+        if val is None:
+            val = self._old.pop(key, None)
+            if val is None:
+                self.misses += 1
+                val = DepSet.parse(dep_str, element_class, **kwds)
+            else:
+                self.hits += 1
+            self._store(key, val)
+        else:
+            self.hits += 1
+        return val
+
+    def _store(self, key, val):
+        if not self.max_size:
+            return
+        if len(self._current) >= self.max_size:
+            self._old = self._current
+            self._current = {}
+        self._current[key] = val
+
+    def clear(self):
+        self._current = {}
+        self._old = {}
+
+    def __len__(self):
+        return len(self._current) + len(self._old)
+
+
 def stringify_boolean(node, func=str, domain=None):
     """func is used to stringify the actual content. Useful for fetchables."""
     l = []
@@ -5,7 +5,7 @@
 
 """gentoo ebuild specific base package class"""
 
-__all__ = ("CPV", "versioned_CPV", "unversioned_CPV")
+__all__ = ("CPV", "versioned_CPV", "unversioned_CPV", "ver_key")
 
 from itertools import izip
 from snakeoil.compatibility import cmp
@@ -301,6 +301,51 @@ def native_ver_cmp(ver1, rev1, ver2, rev2):
     # The revision holds the final difference.
     return cmp(rev1, rev2)
 
+# (version, revision) -> ver_key result; versions repeat heavily across
+# packages.
+_ver_keys = {}
+_ver_keys_size = 50000
+
+def ver_key(version, revision):
+    """
+    generate a key ordering versions as :obj:`ver_cmp` does
+
+    Comparing keys is far cheaper than comparing versions, thus this is
+    preferable for sorting and max/min selection.
+
+    :param version: version string, or None for unversioned
+    :param revision: int revision, or None
+    :return: tuple
+    """
+    key = _ver_keys.get((version, revision))
+    if key is None:
+        if len(_ver_keys) >= _ver_keys_size:
+            _ver_keys.clear()
+        key = _ver_keys[(version, revision)] = _mk_ver_key(version, revision)
+    return key
+
+def _mk_ver_key(version, revision):
+    if version is None:
+        return ()
+    parts = version.split("_")
+    ver_parts = parts[0].split(".")
+    letter = -1
+    if ver_parts[-1][-1].isalpha():
+        letter = ord(ver_parts[-1][-1])
+        ver_parts[-1] = ver_parts[-1][:-1]
+    # components with a leading 0 compare as floats, sorting before any
+    # that lack one.
+    ver_parts = tuple((0, x.rstrip("0")) if x[0] == "0" else (1, int(x))
+        for x in ver_parts)
+    suffixes = []
+    for x in parts[1:]:
+        match = suffix_regexp.match(x)
+        suffixes.append((suffix_value[match.group(1)], int("0"+match.group(2))))
+    # running out of suffixes compares as a suffix valued 0.
+    suffixes.append((0,))
+    return (ver_parts, letter, tuple(suffixes), revision or 0)
+
+
 fake_cat = "fake"
 fake_pkg = "pkg"
 def cpy_ver_cmp(ver1, rev1, ver2, rev2):
@@ -349,6 +394,12 @@ def mk_cpv_cls(base_cls):
         # manually.
         __hash__ = base_cls.__hash__
 
+        @property
+        def sort_key(self):
+            """key ordering cpvs as comparing them does"""
+            return (self.category, self.package,
+                ver_key(self.version, self.revision))
+
         @property
         def versioned_atom(self):
             return atom.atom("=%s" % self.cpvstr)
@@ -47,6 +47,7 @@ __ebd_read_line() {
 
 # are we running a version of bash (4.1 or so) that does -N?
 if echo 'y' | read -N 1 &> /dev/null; then
+	__EBD_BULK_READ_SIZE=65536
 	__ebd_read_size()
 	{
 		read -u ${PKGCORE_EBD_READ_FD} -r -N $1 $2
@@ -56,6 +57,7 @@ if echo 'y' | read -N 1 &> /dev/null; then
 	}
 else
 	# fallback to a *icky icky* but working alternative.
+	__EBD_BULK_READ_SIZE=0
 	__ebd_read_size() {
 		eval "${2}=\$(dd bs=1 count=$1 <&${PKGCORE_EBD_READ_FD} 2> /dev/null)"
 		local ret=$?
@@ -68,6 +70,32 @@ __ebd_read_cat_size() {
 	dd bs=$1 count=1 <&${PKGCORE_EBD_READ_FD}
 }
 
+# read a length prefixed payload; see __ebd_read_size.  Under the framed
+# protocol, large payloads are handed off to head, which reads them in blocks
+# without reading past the payload; past a point that's cheaper than
+# bash's own reading, despite the fork.
+__ebd_read_frame() {
+	if ${PKGCORE_EBD_FRAMED:-false} && [[ $1 -gt ${__EBD_BULK_READ_SIZE} ]]; then
+		local __frame ret
+		__frame=$(head -c "$1" <&${PKGCORE_EBD_READ_FD})
+		ret=$?
+		[[ ${ret} -ne 0 ]] && \
+			die "coms error in ${STARTING_PID}, read_frame $@ failed w/ ${ret}: backing out of daemon."
+		printf -v "$2" '%s' "${__frame}"
+		return 0
+	fi
+	__ebd_read_size "$@"
+}
+
+# write a command along with a length prefixed payload: "$1 <bytes>\n$2"
+__ebd_write_frame() {
+	local LC_ALL=C
+	printf '%s %i\n%s' "$1" "${#2}" "$2" >&${PKGCORE_EBD_WRITE_FD}
+	local ret=$?
+	[[ ${ret} -ne 0 ]] && \
+		die "coms error, write_frame failed w/ ${ret}: backing out of daemon."
+}
+
 __ebd_write_line() {
 	echo "$*" >&${PKGCORE_EBD_WRITE_FD}
 	local ret=$?
@@ -79,11 +107,11 @@ __ebd_write_raw() {
 	echo -n "$*" >&${PKGCORE_EBD_WRITE_FD} || die "coms error, __ebd_write_raw failed;  Backing out."
 }
 
-for x in ebd_read_{line,{cat_,}size} __ebd_write_line __set_perf_debug; do
+for x in ebd_read_{line,{cat_,}size} __ebd_{read,write}_frame __ebd_write_line __set_perf_debug; do
 	declare -rf ${x}
 done
 unset x
-declare -r PKGCORE_EBD_WRITE_FD PKGCORE_EBD_READ_FD
+declare -r PKGCORE_EBD_WRITE_FD PKGCORE_EBD_READ_FD __EBD_BULK_READ_SIZE
 
 __ebd_sigint_handler() {
 	EBD_DISABLE_DIEFUNC="yes"
@@ -206,6 +234,7 @@ __ebd_exec_main() {
 	__qa_interceptors_enable
 
 	source "${PKGCORE_BIN_PATH}"/eapi/depend.lib >&2 || die "failed sourcing eapi/depend.lib"
+	PKGCORE_EBD_FRAMED=false
 	__ebd_main_loop
 	exit 0
 }
@@ -254,7 +283,7 @@ __ebd_process_ebuild_phases() {
 						;;
 					bytes*)
 						line=${line#bytes }
-						__ebd_read_size "${line}" line
+						__ebd_read_frame "${line}" line
 						__IFS_push $'\0'
 						eval "${line}"
 						cont=$?
@@ -349,7 +378,7 @@ __ebd_process_metadata() {
 	unset __mode
 	local __data
 	local __ret
-	__ebd_read_size "$1" __data
+	__ebd_read_frame "$1" __data
 	local IFS=$'\0'
 	eval "$__data"
 	__ret=$?
@@ -376,8 +405,23 @@ __make_preloaded_eclass_func() {
 	PKGCORE_PRELOADED_ECLASSES[$1]=__preloaded_eclass_$1
 }
 
+__ebd_fork_processor() {
+	# fork a copy of this daemon for the python side to talk to via the fifos
+	# in the given directory.  The child inherits everything already sourced
+	# and preloaded, so spinning it up costs a fork rather than a full init.
+	(
+		# async subshells ignore SIGINT; restore our handling.
+		trap __ebd_sigint_handler SIGINT
+		eval "exec ${PKGCORE_EBD_READ_FD}<\"\$1\"/in ${PKGCORE_EBD_WRITE_FD}>\"\$1\"/out" || exit 1
+		STARTING_PID=${BASHPID}
+		__ebd_main_loop
+		exit 0
+	) &
+	__ebd_write_line "forked $!"
+}
+
 __ebd_main_loop() {
-	DONT_EXPORT_VARS+=" com phases line cont DONT_EXPORT_FUNCS STARTING_PID"
+	DONT_EXPORT_VARS+=" com phases line cont DONT_EXPORT_FUNCS STARTING_PID PKGCORE_EBD_FRAMED"
 	SANDBOX_ON=1
 	while :; do
 		local com=''
@@ -400,6 +444,29 @@ __ebd_main_loop() {
 			shutdown_daemon)
 				break
 				;;
+			ping\ *)
+				__ebd_write_line "pong ${com#ping }"
+				;;
+			set_protocol\ *)
+				# text is the original newline delimited protocol; framed
+				# batches replies into length prefixed frames.
+				case ${com#set_protocol } in
+					framed)
+						PKGCORE_EBD_FRAMED=true
+						;;
+					text)
+						PKGCORE_EBD_FRAMED=false
+						;;
+					*)
+						__ebd_write_line "protocol unsupported"
+						continue
+						;;
+				esac
+				__ebd_write_line "protocol ${com#set_protocol }"
+				;;
+			fork_processor\ *)
+				__ebd_fork_processor "${com#fork_processor }"
+				;;
 			preload_eclass\ *)
 				success="succeeded"
 				com=${com#preload_eclass }
@@ -423,7 +490,7 @@ __ebd_main_loop() {
 				;;
 			set_metadata_path\ *)
 				line=${com#set_metadata_path }
-				__ebd_read_size "${line}" PKGCORE_METADATA_PATH
+				__ebd_read_frame "${line}" PKGCORE_METADATA_PATH
 				__ebd_write_line "metadata_path_received"
 				;;
 			gen_metadata\ *|gen_ebuild_env\ *)
@@ -19,7 +19,7 @@ from snakeoil.compatibility import raise_from, IGNORED_EXCEPTIONS
 from pkgcore.ebuild.processor import \
     request_ebuild_processor, release_ebuild_processor, \
     expected_ebuild_env, chuck_UnhandledCommand, \
-    inherit_handler
+    inherit_handler, portageq_handler
 from pkgcore.os_data import portage_gid, portage_uid
 from pkgcore.spawn import (
     spawn_bash, spawn, is_sandbox_capable, is_fakeroot_capable,
@@ -294,6 +294,8 @@ class ebd(object):
         extra_handlers = extra_handlers.copy()
         if not suppress_bashrc:
             extra_handlers.setdefault("request_bashrcs", self._request_bashrcs)
+        extra_handlers.setdefault("request_portageq",
+            partial(portageq_handler, self.domain))
         return run_generic_phase(self.pkg, phase, self.env,
             userpriv, sandbox, fakeroot,
             extra_handlers=extra_handlers, failure_allowed=failure_allowed,
@@ -870,9 +872,9 @@ class ebuild_mixin(object):
                     return False
         if 'pretend' not in pkg.mandatory_phases:
             return True
-        commands = None
+        commands = {"request_portageq": partial(portageq_handler, domain)}
         if not pkg.built:
-            commands = {"request_inherit": partial(inherit_handler, self._eclass_cache)}
+            commands["request_inherit"] = partial(inherit_handler, self._eclass_cache)
         env = expected_ebuild_env(pkg)
         tmpdir = normpath(domain._get_tempspace())
         builddir = pjoin(tmpdir, env["CATEGORY"], env["PF"])
@@ -34,6 +34,7 @@ from snakeoil import demandload
 demandload.demandload(globals(),
     "pkgcore.log:logger",
     "pkgcore.ebuild.eapi:get_eapi",
+    "pkgcore.ebuild:processor_driver",
     "snakeoil:data_source,fileutils",
     "snakeoil:chksum",
 )
@@ -43,9 +44,13 @@ demandload.demand_compile_regexp(globals(),
     r"^EAPI=(['\"]?)([A-Za-z0-9+_.-]*)\1[\t ]*(?:#.*)?")
 
 
+# parsed depsets shared across packages; only for those whose parsing
+# depends on nothing beyond the string and the eapi.
+depset_cache = conditionals.DepSetCache()
+
 def generate_depset(c, key, non_package_type, s, **kwds):
     if non_package_type:
-        return conditionals.DepSet.parse(s.data.pop(key, ""), c,
+        return depset_cache.parse((key,), s.data.pop(key, ""), c,
             operators={"||":boolean.OrRestriction,
             "":boolean.AndRestriction}, **kwds)
     eapi_obj = s.eapi_obj
@@ -53,7 +58,8 @@ def generate_depset(c, key, non_package_type, s, **kwds):
         raise metadata_errors.MetadataException(s, "eapi", "unsupported eapi: %s" % eapi_obj.magic)
     kwds['element_func'] = eapi_obj.atom_kls
     kwds['transitive_use_atoms'] = eapi_obj.options.transitive_use_atoms
-    return conditionals.DepSet.parse(s.data.pop(key, ""), c, **kwds)
+    return depset_cache.parse((c, eapi_obj.magic), s.data.pop(key, ""), c,
+        **kwds)
 
 def _mk_required_use_node(data):
     if data[0] == '!':
@@ -72,7 +78,7 @@ def generate_required_use(self):
     if self.eapi_obj.options.required_use_one_of:
         operators['??'] = boolean.AtMostOneOfRestriction
 
-    return conditionals.DepSet.parse(data,
+    return depset_cache.parse(("REQUIRED_USE", self.eapi_obj.magic), data,
         values.ContainmentMatch, operators=operators,
         element_func=_mk_required_use_node,
         )
@@ -217,7 +223,7 @@ class base(metadata.package):
     _get_attr["description"] = lambda s:s.data.pop("DESCRIPTION", "").strip()
     _get_attr["keywords"] = lambda s:tuple(map(intern,
         s.data.pop("KEYWORDS", "").split()))
-    _get_attr["restrict"] = lambda s:conditionals.DepSet.parse(
+    _get_attr["restrict"] = lambda s:depset_cache.parse(("RESTRICT",),
         s.data.pop("RESTRICT", ''), str, operators={},
         element_func=rewrite_restrict)
     _get_attr["eapi_obj"] = get_parsed_eapi
@@ -368,6 +374,51 @@ class package_factory(metadata.factory):
         # no cache entries, regen
         return self._update_metadata(pkg, ebp=ebp)
 
+    def get_stale_metadata(self, pkgs):
+        """Find which of the given packages need their metadata regenerated.
+
+        Validation is done as a batch against each cache, rather than per
+        package via :obj:`_get_metadata`.
+
+        :param pkgs: iterable of package instances from this factory
+        :return: list of packages lacking a valid cache entry
+        """
+        pending = {pkg.cpvstr: pkg for pkg in pkgs}
+        for cache in self._cache:
+            if not pending:
+                break
+            if cache is None:
+                continue
+            hashes = {cpv: chksum.LazilyHashedPath(pkg.path)
+                for cpv, pkg in pending.iteritems()}
+            pending = {cpv: pending[cpv] for cpv in
+                cache.validate_entries(hashes, self._ecache)}
+        return pending.values()
+
+    def get_cached_eclasses(self, pkg):
+        """Find which eclasses a package inherited per its cache entries.
+
+        Entries are used regardless of whether they're stale; this is
+        intended for predicting what regenerating the package will need.
+
+        :return: frozenset of eclass names, empty if there is no entry
+        """
+        for cache in self._cache:
+            if cache is None:
+                continue
+            try:
+                data = cache[pkg.cpvstr]
+            except (KeyError, cache_errors.CacheError):
+                continue
+            eclasses = data.get('_eclasses_')
+            if eclasses is None:
+                return frozenset(data.get('INHERITED', '').split())
+            elif isinstance(eclasses, dict):
+                return frozenset(eclasses)
+            # unvalidated entries are a sequence of (name, chksums) pairs.
+            return frozenset(x[0] for x in eclasses)
+        return frozenset()
+
     def _update_metadata(self, pkg, ebp=None):
         parsed_eapi = pkg.eapi_obj
         if not parsed_eapi.is_supported:
@@ -375,7 +426,33 @@ class package_factory(metadata.factory):
 
         with processor.reuse_or_request(ebp) as my_proc:
             mydata = my_proc.get_keys(pkg, self._ecache)
+        return self._store_metadata(pkg, mydata)
 
+    def _start_metadata_update(self, pkg, ebp, driver, finish=None):
+        """Start regenerating a package's metadata via a processor driver.
+
+        :param ebp: processor to use, driven by driver
+        :param driver: :obj:`pkgcore.ebuild.processor_driver.ProcessorDriver`
+            instance
+        :param finish: if not None, callable the metadata is passed through
+        :return: :obj:`pkgcore.ebuild.processor_driver.ProcessorRequest`
+            whose result is the metadata, as :obj:`_update_metadata` returns
+        """
+        parsed_eapi = pkg.eapi_obj
+        if not parsed_eapi.is_supported:
+            mydata = {'EAPI':parsed_eapi.magic}
+            if finish is not None:
+                mydata = finish(mydata)
+            return processor_driver.ProcessorRequest.finished(mydata)
+
+        store = partial(self._store_metadata, pkg)
+        if finish is not None:
+            store = lambda mydata: finish(self._store_metadata(pkg, mydata))
+        return driver.get_keys(ebp, pkg, self._ecache, finish=store)
+
+    def _store_metadata(self, pkg, mydata):
+        """process freshly generated keys, updating the caches"""
+        parsed_eapi = pkg.eapi_obj
         inherited = mydata.pop("INHERITED", None)
         # rewrite defined_phases as needed, since we now know the eapi.
         eapi = get_eapi(mydata["EAPI"])
@@ -0,0 +1,125 @@
+# License: GPL2/BSD
+
+"""
+persistent eclass -> consuming packages index
+
+Built from the metadata cache's eclass data; used to find which packages
+need regeneration when a set of eclasses changed without validating every
+package in the repository.
+"""
+
+__all__ = ("EclassIndex",)
+
+import os
+import threading
+
+from pkgcore.os_data import portage_gid
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'errno',
+    'pkgcore.log:logger',
+)
+
+
+class EclassIndex(object):
+
+    """
+    mapping of cpv -> eclasses inherited, and its inverse
+
+    Unlike the cache it's derived from, entries aren't validated; it's
+    kept current by updating it whenever packages are regenerated.
+    """
+
+    magic = 'pkgcore eclass index 1'
+
+    def __init__(self, location=None):
+        """
+        :param location: file path to persist the index in; if None, it's
+            kept only in memory
+        """
+        self.location = location
+        self.exists = False
+        self._data = {}
+        self._consumers = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        if location is not None:
+            self._read()
+
+    def _read(self):
+        try:
+            with open(self.location, 'r') as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    return
+                for line in f:
+                    line = line.split()
+                    if line:
+                        self._data[line[0]] = frozenset(line[1:])
+            self.exists = True
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading eclass index %r: %s",
+                    self.location, e)
+
+    def _get_consumers(self):
+        # built on first use; updates are applied to it from then on.
+        if self._consumers is None:
+            d = {}
+            for cpv, eclasses in self._data.iteritems():
+                for eclass in eclasses:
+                    d.setdefault(eclass, set()).add(cpv)
+            self._consumers = d
+        return self._consumers
+
+    def update(self, cpv, eclasses):
+        """
+        :param cpv: cpvstr of the package
+        :param eclasses: eclass names the package inherits
+        """
+        eclasses = frozenset(eclasses)
+        with self._lock:
+            old = self._data.get(cpv)
+            if old == eclasses:
+                return
+            self._data[cpv] = eclasses
+            self._dirty = True
+            consumers = self._consumers
+            if consumers is not None:
+                for eclass in old or ():
+                    consumers[eclass].discard(cpv)
+                for eclass in eclasses:
+                    consumers.setdefault(eclass, set()).add(cpv)
+
+    def consumers(self, eclass):
+        """:return: frozenset of cpvstrs inheriting the eclass"""
+        return frozenset(self._get_consumers().get(eclass, ()))
+
+    def __contains__(self, cpv):
+        return cpv in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def commit(self):
+        """write the index out if it was modified"""
+        if self.location is None or not self._dirty:
+            return
+        self._dirty = False
+        f = None
+        try:
+            if not ensure_dirs(os.path.dirname(self.location),
+                               gid=portage_gid, mode=0775):
+                return
+            f = AtomicWriteFile(self.location, gid=portage_gid, perms=0664)
+            f.write("%s\n" % (self.magic,))
+            for cpv, eclasses in sorted(self._data.iteritems()):
+                f.write("%s\n" % (' '.join((cpv,) + tuple(sorted(eclasses))),))
+            f.close()
+            self.exists = True
+        except EnvironmentError as e:
+            if f is not None:
+                f.discard()
+            logger.warning("unable to update eclass index %r: %s",
+                self.location, e)
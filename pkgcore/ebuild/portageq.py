@@ -43,14 +43,23 @@ def make_atom(value):
         100)
 
 def _render_atom(value, namespace, attr):
-    a = namespace.atom_kls(value)
+    setattr(namespace, attr, parse_atom(value, namespace.atom_kls,
+        getattr(namespace, 'use', ())))
+
+def parse_atom(value, atom_kls=None, use=()):
+    """
+    parse an atom, rendering transitive use deps against the given use flags
+    """
+    if atom_kls is None:
+        atom_kls = atom.atom
+    a = atom_kls(value)
     if isinstance(a, atom.transitive_use_atom):
         a.restrictions
         # XXX bit of a hack.
         a = conditionals.DepSet(a.restrictions, atom.atom, True)
-        a = a.evaluate_depset(getattr(namespace, 'use', ()))
+        a = a.evaluate_depset(use)
         a = AndRestriction(*a.restrictions)
-    setattr(namespace, attr, a)
+    return a
 
 
 class BaseCommand(commandline.ArgparseCommand):
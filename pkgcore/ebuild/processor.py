@@ -20,7 +20,8 @@ design) reduces regen time by over 40% compared to portage-2.1
 
 
 __all__ = (
-    "request_ebuild_processor", "release_ebuild_processor", "EbuildProcessor",
+    "request_ebuild_processor", "release_ebuild_processor",
+    "recycle_ebuild_processor", "ProcessorPool", "EbuildProcessor",
     "UnhandledCommand", "expected_ebuild_env")
 
 try:
@@ -36,13 +37,14 @@ except ImportError:
         pass
 
 
-inactive_ebp_list = []
-active_ebp_list = []
-
 import contextlib
 import errno
+import fcntl
 import os
+import shutil
 import signal
+import tempfile
+import time
 
 import pkgcore.spawn
 from pkgcore import const, os_data
@@ -55,6 +57,8 @@ from snakeoil.weakrefs import WeakRefFinalizer
 from snakeoil.demandload import demandload
 demandload(globals(),
     'pkgcore.log:logger',
+    'pkgcore.ebuild:eapi,portageq',
+    'pkgcore.ebuild:errors@ebuild_errors',
     'snakeoil:fileutils',
     'traceback',
 )
@@ -71,29 +75,227 @@ def _single_thread_allowed(functor):
     pretty_docs(_inner, name=functor.__name__)
     return _inner
 
+class ProcessorPool(object):
+
+    """
+    pool of ebuild processors, reused across requests
+
+    Idle processors are kept for reuse- up to max_size of them- and checked
+    for health before being handed back out.  Processors accumulate state
+    (preloaded eclasses fex) as they're used, thus after max_jobs requests
+    a processor is recycled: shut down, and replaced by a fresh one.  Idle
+    processors unused for max_idle_time seconds are reaped, down to
+    min_size of them.
+
+    Counters of the pool's activity are available via :obj:`stats`.
+
+    Access isn't serialized; the module level functions do so for
+    :obj:`default_pool`.
+    """
+
+    def __init__(self, min_size=0, max_size=None, max_jobs=None,
+                 max_idle_time=None, health_checks=True):
+        """
+        :param min_size: number of idle processors reaping leaves in place
+        :param max_size: if not None, max number of idle processors kept
+        :param max_jobs: if not None, number of requests a processor serves
+            before it's recycled
+        :param max_idle_time: if not None, seconds an idle processor is
+            kept for
+        :param health_checks: if True, idle processors are pinged before
+            reuse, discarding those not responding properly
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_jobs = max_jobs
+        self.max_idle_time = max_idle_time
+        self.health_checks = health_checks
+        self.inactive = []
+        self.active = []
+        # (userpriv, sandbox) -> processor new processors are forked from
+        self.zygotes = {}
+        self._counters = dict.fromkeys(("spawned", "forked", "reused",
+            "recycled", "reaped", "unhealthy", "acquired"), 0)
+        self._acquire_time = 0.0
+
+    def configure(self, **kwds):
+        """adjust the pool's settings; see :obj:`ProcessorPool`"""
+        for key, val in kwds.iteritems():
+            if key not in ("min_size", "max_size", "max_jobs",
+                           "max_idle_time", "health_checks"):
+                raise TypeError("unknown pool setting %r" % (key,))
+            setattr(self, key, val)
+
+    def stats(self):
+        """
+        :return: dict of counters- processors spawned, forked (from a
+            zygote), reused, recycled, reaped, discarded as unhealthy, and
+            acquired- along with the processors active and idle, and the
+            average time in seconds an acquisition took
+        """
+        d = dict(self._counters)
+        d["active"] = len(self.active)
+        d["idle"] = len(self.inactive)
+        d["avg_acquire_time"] = 0.0
+        if d["acquired"]:
+            d["avg_acquire_time"] = self._acquire_time / d["acquired"]
+        return d
+
+    def report(self, observer):
+        """write the pool's stats to an observer"""
+        observer.info("ebuild processors: %(spawned)i spawned, %(forked)i "
+            "forked, %(reused)i reused, %(recycled)i recycled, %(reaped)i "
+            "reaped, %(unhealthy)i unhealthy; average acquire time "
+            "%(avg_acquire_time).4fs", **self.stats())
+
+    def request(self, userpriv=False, sandbox=None, fakeroot=False,
+                save_file=None, zygote=False, eclass_cache=None):
+        """see :obj:`request_ebuild_processor`"""
+        start = time.time()
+        if sandbox is None:
+            sandbox = pkgcore.spawn.is_sandbox_capable()
+        self.reap_idle(start)
+
+        e = None
+        if not fakeroot:
+            # most recently used first, leaving the rest to age out.
+            for x in reversed(self.inactive):
+                if x.userprived() == userpriv and (x.sandboxed() or not sandbox):
+                    self.inactive.remove(x)
+                    if not x.is_alive:
+                        continue
+                    if self.health_checks and not x.ping():
+                        self._counters["unhealthy"] += 1
+                        self._shutdown(x)
+                        continue
+                    self._counters["reused"] += 1
+                    e = x
+                    break
+
+        if e is None:
+            if zygote and not fakeroot:
+                e = self._get_zygote(userpriv, sandbox,
+                    eclass_cache).fork_processor()
+                self._counters["forked"] += 1
+            else:
+                e = EbuildProcessor(userpriv, sandbox, fakeroot, save_file)
+                self._counters["spawned"] += 1
+            e._pool_args = dict(userpriv=userpriv, sandbox=sandbox,
+                fakeroot=fakeroot, save_file=save_file, zygote=zygote,
+                eclass_cache=eclass_cache)
+        self.active.append(e)
+        self._counters["acquired"] += 1
+        self._acquire_time += time.time() - start
+        return e
+
+    def _get_zygote(self, userpriv, sandbox, eclass_cache=None):
+        key = (userpriv, sandbox)
+        zygote = self.zygotes.get(key)
+        if zygote is None or not zygote.is_alive:
+            zygote = self.zygotes[key] = EbuildProcessor(
+                userpriv, sandbox, False, None)
+            self._counters["spawned"] += 1
+        if eclass_cache is not None:
+            # already preloaded eclasses are skipped, thus this is cheap
+            # after the first request.
+            zygote.preload_eclasses(eclass_cache)
+        return zygote
+
+    def _worn_out(self, ebp):
+        return self.max_jobs is not None and ebp.jobs >= self.max_jobs
+
+    def release(self, ebp):
+        """see :obj:`release_ebuild_processor`"""
+        try:
+            self.active.remove(ebp)
+        except ValueError:
+            return False
+
+        assert ebp not in self.inactive
+        # if it's a fakeroot'd process, we throw it away.
+        # it's not useful outside of a chain of calls
+        if ebp.onetime() or ebp.locked:
+            # ok, so the thing is not reusable either way.
+            ebp.shutdown_processor()
+        elif self._worn_out(ebp):
+            self._counters["recycled"] += 1
+            ebp.shutdown_processor()
+        elif self.max_size is not None and len(self.inactive) >= self.max_size:
+            ebp.shutdown_processor()
+        else:
+            ebp._idle_since = time.time()
+            self.inactive.append(ebp)
+        self.reap_idle()
+        return True
+
+    def recycle(self, ebp):
+        """see :obj:`recycle_ebuild_processor`"""
+        if not self._worn_out(ebp) or ebp not in self.active:
+            return ebp
+        self.active.remove(ebp)
+        self._counters["recycled"] += 1
+        self._shutdown(ebp)
+        return self.request(**ebp._pool_args)
+
+    def reap_idle(self, now=None):
+        """
+        shut down processors idle for longer than max_idle_time
+
+        :return: number of processors reaped
+        """
+        if self.max_idle_time is None:
+            return 0
+        if now is None:
+            now = time.time()
+        count = 0
+        # released processors are appended, thus oldest first.
+        while len(self.inactive) > self.min_size and \
+                now - self.inactive[0]._idle_since > self.max_idle_time:
+            self._shutdown(self.inactive.pop(0))
+            count += 1
+        self._counters["reaped"] += count
+        return count
+
+    @staticmethod
+    def _shutdown(ebp):
+        try:
+            ebp.shutdown_processor(ignore_keyboard_interrupt=True)
+        except EnvironmentError:
+            pass
+
+    def forget(self):
+        """drop all processors without shutting them down; for use after
+        forking, where they belong to the parent"""
+        self.active[:] = []
+        self.inactive[:] = []
+        self.zygotes.clear()
+
+    def shutdown(self):
+        """kill off all known processors"""
+        while self.active:
+            self._shutdown(self.active.pop())
+        while self.inactive:
+            self._shutdown(self.inactive.pop())
+        while self.zygotes:
+            self._shutdown(self.zygotes.popitem()[1])
+
+
+default_pool = ProcessorPool()
+inactive_ebp_list = default_pool.inactive
+active_ebp_list = default_pool.active
+zygote_ebps = default_pool.zygotes
+
+
 @_single_thread_allowed
 def forget_all_processors():
-    active_ebp_list[:] = []
-    inactive_ebp_list[:] = []
+    default_pool.forget()
 
 
 @_single_thread_allowed
 def shutdown_all_processors():
     """kill off all known processors"""
     try:
-        while active_ebp_list:
-            try:
-                active_ebp_list.pop().shutdown_processor(
-                    ignore_keyboard_interrupt=True)
-            except EnvironmentError:
-                pass
-
-        while inactive_ebp_list:
-            try:
-                inactive_ebp_list.pop().shutdown_processor(
-                    ignore_keyboard_interrupt=True)
-            except EnvironmentError:
-                pass
+        default_pool.shutdown()
     except Exception as e:
         traceback.print_exc()
         print e
@@ -103,9 +305,10 @@ pkgcore.spawn.atexit_register(shutdown_all_processors)
 
 @_single_thread_allowed
 def request_ebuild_processor(userpriv=False, sandbox=None, fakeroot=False,
-                             save_file=None):
+                             save_file=None, zygote=False, eclass_cache=None):
     """
-    request an ebuild_processor instance, creating a new one if needed.
+    request an ebuild_processor instance from :obj:`default_pool`, creating
+    a new one if needed.
 
     Note that fakeroot processes are B{never} reused due to the fact
     the fakeroot env becomes localized to the pkg it's handling.
@@ -117,24 +320,17 @@ def request_ebuild_processor(userpriv=False, sandbox=None, fakeroot=False,
     :param fakeroot: should the processor be fakerooted?  This option is
         mutually exclusive to sandbox, and requires save_file to be set.
     :param save_file: location to store fakeroot state dumps
+    :param zygote: if a new processor is needed, fork it from a long lived
+        zygote processor rather than spawning a new daemon.  Useful when
+        many processors are needed at once, for example for threaded regen.
+        Ignored for fakeroot.
+    :param eclass_cache: if zygote is enabled, the
+        :obj:`pkgcore.ebuild.eclass_cache` instance whose eclasses are
+        preloaded into the zygote, thus into every processor forked from it
     """
-
-    if sandbox is None:
-        sandbox = pkgcore.spawn.is_sandbox_capable()
-
-    if not fakeroot:
-        for x in inactive_ebp_list:
-            if x.userprived() == userpriv and (x.sandboxed() or not sandbox):
-                if not x.is_alive:
-                    inactive_ebp_list.remove(x)
-                    continue
-                inactive_ebp_list.remove(x)
-                active_ebp_list.append(x)
-                return x
-
-    e = EbuildProcessor(userpriv, sandbox, fakeroot, save_file)
-    active_ebp_list.append(e)
-    return e
+    return default_pool.request(userpriv=userpriv, sandbox=sandbox,
+        fakeroot=fakeroot, save_file=save_file, zygote=zygote,
+        eclass_cache=eclass_cache)
 
 @_single_thread_allowed
 def release_ebuild_processor(ebp):
@@ -151,21 +347,22 @@ def release_ebuild_processor(ebp):
         If a processor isn't known as active, this means either calling
         error or an internal error.
     """
+    return default_pool.release(ebp)
 
-    try:
-        active_ebp_list.remove(ebp)
-    except ValueError:
-        return False
+@_single_thread_allowed
+def recycle_ebuild_processor(ebp):
+    """
+    replace a held processor with a fresh one if it's served the pool's
+    max_jobs requests.
 
-    assert ebp not in inactive_ebp_list
-    # if it's a fakeroot'd process, we throw it away.
-    # it's not useful outside of a chain of calls
-    if ebp.onetime() or ebp.locked:
-        # ok, so the thing is not reusable either way.
-        ebp.shutdown_processor()
-    else:
-        inactive_ebp_list.append(ebp)
-    return True
+    For consumers holding a processor across many requests (regen fex);
+    the replacement is requested with the same settings, but any state
+    set up on the processor since (eclass caching fex) must be redone.
+
+    :param ebp: active :obj:`EbuildProcessor` instance
+    :return: the processor to continue with; ebp if it wasn't recycled
+    """
+    return default_pool.recycle(ebp)
 
 
 @contextlib.contextmanager
@@ -237,7 +434,7 @@ class EbuildProcessor(object):
 
     __metaclass__ = WeakRefFinalizer
 
-    def __init__(self, userpriv, sandbox, fakeroot, save_file):
+    def __init__(self, userpriv, sandbox, fakeroot, save_file, zygote=None):
         """
         :param sandbox: enables a sandboxed processor
         :param userpriv: enables a userpriv'd processor
@@ -245,16 +442,38 @@ class EbuildProcessor(object):
             this is a mutually exclusive option to sandbox, and
             requires userpriv to be enabled. Violating this will
             result in nastiness.
+        :param zygote: if given, an :obj:`EbuildProcessor` to fork this
+            processor from rather than spawning a new daemon; see
+            :obj:`fork_processor`
+
+        The framed protocol is used for coms when the daemon supports it,
+        unless PKGCORE_EBD_PROTOCOL=text is set in the environment; the
+        chosen protocol is exposed via the framed attribute.
         """
 
         self.lock()
         self.ebd = e_const.EBUILD_DAEMON_PATH
-        spawn_opts = {'umask':0002}
 
         self._preloaded_eclasses = {}
         self._eclass_caching = False
         self._outstanding_expects = []
         self._metadata_paths = None
+        self.framed = False
+        # requests served; see ProcessorPool.max_jobs
+        self.jobs = 0
+        self._pings = 0
+
+        if zygote is None:
+            self._spawn(userpriv, sandbox, fakeroot, save_file)
+            if os.environ.get("PKGCORE_EBD_PROTOCOL", "framed") != "text":
+                self._set_protocol("framed")
+        else:
+            self._fork(zygote)
+        # locking isn't used much, but w/ threading this will matter
+        self.unlock()
+
+    def _spawn(self, userpriv, sandbox, fakeroot, save_file):
+        spawn_opts = {'umask':0002}
 
         if fakeroot and (sandbox or not userpriv):
             traceback.print_stack()
@@ -343,8 +562,100 @@ class EbuildProcessor(object):
             self.write("sandbox_log?")
             self.__sandbox_log = self.read().split()[0]
         self.dont_export_vars = self.read().split()
-        # locking isn't used much, but w/ threading this will matter
-        self.unlock()
+
+    def _fork(self, zygote):
+        self.__userpriv = zygote.__userpriv
+        self.__sandbox = zygote.__sandbox
+        self.__fakeroot = False
+        if self.__sandbox:
+            self.__sandbox_log = zygote.__sandbox_log
+        self.dont_export_vars = zygote.dont_export_vars
+        self.framed = zygote.framed
+        self._preloaded_eclasses = zygote._preloaded_eclasses.copy()
+        self._metadata_paths = zygote._metadata_paths
+
+        if zygote._outstanding_expects and not zygote._consume_async_expects():
+            raise InitializationError("zygote coms are out of alignment")
+
+        # the child is the zygote's, not ours, thus we can't hand it pipes;
+        # it opens its end of a pair of fifos instead.
+        tmpdir = tempfile.mkdtemp(prefix='pkgcore-ebd-')
+        try:
+            fifos = [pjoin(tmpdir, x) for x in ("in", "out")]
+            for path in fifos:
+                os.mkfifo(path, 0600)
+            if self.__userpriv:
+                for path in [tmpdir] + fifos:
+                    os.chown(path, os_data.portage_uid, os_data.portage_gid)
+
+            zygote.write("fork_processor %s" % (tmpdir,))
+            line = zygote.read().split()
+            if len(line) != 2 or line[0] != "forked" or not line[1].isdigit():
+                raise InitializationError(
+                    "expected 'forked' response from the zygote, got %r" %
+                    (' '.join(line),))
+            self.pid = int(line[1])
+            # order matters; the child opens 'in' first.
+            self.ebd_write = os.fdopen(self._open_fifo(fifos[0]), "w")
+            self.ebd_read = open(fifos[1], "r")
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _open_fifo(self, path):
+        # opened nonblocking, so that if the child dies before opening its
+        # end we notice rather than waiting forever.
+        while True:
+            try:
+                fd = os.open(path, os.O_WRONLY|os.O_NONBLOCK)
+                break
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            if not self.is_alive:
+                raise InitializationError(
+                    "forked processor died during initialization")
+            time.sleep(0.001)
+        fcntl.fcntl(fd, fcntl.F_SETFL,
+            fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+        return fd
+
+    def _set_protocol(self, protocol):
+        """
+        switch the daemon to the given coms protocol
+
+        Under the default text protocol, most replies are newline delimited
+        lines; under the framed protocol, multiline replies (metadata keys
+        fex) are batched into a single length prefixed frame, and large
+        frames sent to the daemon are read in bulk rather than per byte.
+        If the daemon doesn't support the protocol, text is kept.
+
+        :return: boolean, True if the protocol is now in use
+        """
+        self.write("set_protocol %s" % (protocol,))
+        line = self.read().rstrip('\n')
+        if line == "protocol %s" % (protocol,):
+            self.framed = (protocol == "framed")
+            return True
+        if line != "protocol unsupported":
+            raise InitializationError(
+                "expected 'protocol' response from ebd, got %r" % (line,))
+        return False
+
+    def fork_processor(self):
+        """
+        fork a new processor off of this one.
+
+        The new processor starts as a copy of this daemon- libraries
+        sourced, eclasses preloaded- thus getting one costs a fork rather
+        than a full daemon initialization.  It shares this processor's
+        userpriv and sandbox settings; fakeroot'd processors can't be used.
+
+        :return: :obj:`EbuildProcessor` instance
+        """
+        if self.__fakeroot:
+            raise InitializationError("fakeroot'd processors can't be forked")
+        return self.__class__(self.__userpriv, self.__sandbox, False, None,
+            zygote=self)
 
     def run_phase(self, phase, env, tmpdir, logging=None,
                   additional_commands=None, sandbox=True):
@@ -364,6 +675,7 @@ class EbuildProcessor(object):
         :return: True for success, False for everything else
         """
 
+        self.jobs += 1
         self.write("process_ebuild %s" % phase)
         if not self.send_env(env, tmpdir=tmpdir):
             return False
@@ -415,6 +727,26 @@ class EbuildProcessor(object):
                 raise RuntimeError(ie)
             raise
 
+    def write_frame(self, command, data, flush=True):
+        """send a command along with a length prefixed payload.
+
+        :param command: command (and any args) the payload is for
+        :param data: string payload
+        """
+        self.write("%s %i\n%s" % (command, len(data), data), flush=flush,
+            append_newline=False)
+
+    def read_frame(self, size):
+        """read the payload of a frame sent by the daemon.
+
+        :param size: string length from the frame header
+        :return: the payload
+        """
+        size = size.strip()
+        if not size.isdigit():
+            raise InternalError(size, "frame size wasn't an integer")
+        return self.ebd_read.read(int(size))
+
     def _consume_async_expects(self):
         if any(x[0] for x in self._outstanding_expects):
             self.ebd_write.flush()
@@ -496,10 +828,26 @@ class EbuildProcessor(object):
             print "exception caught when cleansing sandbox_log=%s" % str(e)
         return 1
 
+    def ping(self):
+        """
+        check the daemon is alive and its coms are in sync
+
+        :return: boolean, True if the daemon responded as expected
+        """
+        if not self.is_alive:
+            return False
+        try:
+            # a unique token, so stale replies aren't mistaken for ours.
+            self._pings += 1
+            self.write("ping %i" % (self._pings,))
+            return self.expect("pong %i" % (self._pings,), flush=True)
+        except (EnvironmentError, RuntimeError):
+            return False
+
     def clear_preloaded_eclasses(self):
         if self.is_alive:
             self.write("clear_preloaded_eclasses")
-            if not self.expect("clear_preload_eclasses succeeded", flush=True):
+            if not self.expect("clear_preloaded_eclasses succeeded", flush=True):
                 self.shutdown_processor()
                 return False
         self._preloaded_eclasses.clear()
@@ -613,6 +961,11 @@ class EbuildProcessor(object):
         except KeyboardInterrupt:
             if not ignore_keyboard_interrupt:
                 raise
+        except OSError as e:
+            # forked processors are children of their zygote, not of us;
+            # it reaps them.
+            if e.errno != errno.ECHILD:
+                raise
 
         # currently, this assumes all went well.
         # which isn't always true.
@@ -628,7 +981,13 @@ class EbuildProcessor(object):
         else:
             self.write("set_sandbox_state 0")
 
-    def _generate_env_str(self, env_dict):
+    def serialize_env(self, env_dict):
+        """
+        serialize an env for transfer to the daemon
+
+        The result can be passed to :obj:`send_env` in place of the mapping,
+        thus an env sent repeatedly need only be serialized once.
+        """
         data = []
         for key, val in env_dict.iteritems():
             if key in self.dont_export_vars:
@@ -636,7 +995,7 @@ class EbuildProcessor(object):
             if not key[0].isalpha():
                 raise KeyError("%s: bash doesn't allow digits as the first char" % (key,))
             if not isinstance(val, basestring):
-                raise ValueError("_generate_env_str was fed a bad value; key=%s, val=%s"
+                raise ValueError("serialize_env was fed a bad value; key=%s, val=%s"
                     % (key, val))
             if val.isalnum():
                 data.append("%s=%s" % (key, val))
@@ -650,10 +1009,14 @@ class EbuildProcessor(object):
         """
         transfer the ebuild's desired env (env_dict) to the running daemon
 
-        :type env_dict: mapping with string keys and values.
+        :type env_dict: mapping with string keys and values, or a string
+            from :obj:`serialize_env`.
         :param env_dict: the bash env.
         """
-        data = self._generate_env_str(env_dict)
+        if isinstance(env_dict, basestring):
+            data = env_dict
+        else:
+            data = self.serialize_env(env_dict)
         old_umask = os.umask(0002)
         if tmpdir:
             path = pjoin(tmpdir, 'ebd-env-transfer')
@@ -661,8 +1024,7 @@ class EbuildProcessor(object):
             self.write("start_receiving_env file %s\n" % (path,),
                 append_newline=False)
         else:
-            self.write("start_receiving_env bytes %i\n%s" %
-                (len(data), data), append_newline=False)
+            self.write_frame("start_receiving_env bytes", data, flush=False)
         os.umask(old_umask)
         return self.expect("env_received", async=async, flush=True)
 
@@ -694,33 +1056,99 @@ class EbuildProcessor(object):
         # filter here, so that a screwy default doesn't result in resetting it
         # every time.
         data = ':'.join(filter(None, paths))
-        self.write("set_metadata_path %i\n%s" % (len(data), data),
-            append_newline=False)
+        self.write_frame("set_metadata_path", data, flush=False)
         if self.expect("metadata_path_received", flush=True):
             self._metadata_paths = paths
 
-    def _run_depend_like_phase(self, command, package_inst, eclass_cache,
-                               extra_commands={}):
+    def _start_depend_like_phase(self, command, package_inst, eclass_cache,
+                                 extra_commands={}):
+        """
+        send a depend-like request to the daemon
+
+        :return: (handlers, finish) tuple; the handlers are for
+            :obj:`generic_handler`, finish is to be invoked with what it
+            returns
+        """
+        self.jobs += 1
         self._ensure_metadata_paths(const.HOST_NONROOT_PATHS)
 
         e = expected_ebuild_env(package_inst, depends=True)
-        data = self._generate_env_str(e)
-        self.write("%s %i\n%s" % (command, len(data), data),
-            append_newline=False)
+        self.write_frame(command, self.serialize_env(e))
 
         updates = None
         if self._eclass_caching:
             updates = set()
         commands = extra_commands.copy()
         commands["request_inherit"] = partial(inherit_handler, eclass_cache, updates=updates)
-        val = self.generic_handler(additional_commands=commands)
 
-        if not val:
-            logger.error("returned val from %s was '%s'" % (command, str(val)))
-            raise Exception(val)
+        def finish(val):
+            if not val:
+                logger.error("returned val from %s was '%s'" % (command, str(val)))
+                raise Exception(val)
+
+            if updates:
+                self.preload_eclasses(eclass_cache, limited_to=updates, async=True)
+        return commands, finish
+
+    def _request_ebuild_environment(self, package_inst, eclass_cache):
+        environ = []
+        def receive_env(self, line):
+            if environ:
+                raise InternalError(line, "receive_env was invoked twice.")
+            line = line.strip()
+            if not line:
+                raise InternalError(line, "During env receive, ebd didn't give us a size.")
+            # This is a raw transfer, for obvious reasons.
+            environ.append(self.read_frame(line))
+
+        commands, finish = self._start_depend_like_phase('gen_ebuild_env',
+            package_inst, eclass_cache, {'receive_env': receive_env})
+
+        def _finish(val):
+            finish(val)
+            if not environ:
+                raise InternalError(None, "receive_env was never invoked.")
+            # Dump any leading/trailing spaces.
+            return environ[0].strip()
+        return commands, _finish
+
+    def _request_keys(self, package_inst, eclass_cache):
+        metadata_keys = {}
+        def receive_key(self, line):
+            line = line.split("=", 1)
+            if len(line) != 2:
+                raise FinishedProcessing(True)
+            metadata_keys[line[0]] = line[1]
+
+        def receive_keys(self, line):
+            # framed protocol; all keys in one go.
+            for key in self.read_frame(line).split("\n"):
+                receive_key(self, key)
 
-        if updates:
-            self.preload_eclasses(eclass_cache, limited_to=updates, async=True)
+        commands, finish = self._start_depend_like_phase('gen_metadata',
+            package_inst, eclass_cache, {"key": receive_key, "keys": receive_keys})
+
+        def _finish(val):
+            finish(val)
+            return metadata_keys
+        return commands, _finish
+
+    def _request_phase(self, phase, env, tmpdir, logging=None,
+                       additional_commands=None, sandbox=True):
+        """
+        :obj:`run_phase` variant that doesn't wait on the daemon's
+        acknowledgements; they're left as outstanding expects.
+        """
+        self.jobs += 1
+        self.write("process_ebuild %s" % phase)
+        self.send_env(env, tmpdir=tmpdir, async=True)
+        if sandbox:
+            self.set_sandbox_state(sandbox)
+        if logging:
+            self.write("logging %s" % logging)
+            self.expect("logging_ack", async=True)
+        self.write("start_processing")
+        return additional_commands, lambda val: val
 
     def get_ebuild_environment(self, package_inst, eclass_cache):
         """Request a dump of the ebuild environ for a package.
@@ -733,25 +1161,9 @@ class EbuildProcessor(object):
             for eclass access
         :return: string of the ebuild environment.
         """
-
-        environ = []
-        def receive_env(self, line):
-            if environ:
-                raise InternalError(line, "receive_env was invoked twice.")
-            line = line.strip()
-            if not line:
-                raise InternalError(line, "During env receive, ebd didn't give us a size.")
-            elif not line.isdigit():
-                raise InternalError(line, "Returned size wasn't an integer")
-            # This is a raw transfer, for obvious reasons.
-            environ.append(self.ebd_read.read(int(line)))
-
-        self._run_depend_like_phase('gen_ebuild_env', package_inst, eclass_cache,
-                                    {'receive_env': receive_env})
-        if not environ:
-            raise InternalError(None, "receive_env was never invoked.")
-        # Dump any leading/trailing spaces.
-        return environ[0].strip()
+        commands, finish = self._request_ebuild_environment(package_inst,
+            eclass_cache)
+        return finish(self.generic_handler(additional_commands=commands))
 
     def get_keys(self, package_inst, eclass_cache):
         """
@@ -763,17 +1175,8 @@ class EbuildProcessor(object):
             for eclass access
         :return: dict when successful, None when failed
         """
-        metadata_keys = {}
-        def receive_key(self, line):
-            line = line.split("=", 1)
-            if len(line) != 2:
-                raise FinishedProcessing(True)
-            metadata_keys[line[0]] = line[1]
-
-        self._run_depend_like_phase('gen_metadata', package_inst, eclass_cache,
-                                    {"key": receive_key})
-
-        return metadata_keys
+        commands, finish = self._request_keys(package_inst, eclass_cache)
+        return finish(self.generic_handler(additional_commands=commands))
 
     # this basically handles all hijacks from the daemon, whether
     # confcache or portageq.
@@ -791,6 +1194,24 @@ class EbuildProcessor(object):
 
         :raise UnhandledCommand: thrown when an unknown command is encountered.
         """
+        handlers = self._get_handlers(additional_commands)
+        self.lock()
+
+        try:
+            if self._outstanding_expects:
+                if not self._consume_async_expects():
+                    logger.error("error in daemon")
+                    raise UnhandledCommand("expects out of alignment")
+            while True:
+                self._handle_line(handlers, self.read().strip())
+
+        except FinishedProcessing as fp:
+            v = fp.val
+            self.unlock()
+            return v
+
+    def _get_handlers(self, additional_commands=None):
+        """command handlers for :obj:`generic_handler`"""
 
         # note that self is passed in. so... we just pass in the
         # unbound instance. Specifically, via digging through
@@ -815,33 +1236,22 @@ class EbuildProcessor(object):
                     raise TypeError(additional_commands[x])
 
             handlers.update(additional_commands)
-
-        self.lock()
-
-        try:
-            if self._outstanding_expects:
-                if not self._consume_async_expects():
-                    logger.error("error in daemon")
-                    raise UnhandledCommand("expects out of alignment")
-            while True:
-                line = self.read().strip()
-                # split on first whitespace.
-                s = line.split(None, 1)
-                if not s:
-                    raise InternalError("Expected command; instead got nothing from %r" % (line,))
-                if s[0] in handlers:
-                    if len(s) == 1:
-                        s.append(None)
-                    handlers[s[0]](self, s[1])
-                else:
-                    logger.error("unhandled command '%s', line '%s'" %
-                                 (s[0], line))
-                    raise UnhandledCommand(line)
-
-        except FinishedProcessing as fp:
-            v = fp.val
-            self.unlock()
-            return v
+        return handlers
+
+    def _handle_line(self, handlers, line):
+        """dispatch a command line from the daemon to its handler"""
+        # split on first whitespace.
+        s = line.split(None, 1)
+        if not s:
+            raise InternalError("Expected command; instead got nothing from %r" % (line,))
+        if s[0] in handlers:
+            if len(s) == 1:
+                s.append(None)
+            handlers[s[0]](self, s[1])
+        else:
+            logger.error("unhandled command '%s', line '%s'" %
+                         (s[0], line))
+            raise UnhandledCommand(line)
 
 def inherit_handler(ecache, ebp, line, updates=None):
     """
@@ -874,6 +1284,46 @@ def inherit_handler(ecache, ebp, line, updates=None):
         updates.add(line)
 
 
+def portageq_handler(domain, ebp, line):
+    """
+    Callback answering has_version/best_version queries from the daemon.
+
+    Queries are answered from the in memory domain rather than via the
+    daemon spawning pinspect (which has to rebuild the domain from scratch
+    for every call).  The daemon follows the request with lines for the
+    EAPI, the requested root (empty if unspecified), USE, and the atom; the
+    response is the return code followed by the output.  If the query is
+    for a root other than the domain's, the return code is 'fallback', and
+    the daemon is left to spawn pinspect itself.
+
+    Not for normal consumption.
+    """
+    command = (line or '').strip()
+    eapi_str, root, use, value = [x.rstrip('\n') for x in ebp.readlines(4)]
+    if command not in ("has_version", "best_version"):
+        ebp.write("2\nunknown portageq command %r" % (command,))
+        return
+
+    if root and normpath(root) != normpath(domain.root):
+        ebp.write("fallback\n")
+        return
+
+    # unknown/unset EAPIs get the unrestricted atom class.
+    eapi_obj = eapi.get_eapi(eapi_str, False)
+    try:
+        restrict = portageq.parse_atom(value,
+            getattr(eapi_obj, 'atom_kls', None), frozenset(use.split()))
+    except ebuild_errors.MalformedAtom as e:
+        ebp.write("2\n%s" % (str(e).replace('\n', ' '),))
+        return
+
+    repos = domain.all_livefs_repos
+    if command == "has_version":
+        ebp.write("%i\n" % (not repos.has_match(restrict),))
+    else:
+        ebp.write("0\n%s" % (portageq._best_version(domain, restrict, None),))
+
+
 def expected_ebuild_env(pkg, d=None, env_source_override=None, depends=False):
     """
     setup expected ebuild vars
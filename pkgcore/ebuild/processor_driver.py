@@ -0,0 +1,300 @@
+# License: GPL2/BSD
+
+"""
+drive many ebuild processors from a single thread
+
+Normally a thread blocks in :obj:`EbuildProcessor.generic_handler
+<pkgcore.ebuild.processor.EbuildProcessor.generic_handler>` for the
+duration of each request; running more daemons concurrently means more
+threads, mostly idle and contending for the GIL.  A :obj:`ProcessorDriver`
+instead sends requests to any number of processors, and then multiplexes
+their pipes via select, dispatching the daemons' commands as they arrive.
+Parallel builds don't use it; see :obj:`pkgcore.resolver.scheduler`.
+
+Usage is roughly:
+
+>>> driver = ProcessorDriver()
+>>> requests = [driver.get_keys(ebp, pkg, eclass_cache)
+...     for ebp, pkg in zip(processors, pkgs)]
+>>> for request in driver.iter_completed():
+...     print request.result()
+"""
+
+__all__ = ("ProcessorDriver", "ProcessorRequest")
+
+import errno
+import os
+import select
+import sys
+
+from pkgcore.ebuild.processor import (FinishedProcessing, InternalError,
+    UnhandledCommand)
+from snakeoil import compatibility
+
+
+class _buffered_reader(object):
+
+    """
+    file-like replacement for a processor's read pipe
+
+    Stdio buffering hides data from select; this buffers it itself, and is
+    fed by the driver as data arrives.  Reads needing more than what's
+    buffered block, thus it works for non driven usage of the processor
+    too.
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._fd = fileobj.fileno()
+        self._buf = ''
+
+    def fileno(self):
+        return self._fd
+
+    def fill(self):
+        """read what's available; returns False on EOF"""
+        data = os.read(self._fd, 65536)
+        self._buf += data
+        return bool(data)
+
+    def has_line(self):
+        return '\n' in self._buf
+
+    def readline(self):
+        while '\n' not in self._buf:
+            if not self.fill():
+                break
+        i = self._buf.find('\n') + 1 or len(self._buf)
+        line, self._buf = self._buf[:i], self._buf[i:]
+        return line
+
+    def read(self, size):
+        while len(self._buf) < size:
+            if not self.fill():
+                break
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def close(self):
+        self._fileobj.close()
+
+
+class ProcessorRequest(object):
+
+    """
+    a request against an ebuild processor, completed by a
+    :obj:`ProcessorDriver`
+
+    Once done, :obj:`result` returns what the equivalent
+    :obj:`EbuildProcessor <pkgcore.ebuild.processor.EbuildProcessor>`
+    method would have, or raises what it would have.
+    """
+
+    def __init__(self, ebp=None, handlers=None, finish=None, expects=()):
+        self.ebp = ebp
+        self.done = False
+        self._handlers = handlers
+        self._finish = finish
+        self._expects = list(expects)
+        self._result = None
+        self._exc_info = None
+
+    @classmethod
+    def finished(cls, result):
+        """create an already completed request; useful for callers which
+        can sometimes answer without a processor"""
+        request = cls()
+        request._complete(result)
+        return request
+
+    def result(self):
+        if not self.done:
+            raise ValueError("request isn't completed")
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    @property
+    def exception(self):
+        """the exception the request failed with, or None"""
+        if self._exc_info is None:
+            return None
+        return self._exc_info[1]
+
+    def _complete(self, val):
+        if self.ebp is not None:
+            self.ebp.unlock()
+        self.done = True
+        if self._finish is not None:
+            try:
+                val = self._finish(val)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception:
+                self._exc_info = sys.exc_info()
+                return
+        self._result = val
+
+    def _fail(self, exc_info):
+        if self.ebp is not None:
+            self.ebp.unlock()
+        self.done = True
+        self._exc_info = exc_info
+
+    def _feed(self, line):
+        """process a line from the daemon"""
+        try:
+            if self._expects:
+                if line.rstrip('\n') != self._expects.pop(0):
+                    raise UnhandledCommand("expects out of alignment")
+                return
+            self.ebp._handle_line(self._handlers, line.strip())
+        except FinishedProcessing as fp:
+            self._complete(fp.val)
+        except compatibility.IGNORED_EXCEPTIONS:
+            raise
+        except Exception:
+            self._fail(sys.exc_info())
+
+
+class ProcessorDriver(object):
+
+    """
+    run requests against many ebuild processors from a single thread
+
+    Each processor may have only one request pending at a time.  Requests
+    are started via :obj:`get_keys`, :obj:`get_ebuild_environment`, and
+    :obj:`run_phase`- mirroring the processor methods of the same name-
+    and completed via :obj:`poll`, :obj:`iter_completed`, or :obj:`wait`.
+    """
+
+    def __init__(self):
+        # read fd -> pending request
+        self._requests = {}
+
+    def __len__(self):
+        return len(self._requests)
+
+    def _submit(self, ebp, start, *args, **kwds):
+        """
+        :param start: processor method sending the request, returning the
+            handlers and finish function for it
+        """
+        reader = ebp.ebd_read
+        if not isinstance(reader, _buffered_reader):
+            reader = ebp.ebd_read = _buffered_reader(reader)
+        fd = reader.fileno()
+        if fd in self._requests:
+            raise ValueError("processor %r already has a pending request" %
+                (ebp,))
+        finish = kwds.pop('finish', None)
+        handlers, _finish = start(*args, **kwds)
+        if finish is not None:
+            _finish = _chain(_finish, finish)
+
+        # acknowledgements still due from earlier async requests are
+        # expected ahead of the request's commands.
+        expects = ebp._outstanding_expects
+        if expects:
+            ebp.ebd_write.flush()
+            ebp._outstanding_expects = []
+        request = ProcessorRequest(ebp, ebp._get_handlers(handlers), _finish,
+            [want for flush, want in expects])
+        ebp.lock()
+        self._requests[fd] = request
+        self._process(fd, request)
+        return request
+
+    def _process(self, fd, request):
+        reader = request.ebp.ebd_read
+        while not request.done and reader.has_line():
+            request._feed(reader.readline())
+        if request.done:
+            del self._requests[fd]
+
+    def get_keys(self, ebp, package_inst, eclass_cache, finish=None):
+        """
+        start regenerating an ebuild's metadata
+
+        :param finish: if not None, callable the keys are passed through;
+            the request's result is what it returns
+        :return: :obj:`ProcessorRequest` instance
+        """
+        return self._submit(ebp, ebp._request_keys, package_inst,
+            eclass_cache, finish=finish)
+
+    def get_ebuild_environment(self, ebp, package_inst, eclass_cache):
+        """
+        start dumping an ebuild's environment
+
+        :return: :obj:`ProcessorRequest` instance
+        """
+        return self._submit(ebp, ebp._request_ebuild_environment,
+            package_inst, eclass_cache)
+
+    def run_phase(self, ebp, phase, env, tmpdir, logging=None,
+                  additional_commands=None, sandbox=True):
+        """
+        start running a phase; see
+        :obj:`pkgcore.ebuild.processor.EbuildProcessor.run_phase`
+
+        Unlike the processor's method, failures of the daemon to accept the
+        env or logfile result in the request failing with
+        :obj:`UnhandledCommand` rather than a False result.
+
+        :return: :obj:`ProcessorRequest` instance
+        """
+        return self._submit(ebp, ebp._request_phase, phase, env, tmpdir,
+            logging=logging, additional_commands=additional_commands,
+            sandbox=sandbox)
+
+    def poll(self, timeout=None):
+        """
+        wait for, and process, data from the processors
+
+        :param timeout: seconds to wait for data; None waits indefinitely
+        :return: list of the requests completed
+        """
+        if not self._requests:
+            return []
+        try:
+            ready = select.select(list(self._requests), [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+        completed = []
+        for fd in ready:
+            request = self._requests[fd]
+            if not request.ebp.ebd_read.fill():
+                try:
+                    raise InternalError(None,
+                        "processor %r died mid request" % (request.ebp,))
+                except InternalError:
+                    request._fail(sys.exc_info())
+                del self._requests[fd]
+            else:
+                self._process(fd, request)
+            if request.done:
+                completed.append(request)
+        return completed
+
+    def iter_completed(self):
+        """
+        yield requests as they complete, until none are pending
+
+        Requests submitted while iterating are waited on too.
+        """
+        while self._requests:
+            for request in self.poll():
+                yield request
+
+    def wait(self, request):
+        """wait for a request to complete, returning its result"""
+        while not request.done:
+            self.poll()
+        return request.result()
+
+
+def _chain(first, second):
+    return lambda val: second(first(val))
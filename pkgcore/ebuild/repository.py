@@ -8,9 +8,10 @@ ebuild repository, specific to gentoo ebuild trees (whether cvs or rsync)
 __all__ = ("tree", "slavedtree",)
 
 import os, stat
-from itertools import imap, ifilterfalse
+from itertools import imap, ifilterfalse, izip
 
 from pkgcore.repository import prototype, errors, configured
+from pkgcore.repository import index as repo_index
 from pkgcore.ebuild import eclass_cache as eclass_cache_module
 from pkgcore.ebuild import ebuild_src
 from pkgcore.config import ConfigHint, configurable
@@ -21,7 +22,8 @@ from snakeoil import klass
 from snakeoil.fileutils import readlines
 from snakeoil.bash import iter_read_bash, read_dict
 from snakeoil.currying import partial
-from snakeoil.osutils import listdir_files, listdir_dirs, pjoin
+from snakeoil.osutils import listdir_files, listdir_dirs, pjoin, stat_mtime_long
+from snakeoil.lists import iflatten_instance
 from snakeoil.fileutils import readfile
 from snakeoil.containers import InvertedContains
 from snakeoil.obj import make_kls
@@ -32,8 +34,9 @@ from snakeoil.demandload import demandload
 demandload(globals(),
     'pkgcore.ebuild:ebd',
     'snakeoil.data_source:local_source',
-    'snakeoil.chksum:get_chksums',
-    'pkgcore.ebuild:digest,repo_objs,atom',
+    'pkgcore.ebuild:digest,repo_objs,atom,eclass_index,revdep_index',
+    'pkgcore.ebuild:cpv@cpv_mod',
+    'pkgcore.fetch:verify',
     'pkgcore.ebuild:errors@ebuild_errors',
     'pkgcore.ebuild:profiles,processor',
     'pkgcore.package:errors@pkg_errors',
@@ -77,12 +80,17 @@ class repo_operations(_repo_ops.operations):
                         observer.error("failed fetching for pkg %s" % (pkg,))
                         return False
 
-                    fetchables = pkg_ops._mirror_op.verified_files
-                    for path, fetchable in fetchables.iteritems():
-                        d = dict(zip(required, get_chksums(path, *required)))
-                        fetchable.chksums = d
                     # should report on conflicts here...
-                    pkgdir_fetchables.update(fetchables.iteritems())
+                    pkgdir_fetchables.update(
+                        pkg_ops._mirror_op.verified_files.iteritems())
+
+                # hash every distfile of the package dir in one go, in
+                # parallel.
+                items = pkgdir_fetchables.items()
+                chksums = verify.get_chksums_many(
+                    (path, required) for path, fetchable in items)
+                for (path, fetchable), d in izip(items, chksums):
+                    fetchable.chksums = d
 
                 pkgdir_fetchables = sorted(pkgdir_fetchables.itervalues())
                 digest.serialize_manifest(os.path.dirname(pkg.ebuild.get_path()),
@@ -154,17 +162,19 @@ def _sort_eclasses(config, raw_repo, eclasses):
          'default_mirrors': 'list',
          'override_repo_id':'str',
          'ignore_paludis_versioning':'bool',
-         'allow_missing_manifests':'bool'},
+         'allow_missing_manifests':'bool',
+         'index_location':'str'},
          requires_config='config')
 def tree(config, raw_repo, cache=(), eclass_override=None, default_mirrors=None,
-         ignore_paludis_versioning=False, allow_missing_manifests=False):
+         ignore_paludis_versioning=False, allow_missing_manifests=False,
+         index_location=None):
     eclass_override = _sort_eclasses(config, raw_repo, eclass_override)
 
     return _UnconfiguredTree(raw_repo.location, eclass_override, cache=cache,
         default_mirrors=default_mirrors,
         ignore_paludis_versioning=ignore_paludis_versioning,
         allow_missing_manifests=allow_missing_manifests,
-        repo_config=raw_repo)
+        repo_config=raw_repo, index_location=index_location)
 
 @configurable(typename='repo',
         types={'raw_repo': 'ref:raw_repo', 'cache': 'refs:cache',
@@ -173,17 +183,19 @@ def tree(config, raw_repo, cache=(), eclass_override=None, default_mirrors=None,
          'default_mirrors': 'list',
          'override_repo_id':'str',
          'ignore_paludis_versioning':'bool',
-         'allow_missing_manifests':'bool'},
+         'allow_missing_manifests':'bool',
+         'index_location':'str'},
          requires_config='config')
 def slavedtree(config, raw_repo, parent_repo, cache=(), eclass_override=None, default_mirrors=None,
-               ignore_paludis_versioning=False, allow_missing_manifests=False):
+               ignore_paludis_versioning=False, allow_missing_manifests=False,
+               index_location=None):
     eclass_override = _sort_eclasses(config, raw_repo, eclass_override)
 
     return _SlavedTree(parent_repo, raw_repo.location, eclass_override, cache=cache,
         default_mirrors=default_mirrors,
         ignore_paludis_versioning=ignore_paludis_versioning,
         allow_missing_manifests=allow_missing_manifests,
-        repo_config=raw_repo)
+        repo_config=raw_repo, index_location=index_location)
 
 
 metadata_offset = "profiles"
@@ -219,13 +231,14 @@ class _UnconfiguredTree(prototype.tree):
          'ignore_paludis_versioning':'bool',
          'allow_missing_manifests':'bool',
          'repo_config':'ref:raw_repo',
+         'index_location':'str',
         },
         typename='repo')
 
     def __init__(self, location, eclass_cache, cache=(),
                  default_mirrors=None, override_repo_id=None,
                  ignore_paludis_versioning=False, allow_missing_manifests=False,
-                 repo_config=None):
+                 repo_config=None, index_location=None):
 
         """
         :param location: on disk location of the tree
@@ -240,6 +253,9 @@ class _UnconfiguredTree(prototype.tree):
             repository unique id
         :param ignore_paludis_versioning: If False, fail when -scm is encountred.  if True,
             silently ignore -scm ebuilds.
+        :param index_location: If not None, file path to store a persistent
+            :obj:`pkgcore.repository.index.DirectoryIndex` of the tree's
+            listings in; only directories modified since are rescanned.
         """
 
         prototype.tree.__init__(self)
@@ -284,6 +300,16 @@ class _UnconfiguredTree(prototype.tree):
         self.package_class = self.package_factory(
             self, cache, self.eclass_cache, self.mirrors, self.default_mirrors)
         self._shared_pkg_cache = WeakValCache()
+        self._index = None
+        if index_location is not None:
+            self._index = repo_index.DirectoryIndex(index_location)
+        self._eclass_index = None
+        self._revdep_index = None
+
+    def _indexed(self, key, path, listing_func, *args):
+        if self._index is None:
+            return listing_func(*args)
+        return self._index.get(key, path, partial(listing_func, *args))
 
     repo_id = klass.alias_attr("config.repo_id")
 
@@ -330,6 +356,9 @@ class _UnconfiguredTree(prototype.tree):
         cats = self.hardcoded_categories
         if cats is not None:
             return cats
+        return self._indexed('', self.base, self._scan_categories)
+
+    def _scan_categories(self):
         try:
             return tuple(imap(intern,
                 ifilterfalse(self.false_categories.__contains__,
@@ -339,6 +368,11 @@ class _UnconfiguredTree(prototype.tree):
             raise_from(KeyError("failed fetching categories: %s" % str(e)))
 
     def _get_packages(self, category):
+        return self._indexed(category,
+            pjoin(self.base, category.lstrip(os.path.sep)),
+            self._scan_packages, category)
+
+    def _scan_packages(self, category):
         cpath = pjoin(self.base, category.lstrip(os.path.sep))
         try:
             return tuple(ifilterfalse(self.false_packages.__contains__,
@@ -354,6 +388,11 @@ class _UnconfiguredTree(prototype.tree):
                 str(e))))
 
     def _get_versions(self, catpkg):
+        return self._indexed('/'.join(catpkg),
+            pjoin(self.base, catpkg[0], catpkg[1]),
+            self._scan_versions, catpkg)
+
+    def _scan_versions(self, catpkg):
         cppath = pjoin(self.base, catpkg[0], catpkg[1])
         pkg = catpkg[-1] + "-"
         lp = len(pkg)
@@ -456,22 +495,206 @@ class _UnconfiguredTree(prototype.tree):
                 'package.mask', ma))
         return [neg, pos]
 
+    def _regen_operation_candidates(self, **kwds):
+        """return the packages regeneration must process
+
+        Unless forced, cache validation is done in bulk per category and
+        only packages lacking a valid cache entry are returned.  If the
+        paths changed since the last regen are given (changed), only the
+        packages whose ebuild changed, or that inherit a changed eclass per
+        the eclass index, are considered at all.
+        """
+        force = kwds.get('force', False)
+        changed = kwds.get('changed')
+        if changed is not None:
+            return self._regen_changed_candidates(changed, force=force,
+                eclass_index_location=kwds.get('eclass_index'))
+        return self._regen_all_candidates(force=force)
+
+    def _regen_all_candidates(self, force=False):
+        if force:
+            for pkg in self:
+                yield pkg
+            return
+        pkls = self.package_class
+        for cat in self.categories:
+            pkgs = [pkls(cat, pn, ver)
+                for pn in self.packages.get(cat, ())
+                for ver in self.versions.get((cat, pn), ())]
+            for pkg in pkls.get_stale_metadata(pkgs):
+                yield pkg
+
+    def _regen_changed_candidates(self, changed, force=False,
+                                  eclass_index_location=None):
+        keys, eclasses = set(), set()
+        for path in changed:
+            if os.path.isabs(path):
+                path = os.path.relpath(path, self.location)
+            path = os.path.normpath(path).split(os.sep)
+            if len(path) == 2 and path[0] == 'eclass':
+                if path[1].endswith('.eclass'):
+                    eclasses.add(path[1][:-len('.eclass')])
+            elif len(path) == 3 and path[2].endswith('.ebuild'):
+                cat, pn, ver = path
+                ver = ver[:-len('.ebuild')]
+                if ver.startswith(pn + '-'):
+                    keys.add((cat, pn, ver[len(pn) + 1:]))
+
+        if eclasses:
+            index = self._get_eclass_index(eclass_index_location)
+            for eclass in eclasses:
+                for cpvstr in index.consumers(eclass):
+                    pkg = cpv_mod.versioned_CPV(cpvstr)
+                    keys.add((pkg.category, pkg.package, pkg.fullver))
+
+        # drop removed ebuilds, and anything that isn't one at all.
+        pkls = self.package_class
+        pkgs = []
+        for key in sorted(keys):
+            if key[0] in self.categories and \
+                    key[1] in self.packages.get(key[0], ()) and \
+                    key[2] in self.versions.get(key[:2], ()):
+                pkgs.append(pkls(*key))
+        if force:
+            return pkgs
+        return pkls.get_stale_metadata(pkgs)
+
+    def _get_eclass_index(self, location=None):
+        index = self._eclass_index
+        if index is None or index.location != location:
+            index = self._eclass_index = eclass_index.EclassIndex(location)
+            if not index.exists:
+                # derived from the (possibly stale) cache entries; slow, but
+                # it's maintained via regen from then on.
+                pkls = self.package_class
+                for pkg in self:
+                    index.update(pkg.cpvstr, pkls.get_cached_eclasses(pkg))
+                index.commit()
+        return index
+
+    def get_revdep_index(self, location=None):
+        """
+        get the index of what packages depend upon
+
+        Entries for packages whose ebuild, or inherited eclasses, changed
+        since the index was last updated are refreshed first.
+
+        :param location: file path the index is persisted in; if None, it's
+            built in memory
+        :return: :obj:`pkgcore.ebuild.revdep_index.RevdepIndex` instance
+        """
+        index = self._revdep_index
+        if index is None or index.location != location:
+            index = self._revdep_index = revdep_index.RevdepIndex(location)
+            self._refresh_revdep_index(index)
+        return index
+
+    def _refresh_revdep_index(self, index):
+        index.update_eclasses(dict((name, data.mtime)
+            for name, data in self.eclass_cache.eclasses.iteritems()))
+        pkls = self.package_class
+        live = set()
+        for cp in self.versions:
+            for ver in self.versions[cp]:
+                pkg = pkls(cp[0], cp[1], ver)
+                live.add(pkg.cpvstr)
+                try:
+                    mtime = stat_mtime_long(pkg.path)
+                except EnvironmentError:
+                    continue
+                if index.is_valid(pkg.cpvstr, mtime):
+                    continue
+                try:
+                    atoms = [str(x)
+                        for attr in ('depends', 'rdepends', 'post_rdepends')
+                        for x in iflatten_instance(getattr(pkg, attr),
+                            atom.atom)]
+                    eclasses = pkg.inherited
+                except pkg_errors.MetadataException as e:
+                    # left unindexed; queries must check it themselves.
+                    logger.warning("unable to index dependencies of %s: %s",
+                        pkg.cpvstr, e)
+                    index.discard(pkg.cpvstr)
+                    continue
+                index.update(pkg.cpvstr, mtime, eclasses, atoms)
+        for cpv in [x for x in index if x not in live]:
+            index.discard(cpv)
+        index.commit()
+
+    def _regen_operation_finish(self, results, **kwds):
+        """update the eclass index with what regenerated packages inherit
+
+        If the index doesn't exist yet, it's left to be built when first
+        needed.
+        """
+        location = kwds.get('eclass_index')
+        index = self._eclass_index
+        if index is None or index.location != location:
+            if location is None:
+                return
+            index = eclass_index.EclassIndex(location)
+            if not index.exists:
+                return
+        for cpvstr, eclasses in results.iteritems():
+            if eclasses is not None:
+                index.update(cpvstr, eclasses)
+        index.commit()
+
+    def _regen_operation_affinity(self, pkg):
+        """key grouping packages for regen by the eclasses they inherit"""
+        return self.package_class.get_cached_eclasses(pkg)
+
     def _regen_operation_helper(self, **kwds):
         return _RegenOpHelper(self, force=bool(kwds.get('force', False)),
-            eclass_caching=bool(kwds.get('eclass_caching', True)))
+            eclass_caching=bool(kwds.get('eclass_caching', True)),
+            zygote=bool(kwds.get('zygote', False)))
 
 
 class _RegenOpHelper(object):
 
-    def __init__(self, repo, force=False, eclass_caching=True):
+    def __init__(self, repo, force=False, eclass_caching=True, zygote=False):
         self.force=force
         self.eclass_caching = eclass_caching
-        self.ebp = processor.request_ebuild_processor()
+        # when forking from a zygote, it's the zygote that preloads the
+        # eclasses; each helper then gets them for the cost of a fork.
+        eclass_cache = None
+        if zygote and eclass_caching:
+            eclass_cache = repo.eclass_cache
+        self.ebp = processor.request_ebuild_processor(zygote=zygote,
+            eclass_cache=eclass_cache)
         if eclass_caching:
             self.ebp.allow_eclass_caching()
 
+    def _get_processor(self):
+        # swap in a fresh processor once this one has done its share.
+        ebp = processor.recycle_ebuild_processor(self.ebp)
+        if ebp is not self.ebp:
+            self.ebp = ebp
+            if self.eclass_caching:
+                ebp.allow_eclass_caching()
+        return ebp
+
     def __call__(self, pkg):
-        return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
+        """regenerate a package, returning the eclasses it inherits"""
+        return self._eclasses(pkg._fetch_metadata(ebp=self._get_processor(),
+            force_regen=self.force))
+
+    def start(self, pkg, driver):
+        """
+        start regenerating a package via a
+        :obj:`pkgcore.ebuild.processor_driver.ProcessorDriver`
+
+        The package is assumed to need it; staleness checks are left to
+        candidate selection.
+
+        :return: request whose result is what :obj:`__call__` would return
+        """
+        return pkg._parent._start_metadata_update(pkg, self._get_processor(),
+            driver, finish=self._eclasses)
+
+    @staticmethod
+    def _eclasses(data):
+        return frozenset(data.get('_eclasses_', ()))
 
     def finish(self):
         if self.eclass_caching:
@@ -0,0 +1,199 @@
+# License: GPL2/BSD
+
+"""
+persistent dependency key -> dependent packages index
+
+Built from packages' dependencies (thus the metadata cache); used to find
+which packages may depend on something without parsing every package's
+depsets.  Entries are validated against the ebuild's and inherited eclasses'
+mtimes, as the metadata cache is.
+"""
+
+__all__ = ("RevdepIndex",)
+
+import os
+import threading
+
+from pkgcore.os_data import portage_gid
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'errno',
+    'pkgcore.ebuild.atom:atom',
+    'pkgcore.log:logger',
+)
+
+
+class RevdepIndex(object):
+
+    """
+    mapping of cpv -> atoms depended on, and its inverse by atom key
+
+    :ivar stale: set of cpvs whose entries were invalidated by
+        :obj:`update_eclasses` and not updated since
+    """
+
+    magic = 'pkgcore revdep index 1'
+
+    def __init__(self, location=None):
+        """
+        :param location: file path to persist the index in; if None, it's
+            kept only in memory
+        """
+        self.location = location
+        self.stale = set()
+        # cpv -> (ebuild mtime, eclasses inherited, atoms depended on)
+        self._data = {}
+        self._eclasses = {}
+        self._dependents = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        if location is not None:
+            self._read()
+
+    def _read(self):
+        try:
+            with open(self.location, 'r') as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    return
+                for line in f:
+                    line = line.split()
+                    if len(line) == 3 and line[0] == 'eclass':
+                        self._eclasses[line[1]] = long(line[2])
+                    elif len(line) >= 4 and line[0] == 'pkg':
+                        eclasses = ()
+                        if line[3] != '-':
+                            eclasses = line[3].split(',')
+                        self._data[line[1]] = (long(line[2]),
+                            frozenset(eclasses), tuple(line[4:]))
+        except (ValueError, IOError) as e:
+            self._data.clear()
+            self._eclasses.clear()
+            if getattr(e, 'errno', None) != errno.ENOENT:
+                logger.warning("failed reading revdep index %r: %s",
+                    self.location, e)
+
+    def _get_dependents(self):
+        # built on first use; updates are applied to it from then on.
+        if self._dependents is None:
+            d = {}
+            for cpv, (mtime, eclasses, atoms) in self._data.iteritems():
+                self._add_dependents(d, cpv, atoms)
+            self._dependents = d
+        return self._dependents
+
+    @staticmethod
+    def _add_dependents(d, cpv, atoms):
+        for x in atoms:
+            d.setdefault(atom(x).key, {}).setdefault(cpv, set()).add(x)
+
+    def update_eclasses(self, stamps):
+        """
+        :param stamps: mapping of eclass name -> mtime of all eclasses
+            available
+        :return: set of cpvs invalidated due to changed eclasses
+        """
+        with self._lock:
+            changed = set(self._eclasses)
+            changed.symmetric_difference_update(stamps)
+            changed.update(name for name, mtime in stamps.iteritems()
+                if self._eclasses.get(name, mtime) != mtime)
+            if changed:
+                self._eclasses = dict(stamps)
+                self._dirty = True
+                self.stale.update(cpv for cpv, (mtime, eclasses, atoms)
+                    in self._data.iteritems() if not changed.isdisjoint(eclasses))
+            return self.stale
+
+    def is_valid(self, cpv, mtime):
+        """is the entry for cpv current, given the ebuild's mtime"""
+        entry = self._data.get(cpv)
+        return entry is not None and entry[0] == mtime and \
+            cpv not in self.stale
+
+    def update(self, cpv, mtime, eclasses, atoms):
+        """
+        :param cpv: cpvstr of the package
+        :param mtime: the package's ebuild mtime
+        :param eclasses: eclass names the package inherits
+        :param atoms: iterable of atom strings the package depends on
+        """
+        entry = (mtime, frozenset(eclasses), tuple(sorted(set(atoms))))
+        with self._lock:
+            self.stale.discard(cpv)
+            old = self._data.get(cpv)
+            if old == entry:
+                return
+            self._data[cpv] = entry
+            self._dirty = True
+            d = self._dependents
+            if d is not None:
+                if old is not None:
+                    self._remove_dependents(d, cpv, old[2])
+                self._add_dependents(d, cpv, entry[2])
+
+    def discard(self, cpv):
+        with self._lock:
+            self.stale.discard(cpv)
+            old = self._data.pop(cpv, None)
+            if old is None:
+                return
+            self._dirty = True
+            if self._dependents is not None:
+                self._remove_dependents(self._dependents, cpv, old[2])
+
+    @staticmethod
+    def _remove_dependents(d, cpv, atoms):
+        for x in atoms:
+            key = atom(x).key
+            dependents = d.get(key)
+            if dependents is not None:
+                dependents.pop(cpv, None)
+                if not dependents:
+                    del d[key]
+
+    def dependents(self, key):
+        """
+        :param key: package key (category/package) depended upon
+        :return: dict of cpvstr -> frozenset of the atom strings by which it
+            depends on key
+        """
+        return dict((cpv, frozenset(atoms)) for cpv, atoms in
+            self._get_dependents().get(key, {}).iteritems())
+
+    def __contains__(self, cpv):
+        return cpv in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def commit(self):
+        """write the index out if it was modified"""
+        if self.location is None or not self._dirty:
+            return
+        self._dirty = False
+        f = None
+        try:
+            if not ensure_dirs(os.path.dirname(self.location),
+                               gid=portage_gid, mode=0775):
+                return
+            f = AtomicWriteFile(self.location, gid=portage_gid, perms=0664)
+            f.write("%s\n" % (self.magic,))
+            for name, mtime in sorted(self._eclasses.iteritems()):
+                f.write("eclass %s %i\n" % (name, mtime))
+            for cpv, (mtime, eclasses, atoms) in sorted(self._data.iteritems()):
+                f.write("pkg %s %i %s%s\n" % (cpv, mtime,
+                    ','.join(sorted(eclasses)) or '-',
+                    ''.join(' ' + x for x in atoms)))
+            f.close()
+        except EnvironmentError as e:
+            if f is not None:
+                f.discard()
+            # not being root is the norm for query usage; stay quiet.
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.warning("unable to update revdep index %r: %s",
+                    self.location, e)
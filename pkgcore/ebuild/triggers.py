@@ -446,14 +446,25 @@ class ProtectOwned(FileCollision):
         self.vdb = vdb
 
     def collision(self, colliding):
-        real_pkgs = (pkg for repo in self.vdb for pkg in repo if pkg.package_is_real)
         collisions = {}
 
-        # TODO: worth parallelizing this vdb scanning?
-        for pkg in real_pkgs:
-            pkg_file_collisions = pkg.contents.intersection(colliding)
-            if pkg_file_collisions:
-                collisions[pkg.cpvstr] = pkg_file_collisions
+        for repo in self.vdb:
+            owners = getattr(repo, 'owners', None)
+            if owners is not None:
+                # use the repo's ownership index rather than scanning
+                # every installed package's contents.
+                for path, pkgs in owners(x.location for x in colliding).iteritems():
+                    for pkg in pkgs:
+                        collisions.setdefault(pkg.cpvstr, set()).add(
+                            colliding[path])
+                continue
+            for pkg in repo:
+                if not pkg.package_is_real:
+                    continue
+                pkg_file_collisions = pkg.contents.intersection(colliding)
+                if pkg_file_collisions:
+                    collisions.setdefault(pkg.cpvstr, set()).update(
+                        pkg_file_collisions)
 
         if collisions:
             pkg_collisions = [
@@ -8,9 +8,9 @@ prototype fetcher class, all fetchers should derive from this
 __all__ = ("fetcher",)
 
 import os
-from snakeoil.chksum import get_handlers, get_chksums
+from snakeoil.chksum import get_handlers
 from snakeoil import compatibility
-from pkgcore.fetch import errors
+from pkgcore.fetch import errors, verify
 from snakeoil.compatibility import cmp
 
 class fetcher(object):
@@ -64,22 +64,18 @@ class fetcher(object):
 
         chfs = set(target.chksums).intersection(handlers)
         chfs.discard("size")
-        chfs = list(chfs)
-        if nondefault_handlers:
-            for x in chfs:
-                val = handlers[x](file_location)
-                if val != target.chksums[x]:
-                    raise errors.FetchFailed(file_location,
-                        "Validation handler %s: expected %s, got %s" % (
-                        x, target.chksums[x], val))
-        else:
-            desired_vals = [target.chksums[x] for x in chfs]
-            calced = get_chksums(file_location, *chfs)
-            for desired, got, chf in zip(desired_vals, calced, chfs):
-                if desired != got:
-                    raise errors.FetchFailed(file_location,
-                        "Validation handler %s: expected %s, got %s" % (
-                        chf, desired, got))
+        chfs = sorted(chfs)
+        if not chfs:
+            return
+        # all chksums are computed from a single read of the file, and
+        # cached for as long as the file is unmodified.
+        calced = verify.get_chksums(file_location, chfs,
+            handlers=nondefault_handlers)
+        for chf in chfs:
+            if calced[chf] != target.chksums[chf]:
+                raise errors.FetchFailed(file_location,
+                    "Validation handler %s: expected %s, got %s" % (
+                    chf, target.chksums[chf], calced[chf]))
 
     def __call__(self, fetchable):
         if not fetchable.uri:
@@ -153,7 +153,7 @@ class fetcher(base.fetcher):
 
         except StopIteration:
             # ran out of uris
-            return FetchFailed(fp, "Ran out of urls to fetch from")
+            raise errors.FetchFailed(fp, "Ran out of urls to fetch from")
 
     def get_path(self, fetchable):
         fp = pjoin(self.distdir, fetchable.filename)
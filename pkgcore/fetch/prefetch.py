@@ -0,0 +1,195 @@
+# License: GPL2/BSD
+
+"""
+background fetching of distfiles ahead of their use
+
+:obj:`prefetcher` wraps a fetcher, downloading queued files via a bounded
+pool of worker threads; requests for a queued file block till the
+background fetch of it completes, rather than fetching it again.  Each
+uri is tried individually so that the number of concurrent downloads from
+any one host can be limited; hosts that failed earlier are tried last.
+Fetches of files that weren't queued are serialized per filename, so
+concurrent consumers never download the same file over each other.
+"""
+
+__all__ = ("prefetcher",)
+
+import threading
+from collections import deque
+from urlparse import urlparse
+
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
+from pkgcore.fetch import base, fetchable
+
+
+class _job(object):
+
+    __slots__ = ("target", "done", "result")
+
+    def __init__(self, target):
+        self.target = target
+        self.done = threading.Event()
+        self.result = None
+
+
+class prefetcher(base.fetcher):
+
+    """
+    fetcher fetching queued files in the background via another fetcher
+    """
+
+    def __init__(self, fetcher, jobs=4, per_host=2):
+        """
+        :param fetcher: :obj:`pkgcore.fetch.base.fetcher` instance to do the
+            actual fetching
+        :param jobs: number of files to fetch concurrently
+        :param per_host: maximum number of concurrent fetches from any one
+            host
+        """
+        base.fetcher.__init__(self)
+        self.fetcher = fetcher
+        self.jobs = max(int(jobs), 1)
+        self.per_host = max(int(per_host), 1)
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._jobs = {}
+        self._hosts = {}
+        self._host_failures = {}
+        self._file_locks = {}
+        self._workers = []
+        self._cancelled = False
+
+    def add(self, target):
+        """
+        queue a fetchable for fetching in the background
+
+        Files already queued (by filename) are ignored.
+        """
+        if not isinstance(target, fetchable):
+            raise TypeError(
+                "target must be fetchable instance/derivative: %s" % target)
+        with self._lock:
+            if self._cancelled or target.filename in self._jobs:
+                return
+            job = self._jobs[target.filename] = _job(target)
+            self._pending.append(job)
+            if len(self._workers) < self.jobs:
+                t = threading.Thread(target=self._worker)
+                t.daemon = True
+                self._workers.append(t)
+                t.start()
+
+    def cancel(self):
+        """drop all queued fetches that haven't been started yet"""
+        with self._lock:
+            self._cancelled = True
+            while self._pending:
+                job = self._pending.popleft()
+                del self._jobs[job.target.filename]
+                job.done.set()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._workers.remove(threading.current_thread())
+                    return
+                job = self._pending.popleft()
+            try:
+                job.result = self._fetch(job.target)
+            finally:
+                job.done.set()
+
+    def _host_lock(self, host):
+        with self._lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.Semaphore(self.per_host)
+            return sem
+
+    def _ordered_uris(self, target):
+        # failover; stable sort so the tier's ordering is otherwise kept.
+        failures = self._host_failures
+        return sorted(((urlparse(uri)[1], uri) for uri in target.uri),
+            key=lambda x: failures.get(x[0], 0))
+
+    def _acquire(self, uris):
+        # prefer the first host with a free slot; if they're all busy,
+        # wait on the most preferred.
+        for host, uri in uris:
+            sem = self._host_lock(host)
+            if sem.acquire(False):
+                return host, uri, sem
+        host, uri = uris[0]
+        sem = self._host_lock(host)
+        sem.acquire()
+        return host, uri, sem
+
+    def _fetch(self, target):
+        if not target.uri:
+            return self._attempt(self.fetcher.get_path, target)
+        uris = self._ordered_uris(target)
+        while uris:
+            host, uri, sem = self._acquire(uris)
+            uris.remove((host, uri))
+            try:
+                path = self._attempt(self.fetcher.fetch,
+                    fetchable(target.filename, (uri,), target.chksums))
+            finally:
+                sem.release()
+            if path is not None:
+                return path
+            with self._lock:
+                self._host_failures[host] = \
+                    self._host_failures.get(host, 0) + 1
+        return None
+
+    @staticmethod
+    def _attempt(functor, target):
+        try:
+            return functor(target)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception:
+            # fetch failures are reported by the fetch of the file proper.
+            return None
+
+    def _wait(self, target):
+        with self._lock:
+            job = self._jobs.get(target.filename)
+        if job is None:
+            return False, None
+        # a timeout is used since a plain wait isn't interruptible.
+        while not job.done.wait(1):
+            pass
+        if job.target.chksums != target.chksums:
+            # same filename, differing chksums; leave it to the fetcher.
+            return False, None
+        return job.result is not None, job.result
+
+    def _file_lock(self, filename):
+        with self._lock:
+            lock = self._file_locks.get(filename)
+            if lock is None:
+                lock = self._file_locks[filename] = threading.Lock()
+            return lock
+
+    def __call__(self, target):
+        queued, path = self._wait(target)
+        if queued:
+            return path
+        with self._file_lock(target.filename):
+            return self.fetcher(target)
+
+    def fetch(self, target):
+        queued, path = self._wait(target)
+        if queued:
+            return path
+        with self._file_lock(target.filename):
+            return self.fetcher.fetch(target)
+
+    def get_path(self, target):
+        return self.fetcher.get_path(target)
+
+    def get_storage_path(self):
+        return self.fetcher.get_storage_path()
@@ -0,0 +1,179 @@
+# License: GPL2/BSD
+
+"""
+checksum computation for distfiles
+
+Each file is read once, all requested hashes being fed from that single
+pass; sizes come from stat rather than reading.  Results are cached keyed
+by the file's path, and invalidated via its mtime, size and inode- thus
+verifying a file that was just fetched, or generating manifests for files
+already verified, doesn't rehash it.  :obj:`get_chksums_many` computes the
+checksums of many files at once via a pool of threads (hashing releases
+the GIL), so verifying a set of large distfiles is bound by IO rather than
+by the number of hash types.
+"""
+
+__all__ = ("chksum_cache", "get_chksums", "get_chksums_many")
+
+import os
+import threading
+from collections import deque
+
+from snakeoil.chksum import get_handlers
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'snakeoil.chksum.defaults:chksum_loop_over_file',
+    'snakeoil.process:get_proc_count',
+)
+
+
+class chksum_cache(object):
+
+    """
+    mapping of path -> computed checksums, validated against the file's stat
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, key):
+        """
+        :param key: stat derived key for the file as it is now
+        :return: dict of chksum -> value known for the file
+        """
+        entry = self._data.get(path)
+        if entry is None or entry[0] != key:
+            return {}
+        return entry[1]
+
+    def update(self, path, key, chksums):
+        with self._lock:
+            entry = self._data.get(path)
+            if entry is None or entry[0] != key:
+                entry = self._data[path] = (key, {})
+            entry[1].update(chksums)
+
+    def invalidate(self, path):
+        self._data.pop(path, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+# shared by default; files don't change identity per consumer.
+default_cache = chksum_cache()
+
+
+def _stat_key(st):
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+def get_chksums(path, chfs, handlers=None, cache=default_cache,
+                parallelize=True):
+    """
+    compute checksums for a file
+
+    :param path: file path
+    :param chfs: sequence of chksum types
+    :param handlers: if given, mapping of chksum type to handler to use
+        instead of the defaults; results from non default handlers aren't
+        cached
+    :param cache: :obj:`chksum_cache` instance, or None to disable caching
+    :param parallelize: whether or not to hash in parallel threads
+    :raise EnvironmentError: if the file can't be read
+    :return: dict of chksum type -> value
+    """
+    st = os.stat(path)
+    key = _stat_key(st)
+    results = {}
+    default_handlers = handlers is None
+    if default_handlers:
+        handlers = get_handlers(chfs)
+        if cache is not None:
+            results.update(cache.get(path, key))
+    else:
+        cache = None
+
+    todo = []
+    for chf in chfs:
+        if chf in results:
+            continue
+        elif chf == 'size' and default_handlers:
+            results[chf] = long(st.st_size)
+        else:
+            todo.append(chf)
+
+    # handlers able to hash incrementally share a single read of the file.
+    shared = [chf for chf in todo if hasattr(handlers[chf], 'new')]
+    if len(shared) == 1:
+        results[shared[0]] = handlers[shared[0]](path)
+    elif shared:
+        results.update(zip(shared, chksum_loop_over_file(path,
+            [handlers[chf].new() for chf in shared],
+            parallelize=parallelize)))
+    for chf in todo:
+        if chf not in results:
+            results[chf] = handlers[chf](path)
+
+    if cache is not None and todo:
+        cache.update(path, key, results)
+    return dict((chf, results[chf]) for chf in chfs)
+
+
+def get_chksums_many(items, jobs=None, cache=default_cache,
+                     ignore_errors=False):
+    """
+    compute checksums for multiple files in parallel
+
+    :param items: sequence of (path, chfs) pairs
+    :param jobs: number of files to hash concurrently; defaults to the
+        number of processors
+    :param cache: see :obj:`get_chksums`
+    :param ignore_errors: if True, files that can't be read have None as
+        their result; else the first error encountered is raised
+    :return: list of dicts of chksum type -> value, in the order of items
+    """
+    items = list(items)
+    if jobs is None:
+        jobs = get_proc_count()
+    jobs = max(min(int(jobs), len(items)), 1)
+    results = [None] * len(items)
+    errors = []
+
+    if jobs == 1:
+        for idx, (path, chfs) in enumerate(items):
+            try:
+                results[idx] = get_chksums(path, chfs, cache=cache)
+            except EnvironmentError:
+                if not ignore_errors:
+                    raise
+        return results
+
+    pending = deque(enumerate(items))
+    def worker():
+        while True:
+            try:
+                idx, (path, chfs) = pending.popleft()
+            except IndexError:
+                return
+            try:
+                # parallelism is across files; no need for per hash threads.
+                results[idx] = get_chksums(path, chfs, cache=cache,
+                    parallelize=False)
+            except IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                if not ignore_errors or not isinstance(e, EnvironmentError):
+                    errors.append((idx, e))
+                    pending.clear()
+
+    threads = [threading.Thread(target=worker) for x in xrange(jobs)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise min(errors)[1]
+    return results
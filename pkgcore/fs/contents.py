@@ -5,7 +5,8 @@
 contents set- container of fs objects
 """
 
-from itertools import ifilter
+from bisect import bisect_left
+from itertools import ifilter, islice
 from operator import attrgetter
 
 from snakeoil.currying import partial
@@ -42,6 +43,32 @@ def check_instance(obj):
     return obj.location, obj
 
 
+def _sorted_merge(left, right):
+    """
+    walk two sorted sequences of locations in step
+
+    :return: iterator of (location, in left, in right)
+    """
+    i, j = 0, 0
+    llen, rlen = len(left), len(right)
+    while i < llen and j < rlen:
+        l, r = left[i], right[j]
+        if l == r:
+            yield l, True, True
+            i += 1
+            j += 1
+        elif l < r:
+            yield l, True, False
+            i += 1
+        else:
+            yield r, False, True
+            j += 1
+    for l in islice(left, i, None):
+        yield l, True, False
+    for r in islice(right, j, None):
+        yield r, False, True
+
+
 class contentsSet(object):
     """set of :class:`pkgcore.fs.fs.fsBase` objects"""
 
@@ -58,6 +85,11 @@ class contentsSet(object):
         :param mutable: controls if it modifiable after initialization
         """
         self._dict = self.__dict_kls__()
+        # sorted index of the locations, built when first needed; once built,
+        # mutations are tracked so it can be brought up to date cheaply.
+        self._sorted = None
+        self._sorted_added = set()
+        self._sorted_removed = set()
         if initial is not None:
             self._dict.update(check_instance(x) for x in initial)
         self.mutable = mutable
@@ -71,6 +103,45 @@ class contentsSet(object):
         return "%s([%s])" % (self.__class__.__name__,
             ', '.join(repr(x) for x in self))
 
+    def _sorted_locations(self):
+        """sorted list of the locations in the set; don't modify it"""
+        if self._sorted is None:
+            self._sorted = sorted(self._dict)
+        elif self._sorted_added or self._sorted_removed:
+            removed = self._sorted_removed
+            l = self._sorted
+            if removed:
+                l = [x for x in l if x not in removed]
+            if self._sorted_added:
+                # appending a sorted run; timsort merges the two linearly.
+                l.extend(sorted(self._sorted_added))
+                l.sort()
+            self._sorted = l
+            self._sorted_added, self._sorted_removed = set(), set()
+        return self._sorted
+
+    def _track_add(self, location):
+        if self._sorted is not None and location not in self._dict:
+            if location in self._sorted_removed:
+                self._sorted_removed.discard(location)
+            else:
+                self._sorted_added.add(location)
+
+    def _track_remove(self, location):
+        if self._sorted is not None and location in self._dict:
+            if location in self._sorted_added:
+                self._sorted_added.discard(location)
+            else:
+                self._sorted_removed.add(location)
+
+    def _from_sorted(self, objs, locations, mutable):
+        # objs yields the objects for locations, which are sorted and unique.
+        cset = contentsSet(mutable=True)
+        cset._dict.update(objs)
+        cset._sorted = locations
+        cset.mutable = mutable
+        return cset
+
     def add(self, obj):
 
         """
@@ -85,6 +156,7 @@ class contentsSet(object):
                 "%s is frozen; no add functionality" % self.__class__)
         if not fs.isfs_obj(obj):
             raise TypeError("'%s' is not a fs.fsBase class" % str(obj))
+        self._track_add(obj.location)
         self._dict[obj.location] = obj
 
     def __delitem__(self, obj):
@@ -102,18 +174,20 @@ class contentsSet(object):
             raise AttributeError(
                 "%s is frozen; no remove functionality" % self.__class__)
         if fs.isfs_obj(obj):
-            del self._dict[obj.location]
+            location = obj.location
         else:
-            del self._dict[normpath(obj)]
+            location = normpath(obj)
+        self._track_remove(location)
+        del self._dict[location]
 
     def remove(self, obj):
         del self[obj]
 
     def discard(self, obj):
         if fs.isfs_obj(obj):
-            self._dict.pop(obj.location, None)
-        else:
-            self._dict.pop(obj, None)
+            obj = obj.location
+        self._track_remove(obj)
+        self._dict.pop(obj, None)
 
     def __getitem__(self, obj):
         if fs.isfs_obj(obj):
@@ -135,6 +209,9 @@ class contentsSet(object):
             raise AttributeError(
                 "%s is frozen; no clear functionality" % self.__class__)
         self._dict.clear()
+        if self._sorted is not None:
+            self._sorted = []
+            self._sorted_added, self._sorted_removed = set(), set()
 
     @staticmethod
     def _convert_loc(iterable):
@@ -154,6 +231,13 @@ class contentsSet(object):
             yield x
 
     def difference(self, other):
+        if isinstance(other, contentsSet):
+            d = self._dict
+            locations = [loc for loc, in_self, in_other in _sorted_merge(
+                self._sorted_locations(), other._sorted_locations())
+                if not in_other]
+            return self._from_sorted(((loc, d[loc]) for loc in locations),
+                locations, self.mutable)
         if not hasattr(other, '__contains__'):
             other = set(self._convert_loc(other))
         return contentsSet((x for x in self if x.location not in other),
@@ -163,19 +247,35 @@ class contentsSet(object):
         if not self.mutable:
             raise TypeError("%r isn't mutable" % self)
 
+        if isinstance(other, contentsSet):
+            d = self._dict
+            for loc in other._dict:
+                if loc in d:
+                    self._track_remove(loc)
+                    del d[loc]
+            return
         rem = self.remove
         for x in other:
             if x in self:
                 rem(x)
 
     def intersection(self, other):
+        if isinstance(other, contentsSet):
+            d = other._dict
+            locations = [loc for loc, in_self, in_other in _sorted_merge(
+                self._sorted_locations(), other._sorted_locations())
+                if in_self and in_other]
+            return self._from_sorted(((loc, d[loc]) for loc in locations),
+                locations, self.mutable)
         return contentsSet((x for x in other if x in self),
             mutable=self.mutable)
 
     def intersection_update(self, other):
         if not self.mutable:
             raise TypeError("%r isn't mutable" % self)
-        if not hasattr(other, '__contains__'):
+        if isinstance(other, contentsSet):
+            other = other._dict
+        elif not hasattr(other, '__contains__'):
             other = set(self._convert_loc(other))
 
         l = [x for x in self if x.location not in other]
@@ -183,16 +283,25 @@ class contentsSet(object):
             self.remove(x)
 
     def issubset(self, other):
+        if isinstance(other, contentsSet):
+            return all(in_other for loc, in_self, in_other in _sorted_merge(
+                self._sorted_locations(), other._sorted_locations()))
         if not hasattr(other, '__contains__'):
             other = set(self._convert_loc(other))
         return all(x in other for x in self._dict)
 
     def issuperset(self, other):
+        if isinstance(other, contentsSet):
+            return other.issubset(self)
         if not hasattr(other, '__contains__'):
             other = set(self._convert_loc(other))
         return all(x in self for x in other)
 
     def isdisjoint(self, other):
+        if isinstance(other, contentsSet):
+            return not any(in_self and in_other
+                for loc, in_self, in_other in _sorted_merge(
+                    self._sorted_locations(), other._sorted_locations()))
         if not hasattr(other, '__contains__'):
             other = set(self._convert_loc(other))
         return not any(x in other for x in self._dict)
@@ -209,6 +318,15 @@ class contentsSet(object):
         return len(self._dict)
 
     def symmetric_difference(self, other):
+        if isinstance(other, contentsSet):
+            sd, od = self._dict, other._dict
+            locations, objs = [], []
+            for loc, in_self, in_other in _sorted_merge(
+                    self._sorted_locations(), other._sorted_locations()):
+                if in_self != in_other:
+                    locations.append(loc)
+                    objs.append((loc, (sd if in_self else od)[loc]))
+            return self._from_sorted(objs, locations, self.mutable)
         c = contentsSet(mutable=True)
         c.update(self)
         c.symmetric_difference_update(other)
@@ -235,7 +353,13 @@ class contentsSet(object):
 
     def update(self, iterable):
         d = self._dict
+        if self._sorted is None:
+            for x in iterable:
+                d[x.location] = x
+            return
+        track = self._track_add
         for x in iterable:
+            track(x.location)
             d[x.location] = x
 
     def iterfiles(self, invert=False):
@@ -311,7 +435,10 @@ class contentsSet(object):
     def clone(self, empty=False):
         if empty:
             return self.__class__([], mutable=True)
-        return self.__class__(self._dict.itervalues(), mutable=True)
+        cset = self.__class__(self._dict.itervalues(), mutable=True)
+        if self._sorted is not None:
+            cset._sorted = list(self._sorted_locations())
+        return cset
 
     def insert_offset(self, offset):
         cset = self.clone(empty=True)
@@ -335,11 +462,21 @@ class contentsSet(object):
                 start_point = start_point.target
             else:
                 start_point = start_point.location
-        for x in self:
-            cn_path = normpath(start_point).rstrip(path.sep) + path.sep
-            # what about sym targets?
-            if x.location.startswith(cn_path):
-                yield x
+        cn_path = normpath(start_point).rstrip(path.sep) + path.sep
+        # what about sym targets?
+        if isinstance(self._dict, OrderedDict):
+            # preserve the ordering.
+            for x in self:
+                if x.location.startswith(cn_path):
+                    yield x
+            return
+        # children are a contiguous range of the sorted locations.
+        locations = self._sorted_locations()
+        d = self._dict
+        for loc in islice(locations, bisect_left(locations, cn_path), None):
+            if not loc.startswith(cn_path):
+                break
+            yield d[loc]
 
     def child_nodes(self, start_point):
         """Return a clone of this instance, w/ just the child nodes returned
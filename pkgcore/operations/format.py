@@ -15,7 +15,10 @@ from snakeoil import klass
 from snakeoil import demandload
 demandload.demandload(globals(),
     'pkgcore:fetch@_fetch_module',
+    'pkgcore.fetch:verify',
+    'snakeoil.chksum:get_handlers',
     'snakeoil.lists:iflatten_instance',
+    'snakeoil.osutils:pjoin',
 )
 
 
@@ -30,11 +33,29 @@ class fetch_base(object):
         self.fetcher = fetcher
 
     def fetch_all(self, observer):
+        self._verify_existing()
         for fetchable in self.fetchables:
             if not self.fetch_one(fetchable, observer):
                 return False
         return True
 
+    def _verify_existing(self):
+        # checksum the files already on disk in parallel; the fetcher's own
+        # verification of each then just hits the chksum cache.
+        if self.fetcher is None:
+            return
+        storage = self.fetcher.get_storage_path()
+        if storage is None:
+            return
+        known = get_handlers()
+        items = []
+        for fetchable in self.fetchables:
+            chfs = [x for x in fetchable.chksums if x != 'size' and x in known]
+            if chfs:
+                items.append((pjoin(storage, fetchable.filename), chfs))
+        if len(items) > 1:
+            verify.get_chksums_many(items, ignore_errors=True)
+
     def fetch_one(self, fetchable, observer):
         if fetchable.filename in self._basenames:
             return True
@@ -1,49 +1,395 @@
 # Copyright: 2011 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD 3 clause
 
+import os
+import threading
 import time
+from itertools import chain
+from pkgcore.os_data import portage_gid
 from snakeoil import compatibility
+from snakeoil.currying import partial
 from snakeoil.demandload import demandload
 demandload(globals(),
     'pkgcore.util.thread_pool:map_async',
+    'pkgcore.util:process_pool',
+    'pkgcore.ebuild:processor,processor_driver',
+    'pkgcore.log:logger',
+    'snakeoil.fileutils:AtomicWriteFile',
+    'snakeoil.osutils:ensure_dirs,pjoin',
+    'errno',
 )
 
 
-def regen_iter(iterable, regen_func, observer, is_thread=False):
+class regen_timings(object):
+
+    """
+    per package metadata regeneration times, persisted to a file
+
+    Used to estimate how long a package's regeneration will take, so the
+    slowest packages can be started first.
+    """
+
+    magic = 'pkgcore regen timings 1'
+
+    def __init__(self, location=None):
+        """
+        :param location: file path to persist the timings in; if None,
+            they're kept only in memory
+        """
+        self.location = location
+        self._data = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if location is not None:
+            self._read()
+
+    def _read(self):
+        try:
+            with open(self.location, 'r') as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    return
+                for line in f:
+                    line = line.split()
+                    if len(line) != 2:
+                        continue
+                    try:
+                        self._data[line[0]] = float(line[1])
+                    except ValueError:
+                        continue
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading regen timings %r: %s",
+                    self.location, e)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def record(self, key, elapsed):
+        with self._lock:
+            self._data[key] = elapsed
+            self._dirty = True
+
+    def default_time(self):
+        """estimate for packages lacking a recorded time; the median"""
+        if not self._data:
+            return 1.0
+        l = sorted(self._data.itervalues())
+        return l[len(l) // 2]
+
+    def commit(self):
+        """write the timings out if they were modified"""
+        if self.location is None or not self._dirty:
+            return
+        self._dirty = False
+        f = None
+        try:
+            if not ensure_dirs(os.path.dirname(self.location),
+                               gid=portage_gid, mode=0775):
+                return
+            f = AtomicWriteFile(self.location, gid=portage_gid, perms=0664)
+            f.write("%s\n" % (self.magic,))
+            for key, val in sorted(self._data.iteritems()):
+                f.write("%s %r\n" % (key, val))
+            f.close()
+        except EnvironmentError as e:
+            if f is not None:
+                f.discard()
+            # not being root is the norm for readonly usage; stay quiet.
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.warning("unable to update regen timings %r: %s",
+                    self.location, e)
+
+
+def _default_location(repo, suffix):
+    location = getattr(repo, 'location', None)
+    if location is None:
+        return None
+    return pjoin("/var/cache/edb/dep",
+        location.lstrip("/").rstrip("/") + suffix)
+
+
+def default_timings_location(repo):
+    """location regen timings for a repo are stored in by default"""
+    return _default_location(repo, ".regen-timings")
+
+
+def default_eclass_index_location(repo):
+    """
+    location the :obj:`pkgcore.ebuild.eclass_index.EclassIndex` for a repo
+    is stored in by default
+    """
+    return _default_location(repo, ".eclass-index")
+
+
+def default_revdep_index_location(repo):
+    """
+    location the :obj:`pkgcore.ebuild.revdep_index.RevdepIndex` for a repo
+    is stored in by default
+    """
+    return _default_location(repo, ".revdep-index")
+
+
+def schedule_regen(pkgs, workers, affinity=None, timings=None):
+    """
+    group and order packages for regeneration across workers
+
+    Packages with the same affinity key (for ebuilds, the eclasses they
+    inherit) are grouped together, so that a group is handled by a single
+    worker- thus a single ebuild processor, which has those eclasses
+    preloaded after the first of them.  Groups are ordered longest first
+    via the estimated regen time of their packages, so that the slowest
+    work isn't what's left running at the end.  Large groups are split so
+    that no single one dominates the run.
+
+    :param pkgs: iterable of packages to regenerate
+    :param workers: number of workers the groups will be spread across
+    :param affinity: if not None, callable returning a hashable key for a
+        package
+    :param timings: if not None, :obj:`regen_timings` instance to estimate
+        regen times from
+    :return: list of lists of packages
+    """
+    if timings is None:
+        timings = regen_timings()
+    default = timings.default_time()
+
+    buckets = {}
+    total = 0.0
+    for pkg in pkgs:
+        cost = timings.get(pkg.cpvstr, default)
+        total += cost
+        key = None
+        if affinity is not None:
+            key = affinity(pkg)
+        buckets.setdefault(key, []).append((cost, pkg))
+
+    # leave enough groups around to balance the tail across the workers.
+    limit = total
+    if workers > 1:
+        limit = total / (workers * 4)
+    groups = []
+    for bucket in buckets.itervalues():
+        bucket.sort(key=lambda x: x[0], reverse=True)
+        group, group_cost = [], 0.0
+        for cost, pkg in bucket:
+            if group and group_cost + cost > limit:
+                groups.append((group_cost, group))
+                group, group_cost = [], 0.0
+            group.append(pkg)
+            group_cost += cost
+        groups.append((group_cost, group))
+
+    groups.sort(key=lambda x: x[0], reverse=True)
+    return [group for cost, group in groups]
+
+
+def regen_iter(iterable, regen_func, observer, is_thread=False, timings=None,
+               results=None):
     for x in iterable:
+        start = time.time()
         try:
-            regen_func(x)
+            ret = regen_func(x)
         except compatibility.IGNORED_EXCEPTIONS as e:
             if isinstance(e, KeyboardInterrupt):
                 return
             raise
         except Exception as e:
             observer.error("caught exception %s while processing %s" % (e, x))
+            ret = None
+        if timings is not None:
+            timings.record(x.cpvstr, time.time() - start)
+        if results is not None:
+            results[x.cpvstr] = ret
+
+
+def regen_groups_iter(groups, *args, **kwds):
+    """:obj:`regen_iter` variant consuming groups of packages"""
+    return regen_iter(chain.from_iterable(groups), *args, **kwds)
+
+
+def regen_multiplexed(groups, helpers, observer, timings=None, results=None):
+    """
+    regenerate packages with all of the helpers' processors driven from
+    this thread via a :obj:`pkgcore.ebuild.processor_driver.ProcessorDriver`
+
+    :param groups: lists of packages, per :obj:`schedule_regen`; a helper
+        works through a group before taking on another
+    :param helpers: repo regen helpers, supporting start(pkg, driver)
+    """
+    driver = processor_driver.ProcessorDriver()
+    groups = iter(groups)
+    pending = {}
+
+    def finished(request, pkg, start):
+        ret = None
+        if request is not None:
+            try:
+                ret = request.result()
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                observer.error("caught exception %s while processing %s" %
+                    (e, pkg))
+        if timings is not None:
+            timings.record(pkg.cpvstr, time.time() - start)
+        if results is not None:
+            results[pkg.cpvstr] = ret
+
+    def submit(helper, pkgs):
+        # start the helper on its next package; those that didn't need the
+        # processor are handled immediately.
+        while True:
+            pkg = next(pkgs, None)
+            while pkg is None:
+                group = next(groups, None)
+                if group is None:
+                    return
+                pkgs = iter(group)
+                pkg = next(pkgs, None)
+            start = time.time()
+            try:
+                request = helper.start(pkg, driver)
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                observer.error("caught exception %s while processing %s" %
+                    (e, pkg))
+                request = None
+            if request is not None and not request.done:
+                pending[request] = (helper, pkgs, pkg, start)
+                return
+            finished(request, pkg, start)
+
+    for helper in helpers:
+        submit(helper, iter(()))
+    for request in driver.iter_completed():
+        helper, pkgs, pkg, start = pending.pop(request)
+        finished(request, pkg, start)
+        submit(helper, pkgs)
 
 
-def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
+def regen_process_iter(iterable, repo, get_helper):
+    """
+    child side of process based regeneration.
+
+    Runs in a forked child; pulls groups of (category, package, fullver)
+    keys from iterable, yielding (cpvstr, elapsed, error, result) for each
+    package processed; error is None unless it failed, result is what the
+    helper returned (None on failure).  The child owns its own
+    ebuild processor, eclass cache, and cache instances- all inherited from
+    the parent at fork time.
+    """
+    # the processors known at fork time belong to the parent; the pipes
+    # are shared, so we must not touch them.
+    processor.forget_all_processors()
+    helper = get_helper()
+    try:
+        for key in chain.from_iterable(iterable):
+            start = time.time()
+            error = result = None
+            try:
+                result = helper(repo[key])
+            except compatibility.IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                error = "caught exception %s while processing %s/%s-%s" % (
+                    (e,) + key)
+            yield ("%s/%s-%s" % key, time.time() - start, error, result)
+    finally:
+        f = getattr(helper, 'finish', None)
+        if f is not None:
+            f()
+        # pending updates are local to this child; write them out.
+        repo.operations.run_if_supported("flush_cache")
+        processor.shutdown_all_processors()
+
+
+def regen_repository(repo, observer, threads=1, pkg_attr='keywords',
+                     processes=None, timings=None, multiplex=None, **options):
+    """
+    :param multiplex: if not None, the number of ebuild processors to drive
+        from this thread via :obj:`regen_multiplexed`, rather than using
+        threads; ignored if processes is given.
+    :param timings: if not None, :obj:`regen_timings` instance used to
+        schedule the slowest packages first when regenerating in parallel;
+        it's updated with the times taken.
+
+    If the repo has a _regen_operation_finish method, it's invoked once
+    done with a mapping of cpvstr -> what the helper returned for each
+    package processed, and the options.
+    """
 
     helpers = []
-    def _get_repo_helper():
+    def _get_repo_helper(track=True):
         if not hasattr(repo, '_regen_operation_helper'):
             return lambda pkg:getattr(pkg, 'keywords')
         # for an actual helper, track it and invoke .finish if it exists.
         helper = repo._regen_operation_helper(**options)
-        helpers.append(helper)
+        if track:
+            helpers.append(helper)
         return helper
 
-    if threads == 1:
+    candidates = getattr(repo, '_regen_operation_candidates', None)
+    if candidates is None:
+        pkgs = repo
+    else:
+        pkgs = candidates(**options)
+
+    finish = getattr(repo, '_regen_operation_finish', None)
+    results = None
+    if finish is not None:
+        results = {}
+
+    if processes or multiplex or threads != 1:
+        groups = schedule_regen(pkgs, processes or multiplex or threads,
+            getattr(repo, '_regen_operation_affinity', None), timings)
+
+    if processes:
+        # parent just streams cpv keys; the helpers are created (and
+        # finished) in the children.
+        groups = [[(pkg.category, pkg.package, pkg.fullver) for pkg in group]
+            for group in groups]
+        for cpv, elapsed, msg, result in process_pool.map_async(groups,
+                regen_process_iter, repo,
+                partial(_get_repo_helper, track=False), processes=processes):
+            if timings is not None:
+                timings.record(cpv, elapsed)
+            if results is not None:
+                results[cpv] = result
+            if msg is not None:
+                observer.error(msg)
+    elif multiplex:
+        # as with threads, fork the processors from a zygote.
+        options.setdefault('zygote', True)
+        repo_helpers = [_get_repo_helper() for x in xrange(multiplex)]
+        if all(hasattr(x, 'start') for x in repo_helpers):
+            regen_multiplexed(groups, repo_helpers, observer, timings=timings,
+                results=results)
+        else:
+            regen_groups_iter(groups, repo_helpers[0], observer,
+                timings=timings, results=results)
+    elif threads == 1:
         def passthru(iterable):
             global count
             for x in iterable:
                 yield x
-        regen_iter(passthru(repo), _get_repo_helper(), observer)
+        regen_iter(passthru(pkgs), _get_repo_helper(), observer,
+            timings=timings, results=results)
     else:
+        # each thread needs its own processor; fork them from a zygote
+        # rather than paying for a full daemon init per thread.
+        options.setdefault('zygote', True)
         def get_args():
-            return (_get_repo_helper(), observer, True)
-        map_async(repo, regen_iter, per_thread_args=get_args)
+            return (_get_repo_helper(), observer, True, timings, results)
+        map_async(groups, regen_groups_iter, per_thread_args=get_args,
+            threads=threads)
 
     for helper in helpers:
         f = getattr(helper, 'finish', None)
         if f is not None:
             f()
+
+    if timings is not None:
+        timings.commit()
+    if finish is not None:
+        finish(results, **options)
@@ -213,6 +213,7 @@ class operations(sync_operations):
     def _cmd_api_regen_cache(self, observer=None, threads=1, **options):
         if getattr(self, '_regen_disable_threads', False):
             threads = 1
+            options.pop('processes', None)
         cache = getattr(self.repo, 'cache', None)
         sync_rate = getattr(cache, 'sync_rate', None)
         try:
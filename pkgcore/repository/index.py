@@ -0,0 +1,131 @@
+# License: GPL2/BSD
+
+"""
+persistent, directory mtime validated index of repository listings
+
+Repositories laid out on disk (ebuild trees, the vdb) derive their
+categories/packages/versions from directory listings.  This caches those
+listings across runs; each entry is keyed by the directory it was derived
+from, and is only reused while that directory's mtime is unchanged- thus
+only the modified parts of the repository are rescanned.
+"""
+
+__all__ = ("DirectoryIndex",)
+
+import os
+import time
+
+from pkgcore.os_data import portage_gid
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs
+from snakeoil import klass
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'errno',
+    'pkgcore.log:logger',
+    'pkgcore:spawn',
+)
+
+
+class DirectoryIndex(object):
+
+    """
+    mapping of key -> (directory mtime, listing), persisted to a file
+
+    The file is written out at exit if anything changed, or when
+    :obj:`commit` is invoked.
+    """
+
+    magic = 'pkgcore directory index 1'
+
+    # directories modified within this many seconds of being listed aren't
+    # stored; a modification in the same mtime granularity window would
+    # otherwise go unnoticed.
+    racy_window = 1
+
+    def __init__(self, location):
+        """
+        :param location: file path to store the index in
+        """
+        self.location = location
+        self._dirty = False
+
+    @klass.jit_attr
+    def _data(self):
+        return self._read()
+
+    def _read(self):
+        d = {}
+        try:
+            with open(self.location, 'r') as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    return d
+                for line in f:
+                    line = line.rstrip('\n').split('\t')
+                    if len(line) < 2:
+                        continue
+                    try:
+                        d[line[0]] = (float(line[1]), tuple(line[2:]))
+                    except ValueError:
+                        continue
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading index %r: %s", self.location, e)
+        return d
+
+    def get(self, key, path, listing_func):
+        """
+        return the listing for key, reusing the stored one if valid
+
+        :param key: string key; must not contain tabs or newlines
+        :param path: directory the listing is derived from
+        :param listing_func: callable returning the listing (a sequence of
+            strings) if the stored one is missing or stale
+        :return: tuple of strings
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except EnvironmentError:
+            # let the listing function raise whatever it normally would.
+            return tuple(listing_func())
+        entry = self._data.get(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        val = tuple(listing_func())
+        if mtime < time.time() - self.racy_window:
+            self._data[key] = (mtime, val)
+            self._mark_dirty()
+        return val
+
+    def invalidate(self, key):
+        if self._data.pop(key, None) is not None:
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        if not self._dirty:
+            self._dirty = True
+            spawn.atexit_register(self.commit)
+
+    def commit(self):
+        """write the index out if it was modified"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        f = None
+        try:
+            if not ensure_dirs(os.path.dirname(self.location),
+                               gid=portage_gid, mode=0775):
+                return
+            f = AtomicWriteFile(self.location, gid=portage_gid, perms=0664)
+            f.write("%s\n" % (self.magic,))
+            for key, (mtime, val) in sorted(self._data.iteritems()):
+                f.write("%s\t%r%s\n" % (key, mtime,
+                    ''.join('\t' + x for x in val)))
+            f.close()
+        except EnvironmentError as e:
+            if f is not None:
+                f.discard()
+            # not being root is the norm for query usage; stay quiet.
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.warning("unable to update index %r: %s",
+                    self.location, e)
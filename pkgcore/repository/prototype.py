@@ -9,14 +9,44 @@ __all__ = ("CategoryIterValLazyDict", "PackageMapping", "VersionMapping",
     "tree")
 
 from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import ver_key
 from pkgcore.restrictions import values, boolean, restriction, packages
 from pkgcore.restrictions.util import collect_package_restrictions
+from pkgcore.restrictions.compiler import compile_match, cache_key
 
 from snakeoil.mappings import LazyValDict, DictMixin
 from snakeoil.lists import iflatten_instance
 from snakeoil.compatibility import is_py3k
 from pkgcore.operations import repo
 
+# restriction -> category/package restrictions of each dnf solution; the
+# expansion is costly, and the same queries tend to be repeated.
+_dnf_cache = {}
+_dnf_cache_size = 512
+
+def _get_dnf_solutions(restrict):
+    try:
+        key = cache_key(restrict)
+    except (TypeError, RuntimeError):
+        # unhashable (not finalized), or too deeply nested; don't cache it.
+        key = None
+    else:
+        dsolutions = _dnf_cache.get(key)
+        if dsolutions is not None:
+            return dsolutions
+    dsolutions = [
+        ([c.restriction
+          for c in collect_package_restrictions(x, ("category",))],
+         [p.restriction
+          for p in collect_package_restrictions(x, ("package",))])
+        for x in restrict.iter_dnf_solutions(True)]
+    if key is not None:
+        if len(_dnf_cache) >= _dnf_cache_size:
+            _dnf_cache.clear()
+        _dnf_cache[key] = dsolutions
+    return dsolutions
+
+
 class IterValLazyDict(LazyValDict):
 
     __slots__ = ()
@@ -86,12 +116,22 @@ class PackageMapping(DictMixin):
             pass
 
 
+def fullver_key(fullver):
+    """sort key for a version string, revision included"""
+    version, sep, rev = fullver.partition('-r')
+    return ver_key(version, int(rev) if rev else None)
+
+
 class VersionMapping(DictMixin):
 
-    def __init__(self, parent_mapping, pull_vals):
+    def __init__(self, parent_mapping, pull_vals, sort_key=None):
+        """
+        :param sort_key: if not None, versions are stored sorted by this key
+        """
         self._cache = {}
         self._parent = parent_mapping
         self._pull_vals = pull_vals
+        self._sort_key = sort_key
 
     def __getitem__(self, key):
         o = self._cache.get(key)
@@ -100,6 +140,8 @@ class VersionMapping(DictMixin):
         if not key[1] in self._parent.get(key[0], ()):
             raise KeyError(key)
         val = self._pull_vals(key)
+        if self._sort_key is not None:
+            val = tuple(sorted(val, key=self._sort_key))
         self._cache[key] = val
         return val
 
@@ -110,6 +152,8 @@ class VersionMapping(DictMixin):
 
     def force_regen(self, key, val):
         if val:
+            if self._sort_key is not None:
+                val = tuple(sorted(val, key=self._sort_key))
             self._cache[key] = val
         else:
             self._cache.pop(key, None)
@@ -131,6 +175,8 @@ class tree(object):
         __init__
     :ivar aliases: dictionary of known aliases for this repository.  This is
         typically {repo_id:said_id, location:on-disk-path}.
+    :ivar sorted_versions: bool controlling whether versions are stored
+        sorted lowest to highest
     """
 
     raw_repo = None
@@ -139,6 +185,7 @@ class tree(object):
     configured = True
     configure = None
     frozen_settable = True
+    sorted_versions = False
     operations_kls = repo.operations
 
 
@@ -150,7 +197,8 @@ class tree(object):
         self.categories = CategoryIterValLazyDict(
             self._get_categories, self._get_categories)
         self.packages = PackageMapping(self.categories, self._get_packages)
-        self.versions = VersionMapping(self.packages, self._get_versions)
+        self.versions = VersionMapping(self.packages, self._get_versions,
+            fullver_key if self.sorted_versions else None)
 
         if self.frozen_settable:
             self.frozen = frozen
@@ -234,7 +282,7 @@ class tree(object):
             candidates = self._identify_candidates(restrict, sorter)
 
         if force is None:
-            match = restrict.match
+            match = compile_match(restrict)
         elif force:
             match = restrict.force_True
         else:
@@ -266,12 +314,7 @@ class tree(object):
 
         if not isinstance(restrict, boolean.base) or isinstance(restrict, atom):
             return self._fast_identify_candidates(restrict, sorter)
-        dsolutions = [
-            ([c.restriction
-              for c in collect_package_restrictions(x, ("category",))],
-             [p.restriction
-              for p in collect_package_restrictions(x, ("package",))])
-            for x in restrict.iter_dnf_solutions(True)]
+        dsolutions = _get_dnf_solutions(restrict)
 
         # see if any solution state isn't dependent on cat/pkg in anyway.
         # if so, search whole search space.
@@ -9,6 +9,7 @@ __all__ = ("filterTree",)
 
 from pkgcore.repository import prototype, errors
 from pkgcore.restrictions.restriction import base
+from pkgcore.restrictions.compiler import compile_match
 from pkgcore.operations.repo import operations_proxy
 from snakeoil.klass import GetAttrProxy
 # these tricks are to keep 2to3 from screwing up.
@@ -33,6 +34,7 @@ class filterTree(prototype.tree):
             raise errors.InitializationError(
                 "%s is not a restriction" % (restriction,))
         self.restriction = restriction
+        self._match = compile_match(restriction)
         self.raw_repo = repo
         if sentinel_val:
             self._filterfunc = ifilter
@@ -45,7 +47,7 @@ class filterTree(prototype.tree):
         # the repo, determine what can be done without cost
         # (determined by repo's attributes) versus what does cost
         # (metadata pull for example).
-        return self._filterfunc(self.restriction.match,
+        return self._filterfunc(self._match,
             self.raw_repo.itermatch(restrict, **kwds))
 
 
@@ -62,7 +64,7 @@ class filterTree(prototype.tree):
 
     def __getitem__(self, key):
         v = self.raw_repo[key]
-        if self.restriction.match(v) != self.sentinel_val:
+        if self._match(v) != self.sentinel_val:
             raise KeyError(key)
         return v
 
@@ -16,7 +16,6 @@ from pkgcore.resolver import state
 from pkgcore.ebuild import atom as _atom
 
 from snakeoil.currying import partial
-from snakeoil.compatibility import cmp, sort_cmp
 from snakeoil.iterables import caching_iter
 
 
@@ -30,52 +29,44 @@ def dprint(handle, fmt, args=None, label=None):
 
 
 #iter/pkg sorting functions for selection strategy
-pkg_sort_highest = partial(sorted, reverse=True)
-pkg_sort_lowest = sorted
+def _sort_key(x):
+    # categories and package names are passed through the sorters too.
+    return getattr(x, 'sort_key', x)
+
+pkg_sort_highest = partial(sorted, key=_sort_key, reverse=True)
+pkg_sort_lowest = partial(sorted, key=_sort_key)
 
 pkg_grabber = operator.itemgetter(0)
 
 def highest_iter_sort(l, pkg_grabber=pkg_grabber):
     """Sort a list of packages from highest to lowest.
 
+    For equal versions, livefs packages sort first.
+
     :param l: list of packages
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return 1
-        elif y.repo.livefs:
-            return -1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber, reverse=True)
+    def f(x):
+        pkg = pkg_grabber(x)
+        return pkg.sort_key, bool(getattr(pkg.repo, 'livefs', False))
+    l.sort(key=f, reverse=True)
     return l
 
 
 def lowest_iter_sort(l, pkg_grabber=pkg_grabber):
     """Sort a list of packages from lowest to highest.
 
+    For equal versions, livefs packages sort first.
+
     :param l: list of packages
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return -1
-        elif y.repo.livefs:
-            return 1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber)
+    def f(x):
+        pkg = pkg_grabber(x)
+        return pkg.sort_key, not getattr(pkg.repo, 'livefs', False)
+    l.sort(key=f)
     return l
 
 
@@ -0,0 +1,195 @@
+# License: GPL2/BSD
+
+"""
+opt-in instrumentation of a resolver's hot paths
+
+Attaching a :obj:`resolver_profiler` to a
+:obj:`pkgcore.resolver.plan.merge_plan` instance records where resolution
+spends its time: per atom timings and frame depth, queries against each
+of the plan's dbs (and how many were answered from its query cache), and
+backtracking of the plan state.  Nothing is recorded (nor any overhead
+added) unless a profiler is attached.
+
+The results are available via :obj:`resolver_profiler.report`, or written
+out as json or in the collapsed stack format used by flamegraph tools.
+"""
+
+__all__ = ("resolver_profiler",)
+
+from time import time
+
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'json',
+)
+
+
+class _atom_stats(object):
+
+    __slots__ = ("calls", "total", "self_time", "max_depth")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = self.self_time = 0.0
+        self.max_depth = 0
+
+
+class _db_stats(object):
+
+    __slots__ = ("name", "queries", "hits")
+
+    def __init__(self, name):
+        self.name = name
+        self.queries = self.hits = 0
+
+
+class resolver_profiler(object):
+
+    """
+    records timings and counters for a :obj:`merge_plan` instance
+
+    >>> profiler = resolver_profiler()
+    >>> profiler.attach(resolver_inst)
+    >>> resolver_inst.add_atoms(atoms)
+    >>> profiler.write_json(open("profile.json", "w"))
+    """
+
+    def __init__(self, timer=time):
+        """
+        :param timer: callable returning the current time in seconds
+        """
+        self.timer = timer
+        self.atoms = {}
+        self.dbs = []
+        # collapsed stack (tuple of atom strings) -> time spent in that
+        # frame itself, excluding its children.
+        self.stacks = {}
+        self.backtracks = 0
+        self.reverted = 0
+        self.start = self.finish = None
+        # current frames; list of [atom string, start, child time]
+        self._frames = []
+
+    def attach(self, plan):
+        """
+        instrument a merge_plan instance
+
+        :param plan: :obj:`pkgcore.resolver.plan.merge_plan` instance
+        """
+        plan._rec_add_atom = self._wrap_rec_add_atom(plan._rec_add_atom)
+        plan.state.backtrack = self._wrap_backtrack(plan.state)
+        for db in plan.all_raw_dbs:
+            stats = _db_stats(str(getattr(db, 'raw_repo', db)))
+            self.dbs.append(stats)
+            db.match = self._wrap_match(db, stats)
+
+    def _wrap_rec_add_atom(self, func):
+        frames = self._frames
+        timer = self.timer
+        atoms = self.atoms
+        stacks = self.stacks
+        def _rec_add_atom(atom, stack, dbs, **kwds):
+            key = str(atom)
+            start = timer()
+            if self.start is None:
+                self.start = start
+            frames.append([key, start, 0.0])
+            try:
+                return func(atom, stack, dbs, **kwds)
+            finally:
+                end = timer()
+                key, start, child_time = frames.pop()
+                elapsed = end - start
+                stats = atoms.get(key)
+                if stats is None:
+                    stats = atoms[key] = _atom_stats()
+                stats.calls += 1
+                stats.total += elapsed
+                stats.self_time += elapsed - child_time
+                stats.max_depth = max(stats.max_depth, len(frames))
+                path = tuple(x[0] for x in frames) + (key,)
+                stacks[path] = stacks.get(path, 0.0) + (elapsed - child_time)
+                if frames:
+                    frames[-1][2] += elapsed
+                self.finish = end
+        return _rec_add_atom
+
+    def _wrap_backtrack(self, plan_state):
+        func = plan_state.backtrack
+        def backtrack(state_pos):
+            reverting = len(plan_state.plan) - state_pos
+            if reverting:
+                self.backtracks += 1
+                self.reverted += reverting
+            return func(state_pos)
+        return backtrack
+
+    def _wrap_match(self, db, stats):
+        func = db.match
+        # caching_repo exposes its query cache; if this isn't one, every
+        # query is a miss.
+        cache = getattr(db, '__cache__', {})
+        def match(restrict):
+            stats.queries += 1
+            if restrict in cache:
+                stats.hits += 1
+            return func(restrict)
+        return match
+
+    def report(self):
+        """
+        :return: dict of the recorded data, suitable for serializing as json
+        """
+        total = 0.0
+        if self.start is not None:
+            total = self.finish - self.start
+        atoms = [{"atom": atom, "calls": stats.calls, "total": stats.total,
+                  "self": stats.self_time, "max_depth": stats.max_depth}
+                 for atom, stats in self.atoms.iteritems()]
+        atoms.sort(key=lambda x: (-x["total"], x["atom"]))
+        dbs = []
+        for stats in self.dbs:
+            ratio = 0.0
+            if stats.queries:
+                ratio = stats.hits / float(stats.queries)
+            dbs.append({"db": stats.name, "queries": stats.queries,
+                "cache_hits": stats.hits,
+                "itermatch_calls": stats.queries - stats.hits,
+                "cache_hit_ratio": ratio})
+        return {
+            "total_time": total,
+            "max_depth": max([x["max_depth"] for x in atoms] or [0]),
+            "backtracks": {"count": self.backtracks,
+                "reverted_ops": self.reverted},
+            "atoms": atoms,
+            "dbs": dbs,
+        }
+
+    def write_json(self, handle):
+        json.dump(self.report(), handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+    def write_flamegraph(self, handle):
+        """
+        write collapsed stacks; one ``frame;frame;frame count`` line per stack
+
+        Counts are in microseconds.
+        """
+        for path, elapsed in sorted(self.stacks.iteritems()):
+            # ';' delimits frames; spaces delimit the count.
+            frames = ';'.join(x.replace(';', ':').replace(' ', '_')
+                for x in path)
+            handle.write("%s %i\n" % (frames, int(elapsed * 1000000)))
+
+    formats = {"json": write_json, "flamegraph": write_flamegraph}
+
+    def write(self, handle, format="json"):
+        """
+        :param format: either json or flamegraph
+        """
+        try:
+            f = self.formats[format]
+        except KeyError:
+            raise ValueError("unknown profile format %r; valid formats: %s"
+                % (format, ', '.join(sorted(self.formats))))
+        f(self, handle)
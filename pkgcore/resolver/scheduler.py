@@ -0,0 +1,204 @@
+# License: GPL2/BSD
+
+"""
+dependency aware, parallel execution of a resolver's plan
+
+Builds of independent packages are run concurrently; merges are always
+done serially, in plan order, from the calling thread.  A package's build
+is started once every earlier op of the plan it depends upon (build or
+runtime) has been merged- since merges are in plan order, this means its
+whole dependency graph is in place just as it would be for a serial run.
+
+Each build runs in its own thread rather than being driven through
+:obj:`pkgcore.ebuild.processor_driver.ProcessorDriver`.  A build is the
+package's whole chain of format operations (fetching, phases with their
+own command handlers, staging of the image), written as blocking calls;
+its thread spends nearly all of its time waiting on its ebuild daemon, and
+there are at most ``jobs`` of them.  The driver pays off for many short
+requests, such as metadata regeneration, not for a few long builds.
+"""
+
+__all__ = ("op_dependencies", "build_scheduler")
+
+import os
+import sys
+import threading
+from Queue import Queue, Empty
+
+from snakeoil.compatibility import IGNORED_EXCEPTIONS
+from snakeoil.lists import iflatten_instance
+from pkgcore.restrictions import restriction
+from pkgcore.ebuild.atom import atom as atom_kls
+
+
+def _dep_restricts(op):
+    choices = op.choices
+    if choices is not None and choices.matches_cur is op.pkg:
+        # the resolver's evaluation for the chosen pkg.
+        cnfs = (choices.depends, choices.rdepends)
+    else:
+        cnfs = (op.pkg.depends.cnf_solutions(),
+            op.pkg.rdepends.cnf_solutions())
+    for cnf in cnfs:
+        for x in iflatten_instance(cnf, (restriction.base,)):
+            if not getattr(x, 'blocks', False):
+                yield x
+
+
+def op_dependencies(ops):
+    """
+    compute which earlier ops each op depends upon
+
+    Dependencies upon later ops (cycles, post_rdepends) are ignored, as
+    they'd be for a serial run; removals are treated as dependencies of
+    every op that follows them.
+
+    :param ops: sequence of resolver ops, in plan order
+    :return: list of frozensets of op indexes, one per op
+    """
+    by_key = {}
+    removals = []
+    results = []
+    for idx, op in enumerate(ops):
+        deps = set(removals)
+        if op.desc != 'remove':
+            for restrict in _dep_restricts(op):
+                if isinstance(restrict, atom_kls):
+                    candidates = by_key.get(restrict.key, ())
+                else:
+                    # can't narrow it down; check everything prior.
+                    candidates = xrange(idx)
+                for dep_idx in candidates:
+                    if dep_idx not in deps and \
+                            restrict.match(ops[dep_idx].pkg):
+                        deps.add(dep_idx)
+            by_key.setdefault(op.pkg.key, []).append(idx)
+        else:
+            removals.append(idx)
+        results.append(frozenset(deps))
+    return results
+
+
+class build_scheduler(object):
+
+    """
+    run builds of a plan's ops in parallel, merging them in plan order
+
+    build is invoked with an op, and must return a tuple of (success,
+    result); merge is invoked in the calling thread with the op and the
+    result, and must return a boolean for success.  If a build fails,
+    on_failure (if given) is invoked with the op and the result instead.
+    """
+
+    def __init__(self, ops, build, merge, jobs=1, load_average=None,
+                 fail_fast=True, on_failure=None, deps=None):
+        """
+        :param ops: sequence of resolver ops, in plan order
+        :param build: callable to build an op; see the class docstring
+        :param merge: callable to merge a built op; see the class docstring
+        :param jobs: maximum number of builds to run concurrently
+        :param load_average: if not None, don't start additional builds
+            while the system's load average is at or above this value
+        :param fail_fast: if True, a failed build or merge stops scheduling
+            further builds; else dependents of it proceed as if it
+            succeeded
+        :param on_failure: callable invoked for failed builds; see the
+            class docstring
+        :param deps: if given, the results of :obj:`op_dependencies`
+        """
+        self.ops = ops
+        self.build = build
+        self.merge = merge
+        self.jobs = max(int(jobs), 1)
+        self.load_average = load_average
+        self.fail_fast = fail_fast
+        self.on_failure = on_failure
+        if deps is None:
+            deps = op_dependencies(ops)
+        self.deps = deps
+        self.failures = []
+
+    def _load_ok(self, running):
+        if self.load_average is None or not running:
+            return True
+        try:
+            return os.getloadavg()[0] < self.load_average
+        except (AttributeError, OSError):
+            return True
+
+    def _run_build(self, idx, queue):
+        try:
+            queue.put((idx, self.build(self.ops[idx]), None))
+        except IGNORED_EXCEPTIONS:
+            queue.put((idx, None, sys.exc_info()))
+            raise
+        except Exception:
+            queue.put((idx, None, sys.exc_info()))
+
+    def run(self):
+        """
+        :return: True if everything built and merged, False otherwise
+        """
+        ops, deps = self.ops, self.deps
+        pending = range(len(ops))
+        running = set()
+        built = {}
+        merged = set()
+        next_merge = 0
+        queue = Queue()
+
+        while next_merge < len(ops):
+            # start everything we can.
+            for idx in pending[:]:
+                if len(running) >= self.jobs or not self._load_ok(running):
+                    break
+                if not deps[idx].issubset(merged):
+                    continue
+                pending.remove(idx)
+                if self.jobs == 1:
+                    # no point in threading; keep it in this thread.
+                    built[idx] = self.build(ops[idx])
+                    break
+                running.add(idx)
+                t = threading.Thread(target=self._run_build,
+                    args=(idx, queue))
+                t.daemon = True
+                t.start()
+
+            if next_merge in built:
+                success, result = built.pop(next_merge)
+                if success:
+                    success = self.merge(ops[next_merge], result)
+                elif self.on_failure is not None:
+                    self.on_failure(ops[next_merge], result)
+                if not success:
+                    self.failures.append(ops[next_merge])
+                    if self.fail_fast:
+                        break
+                merged.add(next_merge)
+                next_merge += 1
+                continue
+
+            # poll; a blocking get isn't interruptible, and if the load is
+            # too high we need to recheck it periodically anyways.
+            try:
+                idx, result, exc_info = queue.get(True, 1)
+            except Empty:
+                continue
+            running.discard(idx)
+            if exc_info is not None:
+                self._wait(running, queue)
+                raise exc_info[0], exc_info[1], exc_info[2]
+            built[idx] = result
+
+        self._wait(running, queue)
+        return not self.failures and next_merge == len(ops)
+
+    def _wait(self, running, queue):
+        # let in flight builds finish; their results are discarded.
+        while running:
+            try:
+                idx, result, exc_info = queue.get(True, 1)
+            except Empty:
+                continue
+            running.discard(idx)
@@ -0,0 +1,190 @@
+# License: GPL2/BSD
+
+"""
+compilation of package restriction trees into flat match functions
+
+Matching a restriction tree normally walks it via a method call per node,
+pulling the package attribute anew for each
+:obj:`pkgcore.restrictions.packages.PackageRestriction`.  For queries
+evaluated against large numbers of packages (repository scans, visibility
+filtering) that overhead dominates; :obj:`compile_match` converts the tree
+into a single generated function that short circuits in the same manner,
+inlines and/or nodes, and pulls each distinct attribute at most once per
+package.
+
+Nodes the compiler doesn't know about (atoms, conditionals, custom
+restrictions) are invoked via their own match method, thus the result
+is always identical to ``restrict.match``.
+"""
+
+__all__ = ("compile_match", "cache_key")
+
+from pkgcore.restrictions import boolean, packages, restriction
+
+# maximum number of compiled functions to keep around.
+cache_size = 512
+
+_cache = {}
+
+# classes whose match implementation the compiler replicates; subclasses
+# may override match, thus exact types are required.
+_and_types = frozenset([boolean.AndRestriction])
+_or_types = frozenset([boolean.OrRestriction])
+_attr_types = frozenset([packages.PackageRestriction])
+_bool_types = frozenset([restriction.AlwaysBool])
+
+
+class _compiler(object):
+
+    def __init__(self):
+        self.lines = []
+        self.namespace = {
+            '_sentinel': packages.PackageRestriction.__sentinel__,
+            '_unset': object(),
+        }
+        # attr -> local var holding the pulled value.
+        self.attrs = {}
+        self.count = 0
+
+    def _name(self, prefix):
+        self.count += 1
+        return "%s%i" % (prefix, self.count)
+
+    def _bind(self, prefix, obj):
+        name = self._name(prefix)
+        self.namespace[name] = obj
+        return name
+
+    def emit(self, node, indent):
+        """
+        emit code setting a local to the truth value of node
+
+        :return: the local's name
+        """
+        kls = node.__class__
+        if kls in _and_types or kls in _or_types:
+            return self.emit_boolean(node, indent)
+        pad = '    ' * indent
+        result = self._name('r')
+        if kls in _attr_types:
+            attr = node.attr
+            var = self.attrs.get(attr)
+            if var is None:
+                var = self.attrs[attr] = self._name('a')
+            pull = self._bind('pull', node._pull_attr)
+            match = self._bind('m', node.restriction.match)
+            self.lines.extend([
+                "%sif %s is _unset:" % (pad, var),
+                "%s    %s = %s(pkg)" % (pad, var, pull),
+                "%sif %s is _sentinel:" % (pad, var),
+                "%s    %s = %r" % (pad, result, bool(node.negate)),
+                "%selse:" % (pad,),
+                "%s    %s = %s%s(%s)" % (pad, result,
+                    'not ' if node.negate else '', match, var),
+            ])
+        elif kls in _bool_types:
+            self.lines.append("%s%s = %r" % (pad, result, bool(node.negate)))
+        else:
+            match = self._bind('m', node.match)
+            self.lines.append("%s%s = %s(pkg)" % (pad, result, match))
+        return result
+
+    def emit_boolean(self, node, indent):
+        kls = node.__class__
+        pad = '    ' * indent
+        result = self._name('r')
+        children = list(_flatten(node, kls))
+        # an and is satisfied till a child fails; an or is unsatisfied till
+        # a child matches.  each child is only evaluated if the result
+        # isn't yet decided.
+        is_and = kls in _and_types
+        self.lines.append("%s%s = %r" % (pad, result, is_and))
+        guard = "%sif %s%s:" % (pad, '' if is_and else 'not ', result)
+        for child in children:
+            self.lines.append(guard)
+            child_result = self.emit(child, indent + 1)
+            self.lines.append("%s    %s = %s" % (pad, result, child_result))
+        if node.negate:
+            self.lines.append("%s%s = not %s" % (pad, result, result))
+        return result
+
+    def compile(self, restrict):
+        body_start = len(self.lines)
+        result = self.emit(restrict, 1)
+        body = self.lines[body_start:]
+        lines = ["def match(pkg):"]
+        if self.attrs:
+            lines.append("    %s = _unset" % (' = '.join(sorted(self.attrs.values())),))
+        lines.extend(body)
+        lines.append("    return bool(%s)" % (result,))
+        code = compile('\n'.join(lines) + '\n',
+            '<compiled restriction %r>' % (restrict,), 'exec')
+        namespace = self.namespace
+        exec code in namespace
+        return namespace['match']
+
+
+def _flatten(node, kls):
+    for child in node.restrictions:
+        if child.__class__ is kls and not child.negate:
+            for x in _flatten(child, kls):
+                yield x
+        else:
+            yield child
+
+
+def _is_compilable(restrict):
+    kls = restrict.__class__
+    return kls in _and_types or kls in _or_types or kls in _attr_types
+
+
+def cache_key(restrict):
+    """
+    return a hashable key identifying a restriction tree
+
+    Boolean restrictions compare equal regardless of class (an and is
+    equal to an or of the same restrictions), thus they can't be used as
+    cache keys directly.
+
+    :raise TypeError: if the restriction isn't hashable
+    """
+    if isinstance(restrict, boolean.base) and restrict.__class__ in \
+            (boolean.AndRestriction, boolean.OrRestriction):
+        return (restrict.__class__, restrict.negate, restrict.type,
+            tuple(cache_key(x) for x in restrict.restrictions))
+    hash(restrict)
+    return (restrict.__class__, restrict)
+
+
+def compile_match(restrict):
+    """
+    return a function equivalent to ``restrict.match``
+
+    Compiled functions are cached keyed by the restriction; restrictions
+    the compiler can't improve upon have their match method returned as is.
+
+    :param restrict: :obj:`pkgcore.restrictions.restriction.base` instance
+    :return: callable taking a package, returning a boolean
+    """
+    if not _is_compilable(restrict):
+        return restrict.match
+    try:
+        key = cache_key(restrict)
+    except (TypeError, RuntimeError):
+        # unhashable, or too deeply nested; compile it, but don't cache it.
+        return _compile(restrict)
+    func = _cache.get(key)
+    if func is None:
+        func = _compile(restrict)
+        if len(_cache) >= cache_size:
+            _cache.clear()
+        _cache[key] = func
+    return func
+
+
+def _compile(restrict):
+    try:
+        return _compiler().compile(restrict)
+    except (SyntaxError, RuntimeError, MemoryError):
+        # nested too deeply for the interpreter; use it as is.
+        return restrict.match
@@ -53,5 +53,8 @@ def main(options, out, err):
                 out.write("deleting %s" % (x,))
             del target[x]
 
+    if not target.autocommits:
+        target.commit()
+
     if options.verbose:
         out.write("took %i seconds" % int(time.time() - start))
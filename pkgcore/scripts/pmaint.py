@@ -17,13 +17,14 @@ demandload(globals(),
     'time',
     'snakeoil.osutils:pjoin,listdir_dirs',
     'pkgcore:spawn',
-    'pkgcore.operations:observer',
+    'pkgcore.operations:observer,regen@regen_ops',
     'pkgcore.repository:multiplex',
     'pkgcore.package:mutated',
     'pkgcore.fs:contents,livefs',
     'pkgcore.ebuild:processor,triggers',
     'pkgcore.merge:triggers@merge_triggers',
-    'pkgcore.sync:base@sync_base',
+    'pkgcore.sync:base@sync_base,git@sync_git',
+    'sys',
     're',
 )
 
@@ -172,6 +173,27 @@ regen.add_argument("-t", "--threads", type=int,
     default=commandline.DelayedValue(_get_default_jobs, 100),
     help="number of threads to use for regeneration.  Defaults to using all "
     "available processors")
+regen.add_argument("-p", "--processes", type=int, default=None,
+    help="number of worker processes to use for regeneration.  Each process "
+    "runs its own ebuild processor and cache writer, avoiding contention "
+    "between threads; if specified, --threads is ignored")
+regen.add_argument("--multiplex", type=int, default=None,
+    help="number of ebuild processors to drive from a single thread, "
+    "rather than a thread per processor; if specified, --threads is ignored")
+regen.add_argument("--processor-max-jobs", type=int, default=None,
+    help="replace each ebuild processor with a fresh one after it has "
+    "regenerated this many packages, bounding the memory bash accumulates")
+regen.add_argument("--timings", default=None,
+    help="file to persist per package regeneration times in; parallel "
+    "regeneration uses them to start the slowest packages first.  Defaults "
+    "to a file under /var/cache/edb/dep; pass an empty string to disable")
+regen.add_argument("--changed-files", default=None,
+    help="file listing the paths (relative to the repository) changed since "
+    "the last regeneration, one per line; - for stdin.  Only ebuilds that "
+    "changed or that inherit a changed eclass are regenerated")
+regen.add_argument("--changed-since", default=None,
+    help="like --changed-files, but derive the changes from a git checkout "
+    "since the given revision; after a sync, ORIG_HEAD is the prior revision")
 regen.add_argument("--force", action='store_true', default=False,
     help="force regeneration to occur regardless of staleness checks")
 regen.add_argument("--rsync", action='store_true', default=False,
@@ -189,14 +211,47 @@ def regen_main(options, out, err):
         out.write("repository %s doesn't support cache regeneration" % (repo,))
         return 0
 
+    timings = options.timings
+    if timings is None:
+        timings = regen_ops.default_timings_location(repo)
+    timings = regen_ops.regen_timings(timings or None)
+
+    changed = None
+    if options.changed_files is not None:
+        if options.changed_files == '-':
+            changed = [x.strip() for x in sys.stdin]
+        else:
+            try:
+                with open(options.changed_files) as f:
+                    changed = [x.strip() for x in f]
+            except EnvironmentError as e:
+                out.error("failed reading %r: %s" % (options.changed_files, e))
+                return 1
+    if options.changed_since is not None:
+        try:
+            changed = (changed or []) + sync_git.git_syncer.changed_files(
+                repo.location, options.changed_since)
+        except sync_base.syncer_exception as e:
+            out.error(str(e))
+            return 1
+    if changed is not None:
+        changed = filter(None, changed)
+
+    if options.processor_max_jobs is not None:
+        processor.default_pool.configure(max_jobs=options.processor_max_jobs)
+
     start_time = time.time()
     repo.operations.regen_cache(threads=options.threads,
+        processes=options.processes, multiplex=options.multiplex,
         observer=observer.formatter_output(out), force=options.force,
-            eclass_caching=(not options.disable_eclass_caching))
+            eclass_caching=(not options.disable_eclass_caching),
+            timings=timings, changed=changed,
+            eclass_index=regen_ops.default_eclass_index_location(repo))
     end_time = time.time()
     if options.verbose:
         out.write("finished %d nodes in %.2f seconds" % (len(repo),
             end_time - start_time))
+        processor.default_pool.report(observer.formatter_output(out))
     if options.rsync:
         timestamp = pjoin(repo.location, "metadata", "timestamp.chk")
         try:
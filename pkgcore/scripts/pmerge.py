@@ -11,16 +11,20 @@ from time import time
 
 from pkgcore.ebuild import resolver
 from pkgcore.ebuild.atom import atom
+from pkgcore import fetch
+from pkgcore.fetch import prefetch
 from pkgcore.merge import errors as merge_errors
 from pkgcore.operations import observer, format
 from pkgcore.resolver.util import reduce_to_failures
+from pkgcore.resolver import scheduler
+from pkgcore.resolver.profiler import resolver_profiler
 from pkgcore.restrictions import packages, values
 from pkgcore.restrictions.boolean import AndRestriction, OrRestriction
 from pkgcore.util import commandline, parserestrict, repo_utils, argparse
 
 from snakeoil.compatibility import IGNORED_EXCEPTIONS
 from snakeoil.currying import partial
-from snakeoil.lists import stable_unique
+from snakeoil.lists import stable_unique, iflatten_instance
 
 argparser = commandline.mk_argparser(domain=True,
     description="pkgcore package merging and unmerging interface")
@@ -75,6 +79,19 @@ merge_mode.add_argument('-1', '--oneshot', action='store_true',
     default=False,
     help="do not record changes in the world file; if a set is "
          "involved, defaults to forcing oneshot")
+merge_mode.add_argument('-j', '--jobs', type=int, default=1,
+    help="number of packages to build in parallel; packages are only "
+         "built once their dependencies are merged, and merges are always "
+         "done one at a time, in the resolved order")
+merge_mode.add_argument('--load-average', type=float, default=None,
+    help="don't start additional parallel builds while the system load "
+         "average is at or above this value")
+merge_mode.add_argument('--fetch-jobs', type=int, default=0,
+    help="fetch the distfiles of the whole plan in the background, this "
+         "many at a time, rather than just prior to each package's build")
+merge_mode.add_argument('--fetch-jobs-per-host', type=int, default=2,
+    help="maximum number of concurrent background fetches from any one "
+         "host (mirror); defaults to 2")
 
 resolution_options = argparser.add_argument_group("Resolver options")
 
@@ -111,6 +128,13 @@ resolution_options.add_argument('-S', '--source-only', action='store_true',
 resolution_options.add_argument('-e', '--empty', action='store_true',
     help="force rebuilding of all involved packages, using installed "
          "packages only to satisfy building the replacements")
+resolution_options.add_argument('--profile-resolver', metavar='FILE',
+    help="record where resolution spends its time (per atom timings, "
+         "repository queries, backtracking), writing it to FILE")
+resolution_options.add_argument('--profile-resolver-format',
+    choices=('json', 'flamegraph'), default='json',
+    help="format to write --profile-resolver data in; flamegraph is the "
+         "collapsed stack format flamegraph tools consume")
 
 output_options = argparser.add_argument_group("Output related options")
 output_options.add_argument('-v', '--verbose', action='store_true',
@@ -307,6 +331,11 @@ def _validate(parser, namespace):
         parser.error('Need at least one atom/set')
     if namespace.newuse:
         namespace.oneshot = True
+    if namespace.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if namespace.fetch_jobs < 0 or namespace.fetch_jobs_per_host < 1:
+        parser.error("--fetch-jobs must be positive, and "
+            "--fetch-jobs-per-host at least 1")
 
     # At some point, fix argparse so this isn't necessary...
     def f(val):
@@ -494,6 +523,10 @@ def main(options, out, err):
         drop_cycles=options.ignore_cycles, force_replace=options.replace,
         process_built_depends=options.with_built_depends, **extra_kwargs)
 
+    if options.profile_resolver:
+        profiler = resolver_profiler()
+        profiler.attach(resolver_inst)
+
     if options.preload_vdb_state:
         out.write(out.bold, ' * ', out.reset, 'Preloading vdb... ')
         vdb_time = time()
@@ -521,6 +554,17 @@ def main(options, out, err):
         ret = resolver_inst.add_atoms(atoms, finalize=True)
     resolve_time = time() - resolve_time
 
+    if options.profile_resolver:
+        try:
+            with open(options.profile_resolver, 'w') as f:
+                profiler.write(f, options.profile_resolver_format)
+        except EnvironmentError as e:
+            out.error("failed writing resolver profile to %r: %s" %
+                (options.profile_resolver, e))
+            return 1
+        out.write(out.bold, ' * ', out.reset,
+            "resolver profile written to %s" % (options.profile_resolver,))
+
     if options.debug:
         out.write(out.bold, " * ", out.reset, "resolution took %.2f seconds" % resolve_time)
 
@@ -623,72 +667,71 @@ def main(options, out, err):
         return
 
     change_count = len(changes)
+    positions = dict((op, pos) for pos, op in enumerate(changes))
 
-    # left in place for ease of debugging.
-    cleanup = []
-    try:
-        for count, op in enumerate(changes):
-            for func in cleanup:
-                func()
+    def build(op):
+        count = positions[op]
+        out.write("\nProcessing %i of %i: %s" % (count + 1, change_count,
+            op.pkg.cpvstr))
+        out.title("%i/%i: %s" % (count + 1, change_count, op.pkg.cpvstr))
+        if op.desc == "remove":
+            return True, (None, [])
 
-            cleanup = []
+        cleanup = [op.pkg.release_cached_data]
 
-            out.write("\nProcessing %i of %i: %s" % (count + 1, change_count,
-                op.pkg.cpvstr))
-            out.title("%i/%i: %s" % (count + 1, change_count, op.pkg.cpvstr))
-            if op.desc != "remove":
-                cleanup = [op.pkg.release_cached_data]
-
-                if not options.fetchonly and options.debug:
-                    out.write("Forcing a clean of workdir")
-
-                pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
-                out.write("\n%i files required-" % len(op.pkg.fetchables))
-                try:
-                    ret = pkg_ops.run_if_supported("fetch", or_return=True)
-                except IGNORED_EXCEPTIONS:
-                    raise
-                except Exception as e:
-                    ret = e
-                if ret is not True:
-                    if ret is False:
-                        ret = None
-                    commandline.dump_error(out, ret,
-                       "\nfetching failed for %s" % (op.pkg.cpvstr,))
-                    if not options.ignore_failures:
-                        return 1
-                    continue
-                if options.fetchonly:
-                    continue
-
-                buildop = pkg_ops.run_if_supported("build", or_return=None)
-                pkg = op.pkg
-                if buildop is not None:
-                    out.write("building %s" % (op.pkg.cpvstr,))
-                    result = False
-                    try:
-                        result = buildop.finalize()
-                    except format.errors as e:
-                        out.error("caught exception building %s: % s" % (op.pkg.cpvstr, e))
-                    else:
-                        if result is False:
-                            out.error("failed building %s" % (op.pkg.cpvstr,))
-                    if result is False:
-                        if not options.ignore_failures:
-                            return 1
-                        continue
-                    pkg = result
-                    cleanup.append(pkg.release_cached_data)
-                    pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
-                    cleanup.append(buildop.cleanup)
-
-                cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
-                pkg = pkg_ops.run_if_supported("localize", or_return=pkg)
-                # wipe this to ensure we don't inadvertantly use it further down;
-                # we aren't resetting it after localizing, so could have the wrong
-                # set of ops.
-                del pkg_ops
+        if not options.fetchonly and options.debug:
+            out.write("Forcing a clean of workdir")
 
+        pkg_ops = domain.pkg_operations(op.pkg, observer=build_obs)
+        out.write("\n%i files required-" % len(op.pkg.fetchables))
+        try:
+            ret = pkg_ops.run_if_supported("fetch", or_return=True)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            ret = e
+        if ret is not True:
+            if ret is False:
+                ret = None
+            commandline.dump_error(out, ret,
+               "\nfetching failed for %s" % (op.pkg.cpvstr,))
+            return False, (None, cleanup)
+        if options.fetchonly:
+            return True, (None, cleanup)
+
+        buildop = pkg_ops.run_if_supported("build", or_return=None)
+        pkg = op.pkg
+        if buildop is not None:
+            out.write("building %s" % (op.pkg.cpvstr,))
+            result = False
+            try:
+                result = buildop.finalize()
+            except format.errors as e:
+                out.error("caught exception building %s: % s" % (op.pkg.cpvstr, e))
+            else:
+                if result is False:
+                    out.error("failed building %s" % (op.pkg.cpvstr,))
+            if result is False:
+                return False, (None, cleanup)
+            pkg = result
+            cleanup.append(pkg.release_cached_data)
+            pkg_ops = domain.pkg_operations(pkg, observer=build_obs)
+            cleanup.append(buildop.cleanup)
+
+        cleanup.append(partial(pkg_ops.run_if_supported, "cleanup"))
+        pkg = pkg_ops.run_if_supported("localize", or_return=pkg)
+        # wipe this to ensure we don't inadvertantly use it further down;
+        # we aren't resetting it after localizing, so could have the wrong
+        # set of ops.
+        del pkg_ops
+        return True, (pkg, cleanup)
+
+    def merge(op, result):
+        pkg, cleanup = result
+        try:
+            if options.fetchonly:
+                return True
+            if op.desc != "remove":
                 out.write()
                 if op.desc == "replace":
                     if op.old_pkg == pkg:
@@ -701,9 +744,6 @@ def main(options, out, err):
                 else:
                     out.write(">>> Installing %s" % (pkg.cpvstr,))
                     i = domain.install_pkg(pkg, repo_obs)
-
-                # force this explicitly- can hold onto a helluva lot more
-                # then we would like.
             else:
                 out.write(">>> Removing %s" % op.pkg.cpvstr)
                 i = domain.uninstall_pkg(op.pkg, repo_obs)
@@ -711,15 +751,7 @@ def main(options, out, err):
                 ret = i.finish()
             except merge_errors.BlockModification as e:
                 out.error("Failed to merge %s: %s" % (op.pkg, e))
-                if not options.ignore_failures:
-                    return 1
-                continue
-
-            # while this does get handled through each loop, wipe it now; we don't need
-            # that data, thus we punt it now to keep memory down.
-            # for safety sake, we let the next pass trigger a release also-
-            # mainly to protect against any code following triggering reloads
-            # basically, be protective
+                return False
 
             if world_set is not None:
                 if op.desc == "remove":
@@ -731,26 +763,51 @@ def main(options, out, err):
                         out.write('>>> Adding %s to world file' % op.pkg.cpvstr)
                         add_pkg = slotatom_if_slotted(source_repos.combined, op.pkg.versioned_atom)
                         update_worldset(world_set, add_pkg)
+            return True
+        finally:
+            # force this explicitly- can hold onto a helluva lot more
+            # then we would like.
+            for func in cleanup:
+                func()
 
-
-#    again... left in place for ease of debugging.
-#    except KeyboardInterrupt:
-#        import pdb;pdb.set_trace()
-#    else:
-#        import pdb;pdb.set_trace()
+    def failed_build(op, result):
+        for func in result[1]:
+            func()
+        return False
+
+    if options.jobs > 1 and options.debug:
+        out.write(out.bold, " * ", out.reset,
+            "building with up to %i jobs" % (options.jobs,))
+
+    prefetcher = None
+    if options.fetch_jobs or options.jobs > 1:
+        # parallel builds may share distfiles; the prefetcher serializes
+        # fetches per file so they aren't downloaded over each other.
+        prefetcher = prefetch.prefetcher(domain.fetcher,
+            jobs=options.fetch_jobs or 1,
+            per_host=options.fetch_jobs_per_host)
+        domain.fetcher = prefetcher
+    if options.fetch_jobs:
+        # queue everything up front, in plan order; each package's fetch
+        # then just waits on its files' background fetches.
+        for op in changes:
+            if op.desc != "remove":
+                for target in iflatten_instance(op.pkg.fetchables,
+                                                fetch.fetchable):
+                    prefetcher.add(target)
+
+    # builds of independent packages run in parallel if --jobs was given;
+    # merges are always done in plan order, from this thread.
+    build_scheduler = scheduler.build_scheduler(changes, build,
+        merge, jobs=options.jobs, load_average=options.load_average,
+        fail_fast=not options.ignore_failures, on_failure=failed_build)
+    try:
+        if not build_scheduler.run() and not options.ignore_failures:
+            return 1
     finally:
-        pass
-
-    # the final run from the loop above doesn't invoke cleanups;
-    # we could ignore it, but better to run it to ensure nothing is inadvertantly
-    # held on the way out of this function.
-    # makes heappy analysis easier if we're careful about it.
-    for func in cleanup:
-        func()
-
-    # and wipe the reference to the functions to allow things to fall out of
-    # memory.
-    cleanup = []
+        if prefetcher is not None:
+            prefetcher.cancel()
+            domain.fetcher = prefetcher.fetcher
 
     out.write("finished")
     return 0
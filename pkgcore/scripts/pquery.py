@@ -5,6 +5,8 @@
 
 """Extract information from repositories."""
 
+import os
+
 from pkgcore.restrictions import packages, values, boolean, restriction
 from pkgcore.ebuild import conditionals, atom
 from pkgcore.util import (
@@ -15,7 +17,11 @@ from snakeoil.demandload import demandload
 demandload(globals(),
     're',
     'errno',
+    'operator:attrgetter',
+    'pkgcore.resolver:plan',
+    'pkgcore.operations:regen',
     'snakeoil.lists:iter_stable_unique',
+    'snakeoil.osutils:access',
     'pkgcore.fs:fs@fs_module,contents@contents_module',
 )
 
@@ -52,6 +58,42 @@ class DataSourceRestriction(values.base):
     __hash__ = object.__hash__
 
 
+class RevdepCandidates(restriction.base):
+
+    """
+    prefilter for reverse dependency queries via repositories'
+    :obj:`pkgcore.ebuild.revdep_index.RevdepIndex`
+
+    Packages of indexed repositories match only if the index lists them as
+    depending on one of the keys; packages of other repositories, or that
+    the index lacks, always match.
+    """
+
+    __slots__ = ("indexes", "candidates")
+    __inst_caching__ = False
+    type = packages.package_type
+    negate = False
+
+    def __init__(self, indexes, keys):
+        """
+        :param indexes: mapping of id(raw repository) -> index
+        :param keys: package keys (category/package) depended upon
+        """
+        sf = object.__setattr__
+        sf(self, "indexes", indexes)
+        sf(self, "candidates", frozenset(cpv for index in indexes.itervalues()
+            for key in keys for cpv in index.dependents(key)))
+
+    def match(self, pkg):
+        index = self.indexes.get(id(getattr(pkg, 'repo', None)))
+        if index is None or pkg.cpvstr not in index:
+            return True
+        return pkg.cpvstr in self.candidates
+
+    def __str__(self):
+        return 'RevdepCandidates: %i candidates' % (len(self.candidates),)
+
+
 dep_attrs = ['rdepends', 'depends', 'post_rdepends']
 metadata_attrs = dep_attrs
 dep_attrs += list('raw_%s' % x for x in dep_attrs)
@@ -529,21 +571,59 @@ query.add_argument('--revdep-pkgs', nargs=1,
         '--print-revdep atom. --print-revdep is slow, use just '
         '--restrict-revdep if you just need a list.')
 
+def _revdep_restrict(targetatom):
+    val_restrict = values.FlatteningRestriction(
+        atom.atom,
+        values.AnyMatch(values.FunctionRestriction(targetatom.intersects)))
+    return packages.OrRestriction(*list(
+            packages.PackageRestriction(dep, val_restrict)
+            for dep in ('depends', 'rdepends', 'post_rdepends')))
+
+def _writable(location):
+    parent = os.path.dirname(location)
+    while not os.path.exists(parent):
+        parent = os.path.dirname(parent)
+    return access(parent, os.W_OK|os.X_OK)
+
+def _revdep_candidates(namespace, keys):
+    """
+    :return: :obj:`RevdepCandidates` for the repos' revdep indexes, or None
+        if none are usable
+    """
+    indexes = {}
+    for repo in repo_utils.get_raw_repos(namespace.repos):
+        get_index = getattr(repo, 'get_revdep_index', None)
+        if get_index is None:
+            continue
+        location = regen.default_revdep_index_location(repo)
+        # refreshing an index that can't be written out would be repeated
+        # by every query, costing more than it saves.
+        if location is not None and _writable(location):
+            indexes[id(repo)] = get_index(location)
+    if not indexes:
+        return None
+    return RevdepCandidates(indexes, keys)
+
+def revdep_finalize(sequence, namespace):
+    l = []
+    for x in sequence:
+        restrict = _revdep_restrict(x)
+        candidates = _revdep_candidates(namespace, (x.key,))
+        if candidates is not None:
+            restrict = packages.AndRestriction(candidates, restrict)
+        l.append(restrict)
+    return l
+
 @bind_add_query('--restrict-revdep', action='append',
     default=[], dest='restrict_revdep',
+    final_converter=revdep_finalize,
     help='Dependency on an atom.')
 def parse_revdep(value):
     """Value should be an atom, packages with deps intersecting that match."""
     try:
-        targetatom = atom.atom(value)
+        return atom.atom(value)
     except atom.MalformedAtom as e:
         raise parserestrict.ParseError(str(e))
-    val_restrict = values.FlatteningRestriction(
-        atom.atom,
-        values.AnyMatch(values.FunctionRestriction(targetatom.intersects)))
-    return packages.OrRestriction(*list(
-            packages.PackageRestriction(dep, val_restrict)
-            for dep in ('depends', 'rdepends', 'post_rdepends')))
 
 def _revdep_pkgs_match(pkgs, value):
     return any(value.match(pkg) for pkg in pkgs)
@@ -563,8 +643,12 @@ def revdep_pkgs_finalize(sequence, namespace):
     any_restrict = values.AnyMatch(values.FunctionRestriction(
             partial(_revdep_pkgs_match, tuple(l))))
     r = values.FlatteningRestriction(atom.atom, any_restrict)
-    return list(packages.PackageRestriction(dep, r)
+    restricts = list(packages.PackageRestriction(dep, r)
         for dep in ('depends', 'rdepends', 'post_rdepends'))
+    candidates = _revdep_candidates(namespace, set(pkg.key for pkg in l))
+    if candidates is not None:
+        restricts.insert(0, candidates)
+    return restricts
 
 @bind_add_query('--description', '-S', action='append', dest='description',
     help='regexp search on description and longdescription.')
@@ -804,15 +888,16 @@ def main(options, out, err):
     for repo in options.repos:
         try:
             for pkgs in pkgutils.groupby_pkg(
-                repo.itermatch(options.query, sorter=sorted)):
+                repo.itermatch(options.query, sorter=plan.pkg_sort_lowest)):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
                 elif options.min or options.max:
+                    key = attrgetter('sort_key')
                     if options.min:
-                        print_package(options, out, err, min(pkgs))
+                        print_package(options, out, err, min(pkgs, key=key))
                     if options.max:
-                        print_package(options, out, err, max(pkgs))
+                        print_package(options, out, err, max(pkgs, key=key))
                 else:
                     for pkg in pkgs:
                         print_package(options, out, err, pkg)
@@ -4,6 +4,7 @@
 __all__ = ("git_syncer",)
 
 from pkgcore.sync import base
+from pkgcore import spawn
 import os
 
 class git_syncer(base.dvcs_syncer):
@@ -43,3 +44,22 @@ class git_syncer(base.dvcs_syncer):
 
     def _update_existing(self):
         return [self.binary_path, "pull"]
+
+    @classmethod
+    def changed_files(cls, path, since, until="HEAD"):
+        """
+        list the files changed in a checkout between two revisions
+
+        :param path: the checkout to inspect
+        :param since: revision to diff from; after a sync, ORIG_HEAD is the
+            revision prior to it
+        :param until: revision to diff to
+        :return: list of paths relative to the checkout
+        """
+        ret, output = spawn.spawn_get_output(
+            [cls.require_binary(cls.binary), "diff", "--name-only",
+             since, until], cwd=path)
+        if ret != 0:
+            raise base.generic_exception(
+                "git diff of %r from %s to %s failed" % (path, since, until))
+        return [x.rstrip("\n") for x in output if x.strip()]
@@ -80,6 +80,25 @@ class DictCacheBulk(bulk):
         return bulk.__setitem__(self, cpv, data)
 
 
+class ChfMixin(object):
+    # retain (and deserialize) the chksum info, required for validation.
+
+    __getitem__ = base.__getitem__
+
+    def _getitem(self, cpv):
+        d = dict(super(ChfMixin, self)._getitem(cpv).iteritems())
+        d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        return d
+
+
+class ChfDictCache(ChfMixin, DictCache):
+    pass
+
+
+class ChfDictCacheBulk(ChfMixin, DictCacheBulk):
+    pass
+
+
 class BaseTest(TestCase):
 
     cache_keys = ("foo", "_eclasses_")
@@ -88,6 +107,9 @@ class BaseTest(TestCase):
         return DictCache(auxdbkeys=self.cache_keys,
             readonly=readonly)
 
+    def get_chf_db(self):
+        return ChfDictCache(auxdbkeys=self.cache_keys)
+
     def test_basics(self):
         self.cache = self.get_db()
         self.cache['spork'] = {'foo':'bar'}
@@ -181,12 +203,47 @@ class BaseTest(TestCase):
         self.assertLen(tracker, 3)
 
 
+    def test_validate_entries(self):
+        cache = self.get_chf_db()
+        eclasses = {'spork': _mk_chf_obj(mtime=1), 'foon': _mk_chf_obj(mtime=2)}
+        cache['spork'] = {'foo': 'bar', '_eclasses_': eclasses}
+        cache['foon'] = {'foo': 'bar', '_eclasses_': eclasses}
+        cache['dork'] = {'foo': 'bar'}
+        rebuilds = []
+
+        class eclass_db(object):
+            valid = True
+            def rebuild_cache_entry(self, eclass_data):
+                rebuilds.append(eclass_data)
+                if self.valid:
+                    return dict(eclass_data)
+                return None
+
+        ec = eclass_db()
+        ebuild_hash = _mk_chf_obj()
+        hashes = dict.fromkeys(('spork', 'foon', 'dork', 'missing'), ebuild_hash)
+        self.assertEqual(cache.validate_entries(hashes, ec), ['missing'])
+        # identical eclass data is only validated once.
+        self.assertLen(rebuilds, 1)
+
+        ec.valid = False
+        self.assertEqual(sorted(cache.validate_entries(hashes, ec)),
+            ['foon', 'missing', 'spork'])
+
+        hashes['dork'] = _mk_chf_obj(mtime=200)
+        self.assertEqual(sorted(cache.validate_entries(hashes, ec)),
+            ['dork', 'foon', 'missing', 'spork'])
+
+
 class TestBulk(BaseTest):
 
     def get_db(self, readonly=False):
         return DictCacheBulk(auxdbkeys=self.cache_keys,
             readonly=readonly)
 
+    def get_chf_db(self):
+        return ChfDictCacheBulk(auxdbkeys=self.cache_keys)
+
     def test_filtering(self):
         db = self.get_db()
         # write a key outside of known keys
@@ -0,0 +1,107 @@
+# License: GPL2/BSD
+
+import os
+
+from pkgcore.test.cache import util, test_base
+from pkgcore.cache import indexed, errors
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+
+class db(indexed.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return indexed.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(indexed.database.__getitem__(self, cpv).iteritems())
+        d.pop('_%s_' % self.chf_type, None)
+        return d
+
+
+class TestIndexed(util.GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(self.dir,
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_persistence(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0', 'KEYWORDS': 'x86'}
+        cache['dev-util/foo-2'] = {'SLOT': '1'}
+        # pending entries are visible prior to commit
+        self.assertEqual(sorted(cache), ['dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(list(self.get_db()), [])
+        cache.commit()
+        cache = self.get_db(True)
+        self.assertEqual(sorted(cache), ['dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(cache['dev-util/foo-1'],
+            {'SLOT': '0', 'KEYWORDS': 'x86'})
+        self.assertIn('dev-util/foo-2', cache)
+        self.assertNotIn('dev-util/foo-3', cache)
+        self.assertRaises(KeyError, cache.__getitem__, 'dev-util/foo-3')
+
+    def test_updates_and_deletion(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        cache.commit()
+        cache['dev-util/foo-1'] = {'SLOT': '2'}
+        cache['dev-util/bar-1'] = {'SLOT': '3'}
+        cache.commit()
+        del cache['dev-util/bar-1']
+        self.assertNotIn('dev-util/bar-1', cache)
+        self.assertRaises(KeyError, cache.__delitem__, 'dev-util/bar-1')
+        cache.commit()
+        cache = self.get_db()
+        self.assertEqual(list(cache), ['dev-util/foo-1'])
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '2'})
+
+    def test_compaction(self):
+        cache = self.get_db()
+        cache.set_sync_rate(1)
+        for x in xrange(5):
+            cache['dev-util/foo-1'] = {'SLOT': str(x)}
+        path = pjoin(self.dir, cache.filename)
+        # superseded records exceeded the live count, so it was rewritten.
+        self.assertEqual(cache._dead, 0)
+        size = os.stat(path).st_size
+        cache['dev-util/foo-2'] = {'SLOT': '0'}
+        del cache['dev-util/foo-2']
+        self.assertTrue(os.stat(path).st_size > size)
+        cache.commit(force=True)
+        self.assertEqual(os.stat(path).st_size, size)
+        self.assertEqual(self.get_db()['dev-util/foo-1'], {'SLOT': '4'})
+
+    def test_concurrent_writers(self):
+        cache1, cache2 = self.get_db(), self.get_db()
+        cache1['dev-util/foo-1'] = {'SLOT': '1'}
+        cache2['dev-util/foo-2'] = {'SLOT': '2'}
+        cache1.commit()
+        cache2.commit()
+        # cache2 picked up cache1's records when committing
+        self.assertEqual(sorted(cache2), ['dev-util/foo-1', 'dev-util/foo-2'])
+        # cache1 doesn't see the update till it's refreshed
+        self.assertEqual(list(cache1), ['dev-util/foo-1'])
+        cache1.commit(force=True)
+        self.assertEqual(sorted(cache1), ['dev-util/foo-1', 'dev-util/foo-2'])
+
+    def test_partial_trailing_write(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '1'}
+        cache.commit()
+        with open(pjoin(self.dir, cache.filename), 'ab') as f:
+            f.write('dev-util/foo-2\t100\nSLOT=')
+        self.assertEqual(list(self.get_db()), ['dev-util/foo-1'])
+        # later commits drop the torn record rather than appending after it.
+        cache = self.get_db()
+        cache['dev-util/foo-3'] = {'SLOT': '3'}
+        cache.commit()
+        self.assertEqual(sorted(self.get_db()),
+            ['dev-util/foo-1', 'dev-util/foo-3'])
+        self.assertEqual(self.get_db()['dev-util/foo-3'], {'SLOT': '3'})
+
+    def test_corruption(self):
+        with open(pjoin(self.dir, db.filename), 'wb') as f:
+            f.write('not a cache\n')
+        self.assertRaises(errors.GeneralCacheCorruption, list, self.get_db())
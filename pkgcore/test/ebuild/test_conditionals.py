@@ -342,11 +342,63 @@ class native_DepSetEvaluateTest(base):
                 self.assertIdentical(orig, collapsed)
 
 
+    def test_memoization(self):
+        d = self.gen_depset("a/a x? ( b/b ) c/d[y(+)?] !z? ( e/e )",
+            element_kls=atom, transitive_use_atoms=True)
+        self.assertEqual(d._get_relevant_flags(), frozenset("xyz"))
+        result = d.evaluate_depset(["x", "unrelated"])
+        self.assertEqual(str(result), "a/a b/b c/d e/e")
+        # only the state of the flags the depset references matters.
+        self.assertIdentical(d.evaluate_depset(["x"]), result)
+        self.assertIdentical(d.evaluate_depset(frozenset(["x", "foo"])), result)
+        self.assertEqual(str(d.evaluate_depset(["x", "y"])), "a/a b/b c/d[y(+)] e/e")
+        self.assertNotIdentical(d.evaluate_depset(["x"], tristate_filter=[]),
+            result)
+        self.assertEqual(str(d.evaluate_depset(["x"], tristate_filter=["z"])),
+            "a/a b/b c/d[y(+)] e/e")
+
 class cpy_DepSetEvaluateTest(native_DepSetEvaluateTest):
 
     kls = staticmethod(conditionals.DepSet)
     if not conditionals.DepSet.parse_depset:
         skip = "extension not available"
 
+class DepSetCacheTest(TestCase):
+
+    def test_parse(self):
+        cache = conditionals.DepSetCache()
+        d = cache.parse('x', 'a x? ( b )', str)
+        self.assertEqual(str(d), 'a x? ( b )')
+        self.assertIdentical(cache.parse('x', 'a x? ( b )', str), d)
+        self.assertNotIdentical(cache.parse('y', 'a x? ( b )', str), d)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 2, 2))
+        # failures aren't cached.
+        self.assertRaises(ParseError, cache.parse, 'x', 'a (', str)
+        self.assertRaises(ParseError, cache.parse, 'x', 'a (', str)
+        self.assertEqual(len(cache), 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertNotIdentical(cache.parse('x', 'a x? ( b )', str), d)
+
+    def test_bounds(self):
+        cache = conditionals.DepSetCache(max_size=2)
+        a = cache.parse(None, 'a', str)
+        cache.parse(None, 'b', str)
+        cache.parse(None, 'c', str)
+        # a is in the old generation; using it moves it forward.
+        self.assertIdentical(cache.parse(None, 'a', str), a)
+        cache.parse(None, 'd', str)
+        self.assertEqual(len(cache), 3)
+        self.assertIdentical(cache.parse(None, 'a', str), a)
+        misses = cache.misses
+        cache.parse(None, 'b', str)
+        self.assertEqual(cache.misses, misses + 1)
+
+        cache = conditionals.DepSetCache(max_size=0)
+        a = cache.parse(None, 'a', str)
+        self.assertNotIdentical(cache.parse(None, 'a', str), a)
+        self.assertEqual(len(cache), 0)
+
+
 test_cpy_used = mk_cpy_loadable_testcase('pkgcore.ebuild._depset',
     "pkgcore.ebuild.conditionals", "parse_depset", "parse_depset")
@@ -199,6 +199,8 @@ class native_CpvTest(TestCase):
         self.assertTrue(obj1 > obj2, '%r must be > %r' % (obj1, obj2))
         # swap the ordering, so that it's no longer obj1.__cmp__, but obj2s
         self.assertTrue(obj2 < obj1, '%r must be < %r' % (obj2, obj1))
+        self.assertTrue(obj1.sort_key > obj2.sort_key,
+            'sort_key, %r > %r' % (obj1, obj2))
 
         if self.run_cpy_ver_cmp and obj1.fullver and obj2.fullver:
             self.assertTrue(cpv.cpy_ver_cmp(obj1.version, obj1.revision,
@@ -292,6 +294,19 @@ class native_CpvTest(TestCase):
         self.assertEqual(DummySubclass("da/ba-6.0", versioned=True),
             DummySubclass("da/ba-6.0-r0", versioned=True))
 
+    def test_sort_key(self):
+        vkls = self.vkls
+        for v1, v2 in (("6.0_alpha", "6.0_alpha0"), ("6.01.0", "6.010.0"),
+                       ("6.0", "6.0-r0"), ("1.00", "1.0")):
+            self.assertEqual(vkls("da/ba-%s" % v1).sort_key,
+                vkls("da/ba-%s" % v2).sort_key)
+        vers = ["1", "1-r1", "1a", "1.0", "1.0_alpha", "1.0_p1", "1.01",
+            "1.1", "1.1_rc2", "1.1_pre", "1.1_beta3_p1", "1.1_beta3", "2"]
+        pkgs = [vkls("da/ba-%s" % x) for x in vers]
+        self.assertEqual(sorted(pkgs, key=lambda x:x.sort_key), sorted(pkgs))
+        self.assertEqual(max(pkgs, key=lambda x:x.sort_key).fullver, "2")
+        self.assertEqual(cpv.ver_key(None, None), ())
+
     def test_no_init(self):
         """Test if the cpv is in a somewhat sane state if __init__ fails.
 
@@ -63,6 +63,17 @@ class test_base(TestCase):
         o = self.get_pkg({'LICENSE':'GPL2 FOON'})
         self.assertEqual(list(o.license), ['GPL2', 'FOON'])
 
+    def test_depset_cache(self):
+        dep = 'dev-util/foo x? ( dev-util/bar )'
+        o = self.get_pkg({'DEPEND': dep, 'RDEPEND': dep, 'EAPI': 1})
+        # identical strings share the parsed depset.
+        self.assertIdentical(o.depends, o.rdepends)
+        self.assertIdentical(self.get_pkg({'RDEPEND': dep, 'EAPI': 1}).rdepends,
+            o.rdepends)
+        # parsing is eapi dependent, thus so is the cache.
+        self.assertNotIdentical(self.get_pkg({'DEPEND': dep, 'EAPI': 2}).depends,
+            o.depends)
+
     def test_description(self):
         o = self.get_pkg({'DESCRIPTION':' foon\n asdf '})
         self.assertEqual(o.description, 'foon\n asdf')
@@ -424,6 +435,28 @@ class test_package_factory(TestCase):
         self.assertEqual(cache2[pkg.cpvstr],
             {'_eclasses_':{'eclass1':(None, 100)}, 'marker':2, '_mtime_':200})
 
+    def test_get_stale_metadata(self):
+        pkgs = [malleable_obj(cpvstr='dev-util/diffball-%i' % x,
+            path='bollocks') for x in range(3)]
+
+        class fake_cache(object):
+            def __init__(self, valid):
+                self.valid = frozenset(valid)
+                self.seen = []
+            def validate_entries(self, hashes, ecache):
+                self.seen.append(sorted(hashes))
+                return [x for x in hashes if x not in self.valid]
+
+        cache1 = fake_cache(['dev-util/diffball-0'])
+        cache2 = fake_cache(['dev-util/diffball-1'])
+        pf = self.mkinst(cache=(cache1, None, cache2))
+        self.assertEqual([x.cpvstr for x in pf.get_stale_metadata(pkgs)],
+            ['dev-util/diffball-2'])
+        self.assertEqual(cache1.seen, [[x.cpvstr for x in pkgs]])
+        # only what wasn't valid in the first cache should hit the second.
+        self.assertEqual(cache2.seen,
+            [['dev-util/diffball-1', 'dev-util/diffball-2']])
+
     def test_required_use(self):
         pass
 
@@ -0,0 +1,51 @@
+# License: GPL2/BSD
+
+from pkgcore.test import TestCase
+from pkgcore.ebuild.eclass_index import EclassIndex
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+
+class TestEclassIndex(TempDirMixin, TestCase):
+
+    def test_consumers(self):
+        index = EclassIndex()
+        index.update('cat/a-1', ['foo'])
+        self.assertEqual(index.consumers('foo'), frozenset(['cat/a-1']))
+        index.update('cat/b-1', ['foo', 'bar'])
+        self.assertEqual(index.consumers('foo'),
+            frozenset(['cat/a-1', 'cat/b-1']))
+        # updates after the inverse mapping was built are reflected in it.
+        index.update('cat/a-1', ['bar'])
+        self.assertEqual(index.consumers('foo'), frozenset(['cat/b-1']))
+        self.assertEqual(index.consumers('bar'),
+            frozenset(['cat/a-1', 'cat/b-1']))
+        self.assertEqual(index.consumers('missing'), frozenset())
+        self.assertIn('cat/a-1', index)
+        self.assertEqual(len(index), 2)
+        # memory only; nothing to write.
+        index.commit()
+        self.assertFalse(index.exists)
+
+    def test_persistence(self):
+        location = pjoin(self.dir, 'sub', 'index')
+        index = EclassIndex(location)
+        self.assertFalse(index.exists)
+        index.update('cat/a-1', ['foo', 'bar'])
+        index.update('cat/b-1', [])
+        index.commit()
+        self.assertTrue(index.exists)
+
+        index = EclassIndex(location)
+        self.assertTrue(index.exists)
+        self.assertEqual(len(index), 2)
+        self.assertIn('cat/b-1', index)
+        self.assertEqual(index.consumers('bar'), frozenset(['cat/a-1']))
+
+    def test_bad_magic(self):
+        location = pjoin(self.dir, 'index')
+        with open(location, 'w') as f:
+            f.write("random\ncat/a-1 foo\n")
+        index = EclassIndex(location)
+        self.assertFalse(index.exists)
+        self.assertEqual(len(index), 0)
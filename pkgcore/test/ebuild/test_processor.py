@@ -0,0 +1,258 @@
+# License: GPL2/BSD
+
+import os
+
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg
+from pkgcore.ebuild import eclass_cache, processor
+from pkgcore.repository.util import SimpleTree
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+from snakeoil.data_source import local_source
+
+
+class fake_processor(object):
+
+    def __init__(self, *lines):
+        self.lines = ['%s\n' % x for x in lines]
+        self.written = []
+
+    def readlines(self, count):
+        lines, self.lines = self.lines[:count], self.lines[count:]
+        return lines
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class fake_domain(object):
+
+    root = '/'
+
+    def __init__(self):
+        self.all_livefs_repos = SimpleTree(
+            {'dev-util': {'foo': ['1', '2'], 'bar': ['1']}},
+            pkg_klass=lambda *a: FakePkg('%s/%s-%s' % a))
+
+
+class TestPortageqHandler(TestCase):
+
+    def query(self, command, value, root='', eapi='5', use=''):
+        ebp = fake_processor(eapi, root, use, value)
+        processor.portageq_handler(fake_domain(), ebp, command)
+        self.assertEqual(ebp.lines, [])
+        return ''.join(ebp.written).split('\n', 1)
+
+    def test_has_version(self):
+        self.assertEqual(self.query('has_version', 'dev-util/foo'), ['0', ''])
+        self.assertEqual(self.query('has_version', '>dev-util/foo-2'),
+            ['1', ''])
+        self.assertEqual(self.query('has_version', 'dev-util/foo', '//'),
+            ['0', ''])
+
+    def test_best_version(self):
+        self.assertEqual(self.query('best_version', 'dev-util/foo'),
+            ['0', 'dev-util/foo-2'])
+        self.assertEqual(self.query('best_version', 'dev-util/missing'),
+            ['0', ''])
+        self.assertEqual(self.query('best_version', '<dev-util/foo-2', eapi=''),
+            ['0', 'dev-util/foo-1'])
+
+    def test_errors(self):
+        # other roots are left to the daemon.
+        self.assertEqual(self.query('has_version', 'dev-util/foo', '/mnt'),
+            ['fallback', ''])
+        ret, msg = self.query('has_version', 'dev-util/foo[')
+        self.assertEqual(ret, '2')
+        self.assertTrue(msg)
+        self.assertEqual(self.query('foon', 'dev-util/foo')[0], '2')
+
+
+class TestZygote(TempDirMixin, TestCase):
+
+    def tearDown(self):
+        processor.shutdown_all_processors()
+        TempDirMixin.tearDown(self)
+
+    def test_fork_processor(self):
+        ebps = [processor.request_ebuild_processor(zygote=True, sandbox=False)
+            for x in xrange(3)]
+        zygote = processor.zygote_ebps[(False, False)]
+        self.assertEqual(len(processor.zygote_ebps), 1)
+        self.assertEqual(len(set(x.pid for x in ebps + [zygote])), 4)
+        for ebp in ebps:
+            self.assertTrue(ebp.is_alive)
+            self.assertEqual(ebp.dont_export_vars, zygote.dont_export_vars)
+            # each is an independent, working daemon.
+            self.assertTrue(ebp.clear_preloaded_eclasses())
+        self.assertTrue(zygote.clear_preloaded_eclasses())
+
+        for ebp in ebps:
+            processor.release_ebuild_processor(ebp)
+        # released processors are reused rather than forked anew.
+        self.assertIn(processor.request_ebuild_processor(zygote=True,
+            sandbox=False), ebps)
+
+        ebps[1].shutdown_processor()
+        self.assertFalse(ebps[1].is_alive)
+        self.assertTrue(zygote.is_alive)
+
+    def test_preloaded_eclasses(self):
+        os.mkdir(pjoin(self.dir, 'eclass'))
+        with open(pjoin(self.dir, 'eclass', 'foo.eclass'), 'w') as f:
+            f.write('foo_func() { :; }\n')
+        ec = eclass_cache.cache(pjoin(self.dir, 'eclass'))
+        ebp = processor.request_ebuild_processor(zygote=True, sandbox=False,
+            eclass_cache=ec)
+        path = pjoin(self.dir, 'eclass', 'foo.eclass')
+        self.assertEqual(ebp._preloaded_eclasses, {'foo': path})
+        self.assertEqual(processor.zygote_ebps[(False, False)]._preloaded_eclasses,
+            {'foo': path})
+        # the child's state is its own.
+        self.assertTrue(ebp.clear_preloaded_eclasses())
+        self.assertEqual(processor.zygote_ebps[(False, False)]._preloaded_eclasses,
+            {'foo': path})
+
+
+class fake_ebuild(object):
+
+    category, package, version, revision, fullver = 'cat', 'pkg', '1', None, '1'
+
+    def __init__(self, path):
+        self.ebuild = local_source(path)
+
+
+class TestProtocol(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self._protocol = os.environ.get('PKGCORE_EBD_PROTOCOL')
+        os.mkdir(pjoin(self.dir, 'eclass'))
+        with open(pjoin(self.dir, 'eclass', 'foo.eclass'), 'w') as f:
+            f.write('IUSE="foo"\n')
+        self.ec = eclass_cache.cache(pjoin(self.dir, 'eclass'))
+        self.ebuild = pjoin(self.dir, 'pkg-1.ebuild')
+        with open(self.ebuild, 'w') as f:
+            f.write('EAPI=4\ninherit foo\nSLOT=0\n'
+                'DESCRIPTION="multi\n  line \xc3\xbc"\nsrc_install() { :; }\n')
+
+    def tearDown(self):
+        processor.shutdown_all_processors()
+        if self._protocol is None:
+            os.environ.pop('PKGCORE_EBD_PROTOCOL', None)
+        else:
+            os.environ['PKGCORE_EBD_PROTOCOL'] = self._protocol
+        TempDirMixin.tearDown(self)
+
+    def get_processor(self, protocol):
+        processor.shutdown_all_processors()
+        os.environ['PKGCORE_EBD_PROTOCOL'] = protocol
+        return processor.request_ebuild_processor(sandbox=False)
+
+    def test_get_keys(self):
+        expected = {'EAPI': '4', 'SLOT': '0', 'INHERITED': 'foo',
+            'IUSE': 'foo', 'DESCRIPTION': 'multi line \xc3\xbc',
+            'DEFINED_PHASES': 'src_install'}
+        for protocol in ('text', 'framed'):
+            ebp = self.get_processor(protocol)
+            self.assertEqual(ebp.framed, protocol == 'framed')
+            self.assertEqual(ebp.get_keys(fake_ebuild(self.ebuild), self.ec),
+                expected)
+            # forked processors speak the zygote's protocol.
+            child = ebp.fork_processor()
+            self.assertEqual(child.framed, ebp.framed)
+            self.assertEqual(child.get_keys(fake_ebuild(self.ebuild), self.ec),
+                expected)
+            child.shutdown_processor()
+
+    def test_large_frames(self):
+        data = 'x' * (1 << 17)
+        for protocol in ('text', 'framed'):
+            ebp = self.get_processor(protocol)
+            ebp.write_frame("set_metadata_path", data)
+            self.assertTrue(ebp.expect("metadata_path_received"))
+            # coms are still in sync.
+            self.assertTrue(ebp.clear_preloaded_eclasses())
+
+    def test_unsupported_protocol(self):
+        ebp = self.get_processor('text')
+        self.assertFalse(ebp._set_protocol('foon'))
+        self.assertFalse(ebp.framed)
+        self.assertTrue(ebp._set_protocol('framed'))
+        self.assertTrue(ebp.framed)
+
+
+class info_observer(object):
+
+    def __init__(self):
+        self.lines = []
+
+    def info(self, msg, *args, **kwds):
+        self.lines.append(msg % (args or kwds))
+
+
+class TestProcessorPool(TestCase):
+
+    def setUp(self):
+        self.pool = processor.ProcessorPool()
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def request(self):
+        return self.pool.request(sandbox=False)
+
+    def test_reuse(self):
+        ebp = self.request()
+        self.assertTrue(self.pool.release(ebp))
+        self.assertFalse(self.pool.release(ebp))
+        self.assertIdentical(self.request(), ebp)
+        stats = self.pool.stats()
+        self.assertEqual((stats['spawned'], stats['reused'],
+            stats['acquired'], stats['active'], stats['idle']),
+            (1, 1, 2, 1, 0))
+        self.assertTrue(stats['avg_acquire_time'] > 0)
+        observer = info_observer()
+        self.pool.report(observer)
+        self.assertEqual(len(observer.lines), 1)
+        self.assertIn('1 spawned', observer.lines[0])
+
+    def test_recycling(self):
+        self.pool.configure(max_jobs=2)
+        self.assertRaises(TypeError, self.pool.configure, foon=1)
+        ebp = self.request()
+        self.assertIdentical(self.pool.recycle(ebp), ebp)
+        ebp.jobs = 2
+        new = self.pool.recycle(ebp)
+        self.assertNotIdentical(new, ebp)
+        self.assertFalse(ebp.is_alive)
+        self.assertEqual(self.pool.active, [new])
+        # worn out processors aren't kept for reuse either.
+        new.jobs = 2
+        self.pool.release(new)
+        self.assertFalse(new.is_alive)
+        self.assertEqual(self.pool.inactive, [])
+        self.assertEqual(self.pool.stats()['recycled'], 2)
+
+    def test_sizes(self):
+        self.pool.configure(max_size=2, min_size=1, max_idle_time=10)
+        ebps = [self.request() for x in range(3)]
+        for ebp in ebps:
+            self.pool.release(ebp)
+        self.assertEqual(self.pool.inactive, ebps[:2])
+        self.assertFalse(ebps[2].is_alive)
+        # reaping leaves min_size processors in place.
+        self.assertEqual(self.pool.reap_idle(), 0)
+        self.assertEqual(self.pool.reap_idle(ebps[1]._idle_since + 11), 1)
+        self.assertEqual(self.pool.inactive, ebps[1:2])
+        self.assertEqual(self.pool.stats()['reaped'], 1)
+
+    def test_health_checks(self):
+        ebp = self.request()
+        self.assertTrue(ebp.ping())
+        self.pool.release(ebp)
+        # coms out of alignment; it's discarded rather than reused.
+        ebp.write("ping stray")
+        new = self.request()
+        self.assertNotIdentical(new, ebp)
+        self.assertEqual(self.pool.stats()['unhealthy'], 1)
@@ -9,6 +9,7 @@ from snakeoil.osutils import ensure_dirs, pjoin
 from snakeoil.test.mixins import TempDirMixin
 
 from pkgcore.ebuild import errors as ebuild_errors
+from pkgcore.cache import flat_hash
 from pkgcore.ebuild import repository, eclass_cache
 from pkgcore.ebuild.atom import atom
 from pkgcore.repository import errors
@@ -120,6 +121,68 @@ class UnconfiguredTreeTest(TempDirMixin):
             sorted(repo.default_visibility_limiters))
 
 
+    @silence_logging
+    def test_regen_changed_candidates(self):
+        for pkg in ('a', 'b', 'c'):
+            ensure_dirs(pjoin(self.dir, 'cat', pkg))
+            open(pjoin(self.dir, 'cat', pkg, '%s-1.ebuild' % pkg), 'w').close()
+        cache = {'cat/a-1': {'_eclasses_': {'foo': None}},
+                 'cat/b-1': {'INHERITED': 'foo bar'}}
+        repo = self.mk_tree(self.dir, cache=(cache,))
+
+        def candidates(*changed, **kwds):
+            return sorted(x.cpvstr for x in repo._regen_operation_candidates(
+                changed=changed, force=True, **kwds))
+        self.assertEqual(candidates('eclass/bar.eclass'), ['cat/b-1'])
+        self.assertEqual(candidates('eclass/foo.eclass', 'cat/c/c-1.ebuild'),
+            ['cat/a-1', 'cat/b-1', 'cat/c-1'])
+        self.assertEqual(candidates(pjoin(self.dir, 'cat/c/c-1.ebuild')),
+            ['cat/c-1'])
+        # removed ebuilds, and changes that aren't ebuilds, are ignored.
+        self.assertEqual(candidates('cat/c/c-2.ebuild', 'cat/c/metadata.xml',
+            'profiles/package.mask', 'eclass/missing.eclass'), [])
+
+        # the index is persisted, and kept current by regen.
+        location = pjoin(self.dir, 'eclass-index')
+        self.assertEqual(candidates('eclass/bar.eclass',
+            eclass_index=location), ['cat/b-1'])
+        self.assertTrue(os.path.exists(location))
+        repo._regen_operation_finish({'cat/a-1': frozenset(['bar']),
+            'cat/c-1': None}, eclass_index=location)
+        repo = self.mk_tree(self.dir)
+        self.assertEqual(candidates('eclass/bar.eclass',
+            eclass_index=location), ['cat/a-1', 'cat/b-1'])
+        self.assertEqual(candidates('eclass/foo.eclass',
+            eclass_index=location), ['cat/b-1'])
+
+    def test_eclass_index_from_cache(self):
+        for pkg in ('a', 'b'):
+            ensure_dirs(pjoin(self.dir, 'cat', pkg))
+            open(pjoin(self.dir, 'cat', pkg, '%s-1.ebuild' % pkg), 'w').close()
+        cache_dir = pjoin(self.dir, 'cache')
+        ensure_dirs(pjoin(cache_dir, 'cat'))
+        with open(pjoin(cache_dir, 'cat', 'a-1'), 'w') as f:
+            f.write('_eclasses_=foo\t/eclass\t1\tbar\t/eclass\t2\n'
+                '_mtime_=1\n')
+        cache = flat_hash.database(cache_dir, readonly=True)
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        pkg = repo.package_class('cat', 'a', '1')
+        self.assertEqual(repo.package_class.get_cached_eclasses(pkg),
+            frozenset(['foo', 'bar']))
+        self.assertEqual(repo._regen_operation_affinity(pkg),
+            frozenset(['foo', 'bar']))
+
+        location = pjoin(self.dir, 'eclass-index')
+        index = repo._get_eclass_index(location)
+        self.assertEqual(index.consumers('foo'), frozenset(['cat/a-1']))
+        self.assertEqual(index.consumers('bar'), frozenset(['cat/a-1']))
+        # and it survived being written out.
+        self.assertTrue(os.path.exists(location))
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        self.assertEqual(repo._get_eclass_index(location).consumers('foo'),
+            frozenset(['cat/a-1']))
+
+
 class SlavedTreeTest(UnconfiguredTreeTest):
 
     def mk_tree(self, path, *args, **kwds):
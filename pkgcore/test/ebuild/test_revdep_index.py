@@ -0,0 +1,67 @@
+# License: GPL2/BSD
+
+from pkgcore.test import TestCase
+from pkgcore.ebuild.revdep_index import RevdepIndex
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+
+class TestRevdepIndex(TempDirMixin, TestCase):
+
+    def test_dependents(self):
+        index = RevdepIndex()
+        index.update('cat/a-1', 1, ['foo'], ['dev-util/bar', '>=dev-util/baz-2'])
+        self.assertEqual(index.dependents('dev-util/bar'),
+            {'cat/a-1': frozenset(['dev-util/bar'])})
+        index.update('cat/b-1', 1, [], ['<dev-util/bar-2', 'dev-util/bar'])
+        self.assertEqual(index.dependents('dev-util/bar'),
+            {'cat/a-1': frozenset(['dev-util/bar']),
+             'cat/b-1': frozenset(['<dev-util/bar-2', 'dev-util/bar'])})
+        # updates after the inverse mapping was built are reflected in it.
+        index.update('cat/a-1', 2, ['foo'], ['>=dev-util/baz-2'])
+        self.assertEqual(sorted(index.dependents('dev-util/bar')), ['cat/b-1'])
+        index.discard('cat/b-1')
+        self.assertEqual(index.dependents('dev-util/bar'), {})
+        self.assertEqual(sorted(index.dependents('dev-util/baz')), ['cat/a-1'])
+        self.assertEqual(list(index), ['cat/a-1'])
+        self.assertEqual(len(index), 1)
+
+    def test_validity(self):
+        index = RevdepIndex()
+        index.update_eclasses({'foo': 1, 'bar': 1})
+        index.update('cat/a-1', 1, ['foo'], [])
+        index.update('cat/b-1', 1, ['bar'], [])
+        self.assertTrue(index.is_valid('cat/a-1', 1))
+        self.assertFalse(index.is_valid('cat/a-1', 2))
+        self.assertFalse(index.is_valid('cat/c-1', 1))
+        self.assertEqual(index.update_eclasses({'foo': 1, 'bar': 1}), set())
+        self.assertEqual(index.update_eclasses({'foo': 2, 'bar': 1}),
+            set(['cat/a-1']))
+        self.assertFalse(index.is_valid('cat/a-1', 1))
+        self.assertTrue(index.is_valid('cat/b-1', 1))
+        # removed eclasses invalidate their consumers too.
+        self.assertEqual(index.update_eclasses({'foo': 2}),
+            set(['cat/a-1', 'cat/b-1']))
+        index.update('cat/a-1', 1, ['foo'], [])
+        self.assertTrue(index.is_valid('cat/a-1', 1))
+
+    def test_persistence(self):
+        location = pjoin(self.dir, 'sub', 'index')
+        index = RevdepIndex(location)
+        index.update_eclasses({'foo': 3})
+        index.update('cat/a-1', 1, ['foo'], ['dev-util/bar', '!dev-util/baz'])
+        index.update('cat/b-1', 2, [], [])
+        index.commit()
+
+        index = RevdepIndex(location)
+        self.assertEqual(sorted(index), ['cat/a-1', 'cat/b-1'])
+        self.assertTrue(index.is_valid('cat/a-1', 1))
+        self.assertTrue(index.is_valid('cat/b-1', 2))
+        self.assertEqual(index.update_eclasses({'foo': 3}), set())
+        self.assertEqual(index.dependents('dev-util/baz'),
+            {'cat/a-1': frozenset(['!dev-util/baz'])})
+
+        # unknown formats are ignored rather than misparsed.
+        with open(location, 'w') as f:
+            f.write('foon\npkg cat/a-1 1 - dev-util/bar\n')
+        self.assertEqual(len(RevdepIndex(location)), 0)
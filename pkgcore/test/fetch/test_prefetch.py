@@ -0,0 +1,189 @@
+# License: GPL2/BSD
+
+import os
+import threading
+import time
+import urllib2
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from pkgcore.test import TestCase
+from pkgcore.fetch import base, errors, fetchable, prefetch
+from snakeoil.test.mixins import TempDirMixin
+from snakeoil.osutils import pjoin
+
+
+class server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, files, delay=0.05):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), handler)
+        self.files = files
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = self.max_active = 0
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever,
+            kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def uri(self):
+        return 'http://%s:%i' % self.server_address
+
+
+class handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        s = self.server
+        with s.lock:
+            s.requests.append(self.path)
+            s.active += 1
+            s.max_active = max(s.max_active, s.active)
+        try:
+            time.sleep(s.delay)
+            data = s.files.get(self.path.lstrip('/'))
+            if data is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with s.lock:
+                s.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class http_fetcher(base.fetcher):
+
+    def __init__(self, distdir):
+        self.distdir = distdir
+        self.fetched = []
+
+    def fetch(self, target):
+        fp = pjoin(self.distdir, target.filename)
+        for uri in target.uri:
+            self.fetched.append(uri)
+            try:
+                data = urllib2.urlopen(uri).read()
+            except EnvironmentError:
+                continue
+            with open(fp, 'wb') as f:
+                f.write(data)
+            break
+        self._verify(fp, target)
+        return fp
+
+    def get_path(self, target):
+        fp = pjoin(self.distdir, target.filename)
+        self._verify(fp, target)
+        return fp
+
+
+def target(filename, data, *servers):
+    return fetchable(filename, ['%s/%s' % (s.uri, filename) for s in servers],
+        {'size': len(data)})
+
+
+class TestPrefetcher(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.fetcher = http_fetcher(self.dir)
+        self.servers = []
+
+    def tearDown(self):
+        for s in self.servers:
+            s.shutdown()
+            s.server_close()
+        TempDirMixin.tearDown(self)
+
+    def server(self, files, **kwds):
+        s = server(files, **kwds)
+        self.servers.append(s)
+        return s
+
+    def test_per_host_limit(self):
+        files = dict(('file%i' % x, str(x) * 10) for x in xrange(6))
+        s = self.server(files)
+        p = prefetch.prefetcher(self.fetcher, jobs=4, per_host=2)
+        targets = [target(k, v, s) for k, v in sorted(files.iteritems())]
+        for t in targets:
+            p.add(t)
+        # queuing again is ignored.
+        p.add(targets[0])
+        for t in targets:
+            self.assertEqual(p(t), pjoin(self.dir, t.filename))
+        self.assertEqual(s.max_active, 2)
+        self.assertEqual(len(s.requests), 6)
+        # results are reused rather than refetched.
+        self.assertEqual(len(self.fetcher.fetched), 6)
+        for k, v in files.iteritems():
+            with open(pjoin(self.dir, k)) as f:
+                self.assertEqual(f.read(), v)
+
+    def test_failover(self):
+        files = {'foo': 'foo', 'bar': 'bar'}
+        broken = self.server({})
+        s = self.server(files)
+        p = prefetch.prefetcher(self.fetcher, jobs=1)
+        foo, bar = [target(k, files[k], broken, s) for k in ('foo', 'bar')]
+        p.add(foo)
+        self.assertEqual(p(foo), pjoin(self.dir, 'foo'))
+        # the broken host is tried last for later files.
+        p.add(bar)
+        self.assertEqual(p(bar), pjoin(self.dir, 'bar'))
+        self.assertEqual(broken.requests, ['/foo'])
+        self.assertEqual(s.requests, ['/foo', '/bar'])
+
+    def test_failures(self):
+        s = self.server({})
+        p = prefetch.prefetcher(self.fetcher)
+        t = target('foo', 'foo', s)
+        p.add(t)
+        # a failed background fetch is left to the fetcher proper.
+        self.assertRaises(errors.FetchFailed, p, t)
+        self.assertEqual(len(s.requests), 2)
+
+        # files that weren't queued go straight to the fetcher.
+        s.files['bar'] = 'bar'
+        t = target('bar', 'bar', s)
+        self.assertEqual(p(t), pjoin(self.dir, 'bar'))
+        self.assertEqual(p.get_path(t), pjoin(self.dir, 'bar'))
+
+    def test_cancel(self):
+        files = dict(('file%i' % x, 'data') for x in xrange(4))
+        s = self.server(files, delay=0.2)
+        p = prefetch.prefetcher(self.fetcher, jobs=1)
+        for k in sorted(files):
+            p.add(target(k, 'data', s))
+        p.cancel()
+        p.add(target('foo', 'data', s))
+        self.assertEqual(p(target('file0', 'data', s)),
+            pjoin(self.dir, 'file0'))
+        self.assertTrue(len(s.requests) <= 2)
+        self.assertFalse(os.path.exists(pjoin(self.dir, 'foo')))
+
+    def test_unqueued_serialized(self):
+        s = self.server({'foo': 'foo', 'bar': 'bar'}, delay=0.1)
+        p = prefetch.prefetcher(self.fetcher)
+        targets = [target(k, k, s) for k in ('foo', 'foo', 'bar', 'bar')]
+        results = {}
+        def fetch(i):
+            results[i] = p(targets[i])
+        threads = [threading.Thread(target=fetch, args=(i,))
+            for i in xrange(len(targets))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(results.itervalues()),
+            [pjoin(self.dir, x) for x in ('bar', 'bar', 'foo', 'foo')])
+        # distinct files are fetched concurrently, the same file never is.
+        self.assertEqual(s.max_active, 2)
@@ -0,0 +1,100 @@
+# License: GPL2/BSD
+
+import os
+
+from pkgcore.test import TestCase
+from pkgcore.fetch import verify
+from snakeoil.chksum import get_handlers, get_chksums
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+
+class counting_handler(object):
+
+    def __init__(self, chf):
+        self.handler = get_handlers([chf])[chf]
+        self.calls = 0
+        self.news = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return self.handler(path)
+
+    def new(self):
+        self.news += 1
+        return self.handler.new()
+
+
+class TestVerify(TempDirMixin, TestCase):
+
+    chfs = ('md5', 'sha1', 'sha256', 'size')
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.cache = verify.chksum_cache()
+
+    def write(self, name, data):
+        path = pjoin(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def expected(self, path, chfs=chfs):
+        return dict(zip(chfs, get_chksums(path, *chfs)))
+
+    def test_get_chksums(self):
+        path = self.write('foo', 'asdf' * 10000)
+        self.assertEqual(
+            verify.get_chksums(path, self.chfs, cache=self.cache),
+            self.expected(path))
+        self.assertEqual(
+            verify.get_chksums(path, ['sha1'], cache=None),
+            self.expected(path, ['sha1']))
+        self.assertRaises(EnvironmentError, verify.get_chksums,
+            pjoin(self.dir, 'missing'), self.chfs)
+
+    def test_single_read(self):
+        path = self.write('foo', 'asdf')
+        handlers = dict((chf, counting_handler(chf)) for chf in self.chfs)
+        self.assertEqual(verify.get_chksums(path, self.chfs,
+            handlers=handlers, cache=self.cache), self.expected(path))
+        # hashes are computed incrementally from a shared read.
+        for chf in ('md5', 'sha1', 'sha256'):
+            self.assertEqual((handlers[chf].calls, handlers[chf].news),
+                (0, 1))
+
+    def test_cache(self):
+        path = self.write('foo', 'asdf')
+        verify.get_chksums(path, ['md5'], cache=self.cache)
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size, st.st_ino)
+        self.assertEqual(self.cache.get(path, key), self.expected(path, ['md5']))
+        # cached values are used as is.
+        self.cache.update(path, key, {'md5': 1L})
+        self.assertEqual(verify.get_chksums(path, ['md5', 'sha1'],
+            cache=self.cache)['md5'], 1L)
+        self.assertEqual(sorted(self.cache.get(path, key)), ['md5', 'sha1'])
+
+        # modification invalidates it.
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(verify.get_chksums(path, ['md5'], cache=self.cache),
+            self.expected(path, ['md5']))
+        self.assertEqual(self.cache.get(path, key), {})
+
+    def test_get_chksums_many(self):
+        paths = [self.write('file%i' % x, str(x) * (x * 1000))
+            for x in xrange(8)]
+        items = [(path, self.chfs) for path in paths]
+        expected = [self.expected(path) for path in paths]
+        for jobs in (1, 4):
+            self.assertEqual(verify.get_chksums_many(items, jobs=jobs,
+                cache=None), expected)
+
+        items.insert(2, (pjoin(self.dir, 'missing'), self.chfs))
+        expected.insert(2, None)
+        for jobs in (1, 4):
+            self.assertRaises(EnvironmentError, verify.get_chksums_many,
+                items, jobs=jobs, cache=None)
+            self.assertEqual(verify.get_chksums_many(items, jobs=jobs,
+                cache=None, ignore_errors=True), expected)
+        self.assertEqual(verify.get_chksums_many([]), [])
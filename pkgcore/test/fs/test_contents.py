@@ -268,6 +268,65 @@ class TestContentsSet(TestCase):
             self.mk_file("/dir/a"), self.mk_dir("/dir/dir2"),
             self.mk_file("/dir/dir2/b")]))
 
+    def test_iter_child_nodes(self):
+        cs = contents.contentsSet([self.mk_dir("/usr"),
+            self.mk_dir("/usr/bin"), self.mk_file("/usr/bin/foo"),
+            self.mk_file("/usr-foo"), self.mk_file("/usrfoo"),
+            self.mk_dir("/etc")])
+        children = lambda cs, start: [x.location for x in
+            cs.iter_child_nodes(start)]
+        self.assertEqual(children(cs, "/usr"), ["/usr/bin", "/usr/bin/foo"])
+        self.assertEqual(children(cs, self.mk_dir("/usr/")),
+            ["/usr/bin", "/usr/bin/foo"])
+        self.assertEqual(children(cs, self.mk_link("/lib", "/usr/bin")),
+            ["/usr/bin/foo"])
+        self.assertEqual(children(cs, "/"), sorted(x.location for x in cs))
+        # mutations after the sorted index is built are reflected in it.
+        cs.remove("/usr/bin/foo")
+        cs.add(self.mk_file("/usr/bin/bar"))
+        cs.update([self.mk_file("/usr/a"), self.mk_file("/usr/bin/foo")])
+        cs.discard("/usr/a")
+        self.assertEqual(children(cs, "/usr"),
+            ["/usr/bin", "/usr/bin/bar", "/usr/bin/foo"])
+        cs.clear()
+        self.assertEqual(children(cs, "/usr"), [])
+        # ordered sets yield children in their order.
+        cs = contents.OrderedContentsSet([self.mk_file("/usr/b"),
+            self.mk_file("/usr/a")])
+        self.assertEqual(children(cs, "/usr"), ["/usr/b", "/usr/a"])
+
+    def test_sorted_set_operations(self):
+        left = contents.contentsSet([self.mk_file("/a"), self.mk_file("/b"),
+            self.mk_dir("/c")], mutable=False)
+        right = contents.contentsSet([self.mk_dir("/b"), self.mk_dir("/c"),
+            self.mk_file("/d")])
+        locations = lambda cs: sorted(x.location for x in cs)
+        # contentsSets are merged; other sequences take the generic route.
+        for other in (right, [x.location for x in right]):
+            self.assertEqual(locations(left.difference(other)), ["/a"])
+        self.assertEqual(locations(left.symmetric_difference(right)),
+            ["/a", "/d"])
+        ret = left.intersection(right)
+        self.assertEqual(locations(ret), ["/b", "/c"])
+        # intersection yields the other set's objects.
+        self.assertTrue(ret["/b"].is_dir)
+        self.assertFalse(ret.mutable)
+        self.assertTrue(right.intersection(left).mutable)
+        self.assertEqual(ret, contents.contentsSet(
+            [self.mk_dir("/b"), self.mk_dir("/c")], mutable=False))
+        self.assertTrue(ret.issubset(right))
+        self.assertFalse(left.issubset(right))
+        self.assertTrue(right.issuperset(ret))
+        self.assertFalse(left.isdisjoint(right))
+        self.assertTrue(left.difference(right).isdisjoint(right))
+        # results are usable as any other set.
+        ret = right.difference(left)
+        ret.add(self.mk_file("/0"))
+        self.assertEqual(locations(ret.child_nodes("/")), ["/0", "/d"])
+        right.difference_update(left)
+        self.assertEqual(locations(right), ["/d"])
+        self.assertEqual(locations(right.iter_child_nodes("/")), ["/d"])
+
 
     def test_add_missing_directories(self):
         src = [self.mk_file("/dir1/a"), self.mk_file("/dir2/dir3/b"),
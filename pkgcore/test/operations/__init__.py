@@ -0,0 +1 @@
+# License: GPL2/BSD
@@ -0,0 +1,116 @@
+# License: GPL2/BSD
+
+from pkgcore.test import TestCase
+from pkgcore.test.misc import FakePkg
+from pkgcore.operations import regen
+from pkgcore.repository.util import SimpleTree
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+
+class fake_observer(object):
+
+    def __init__(self):
+        self.errors = []
+
+    def error(self, msg):
+        self.errors.append(msg)
+
+
+class TestTimings(TempDirMixin, TestCase):
+
+    def test_persistence(self):
+        path = pjoin(self.dir, 'sub', 'timings')
+        timings = regen.regen_timings(path)
+        self.assertEqual(timings.get('dev-util/foo-1'), None)
+        self.assertEqual(timings.default_time(), 1.0)
+        timings.record('dev-util/foo-1', 2.5)
+        timings.record('dev-util/bar-1', 0.5)
+        timings.record('dev-util/bar-2', 0.25)
+        timings.commit()
+        timings = regen.regen_timings(path)
+        self.assertEqual(timings.get('dev-util/foo-1'), 2.5)
+        self.assertEqual(timings.default_time(), 0.5)
+
+        with open(path, 'w') as f:
+            f.write('garbage\n')
+        self.assertEqual(regen.regen_timings(path).get('dev-util/foo-1'), None)
+
+
+class TestSchedule(TestCase):
+
+    def test_schedule(self):
+        pkgs = [FakePkg('dev-util/%s-%i' % (x, y)) for x in 'abcd'
+            for y in xrange(1, 5)]
+        eclasses = {'a': 'eutils', 'b': 'eutils', 'c': 'git', 'd': ''}
+        affinity = lambda pkg: eclasses[pkg.package]
+
+        timings = regen.regen_timings()
+        timings.record('dev-util/d-4', 20.0)
+        for y in xrange(1, 5):
+            timings.record('dev-util/c-%i' % y, 3.0)
+
+        groups = regen.schedule_regen(pkgs, 1, affinity, timings)
+        self.assertEqual(sorted(x.cpvstr for x in sum(groups, [])),
+            sorted(x.cpvstr for x in pkgs))
+        # slowest first, and groups don't mix eclasses.
+        self.assertEqual(groups[0][0].cpvstr, 'dev-util/d-4')
+        for group in groups:
+            self.assertEqual(len(set(affinity(x) for x in group)), 1)
+        self.assertEqual(len(groups), 3)
+        # unknown timings are estimated via the median of the known.
+        self.assertEqual(groups[2], [x for x in pkgs if x.package == 'c'])
+
+        # more workers results in the groups being split for balance.
+        groups = regen.schedule_regen(pkgs, 4, affinity, timings)
+        self.assertTrue(len(groups) > 3)
+        costs = [sum(timings.get(x.cpvstr, 3.0) for x in group)
+            for group in groups]
+        self.assertEqual(costs, sorted(costs, reverse=True))
+
+        self.assertEqual(regen.schedule_regen([], 4), [])
+        self.assertEqual(len(regen.schedule_regen(pkgs, 1)), 1)
+
+
+class TestRegenRepository(TestCase):
+
+    def test_threaded(self):
+        seen = []
+        class repo(SimpleTree):
+            def _regen_operation_helper(self, **kwds):
+                return seen.append
+
+        r = repo({'dev-util': {'foo': ['1', '2'], 'bar': ['1']}},
+            pkg_klass=lambda *a: FakePkg('%s/%s-%s' % a))
+        timings = regen.regen_timings()
+        observer = fake_observer()
+        for threads in (1, 2):
+            seen[:] = []
+            regen.regen_repository(r, observer, threads=threads,
+                timings=timings)
+            self.assertEqual(sorted(x.cpvstr for x in seen),
+                ['dev-util/bar-1', 'dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(observer.errors, [])
+        self.assertNotEqual(timings.get('dev-util/foo-2'), None)
+
+    def test_multiplexed(self):
+        from pkgcore.ebuild.processor_driver import ProcessorRequest
+        finished = {}
+        class helper(object):
+            def start(self, pkg, driver):
+                if pkg.package == 'bar':
+                    raise ValueError("bad")
+                return ProcessorRequest.finished(pkg.fullver)
+        class repo(SimpleTree):
+            def _regen_operation_helper(self, **kwds):
+                return helper()
+            def _regen_operation_finish(self, results, **kwds):
+                finished.update(results)
+
+        r = repo({'dev-util': {'foo': ['1', '2'], 'bar': ['1']}},
+            pkg_klass=lambda *a: FakePkg('%s/%s-%s' % a))
+        observer = fake_observer()
+        regen.regen_repository(r, observer, multiplex=2)
+        self.assertEqual(finished, {'dev-util/foo-1': '1',
+            'dev-util/foo-2': '2', 'dev-util/bar-1': None})
+        self.assertEqual(len(observer.errors), 1)
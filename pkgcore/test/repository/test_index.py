@@ -0,0 +1,104 @@
+# License: GPL2/BSD
+
+import errno
+import os
+
+from pkgcore.test import TestCase
+from pkgcore.repository import index
+from snakeoil.osutils import pjoin, listdir_dirs
+from snakeoil.test.mixins import TempDirMixin
+
+
+class TestDirectoryIndex(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.loc = pjoin(self.dir, 'cache', 'index')
+        self.tree = pjoin(self.dir, 'tree')
+        os.mkdir(self.tree)
+        self.calls = 0
+
+    def mk_index(self):
+        i = index.DirectoryIndex(self.loc)
+        i.racy_window = 0
+        return i
+
+    def listing(self):
+        self.calls += 1
+        return sorted(listdir_dirs(self.tree))
+
+    def age(self, path, delta=10):
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime - delta))
+
+    def test_reuse(self):
+        os.mkdir(pjoin(self.tree, 'dev-util'))
+        self.age(self.tree)
+        i = self.mk_index()
+        self.assertEqual(i.get('', self.tree, self.listing), ('dev-util',))
+        self.assertEqual(i.get('', self.tree, self.listing), ('dev-util',))
+        self.assertEqual(self.calls, 1)
+        # adding an entry modifies the dir's mtime.
+        os.mkdir(pjoin(self.tree, 'dev-lib'))
+        self.assertEqual(i.get('', self.tree, self.listing),
+            ('dev-lib', 'dev-util'))
+        self.assertEqual(self.calls, 2)
+        i.invalidate('')
+        i.get('', self.tree, self.listing)
+        self.assertEqual(self.calls, 3)
+
+    def test_persistence(self):
+        os.mkdir(pjoin(self.tree, 'dev-util'))
+        self.age(self.tree)
+        i = self.mk_index()
+        i.get('', self.tree, self.listing)
+        i.get('empty', self.tree, lambda: ())
+        i.commit()
+        self.assertTrue(os.path.isfile(self.loc))
+        i = self.mk_index()
+        self.assertEqual(i.get('', self.tree, self.listing), ('dev-util',))
+        self.assertEqual(i.get('empty', self.tree, self.listing), ())
+        self.assertEqual(self.calls, 1)
+
+    def test_racy_window(self):
+        i = self.mk_index()
+        i.racy_window = 60
+        i.get('', self.tree, self.listing)
+        # modified too recently to be trusted; not stored.
+        self.assertFalse(i._dirty)
+        i.get('', self.tree, self.listing)
+        self.assertEqual(self.calls, 2)
+
+    def test_missing_path(self):
+        i = self.mk_index()
+        self.assertEqual(i.get('foo', pjoin(self.tree, 'foo'), lambda: ['a']),
+            ('a',))
+        self.assertFalse(i._dirty)
+
+    def test_corrupt(self):
+        os.mkdir(os.path.dirname(self.loc))
+        with open(self.loc, 'w') as f:
+            f.write("not an index\n\tbroken\n")
+        self.age(self.tree)
+        i = self.mk_index()
+        self.assertEqual(i.get('', self.tree, self.listing), ())
+        self.assertEqual(self.calls, 1)
+
+    def test_unwritable(self):
+        warnings = []
+        def unwritable(*args, **kwds):
+            raise IOError(errno.EACCES, "permission denied")
+        orig = index.AtomicWriteFile, index.logger
+        index.AtomicWriteFile = unwritable
+        index.logger = type('logger', (object,),
+            {'warning': staticmethod(lambda *a: warnings.append(a))})
+        try:
+            self.age(self.tree)
+            i = self.mk_index()
+            i.get('', self.tree, self.listing)
+            i.commit()
+        finally:
+            index.AtomicWriteFile, index.logger = orig
+        # not having write access is the norm for non root users.
+        self.assertEqual(warnings, [])
+        self.assertFalse(os.path.exists(self.loc))
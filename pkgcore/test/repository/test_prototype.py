@@ -206,6 +206,18 @@ class TestPrototype(TestCase):
         self.repo.notify_add_package(pkg)
         self.assertIn((pkg.category, pkg.package), self.repo.versions)
 
+    def test_sorted_versions(self):
+        class kls(SimpleTree):
+            sorted_versions = True
+        repo = kls({"dev-util":{"diffball":["1.0", "0.7", "1.0_rc1",
+            "1.0-r1"]}})
+        key = ("dev-util", "diffball")
+        self.assertEqual(list(repo.versions[key]),
+            ["0.7", "1.0_rc1", "1.0", "1.0-r1"])
+        repo.notify_add_package(versioned_CPV("dev-util/diffball-0.10"))
+        self.assertEqual(list(repo.versions[key]),
+            ["0.7", "0.10", "1.0_rc1", "1.0", "1.0-r1"])
+
     def _simple_redirect_test(self, attr, arg1='=dev-util/diffball-1.0', arg2=None):
         l = []
         uniq_obj = object()
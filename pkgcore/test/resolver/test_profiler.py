@@ -0,0 +1,85 @@
+# License: GPL2/BSD
+
+import json
+from StringIO import StringIO
+
+from pkgcore.test import TestCase
+from pkgcore.ebuild.atom import atom
+from pkgcore.repository import misc
+from pkgcore.repository.util import SimpleTree
+from pkgcore.resolver import profiler
+
+
+class fake_state(object):
+
+    def __init__(self):
+        self.plan = []
+
+    def backtrack(self, state_pos):
+        self.plan = self.plan[:state_pos]
+
+
+class fake_plan(object):
+
+    """
+    minimal merge_plan; resolving an atom queries the db, then resolves
+    the atoms it depends on.
+    """
+
+    def __init__(self, deps, clock):
+        self.deps = deps
+        self.clock = clock
+        self.state = fake_state()
+        self.all_raw_dbs = [misc.caching_repo(
+            SimpleTree({'dev-util': {'foo': ['1'], 'bar': ['1']}}), iter)]
+
+    def _rec_add_atom(self, a, stack, dbs, **kwds):
+        self.clock.append(self.clock[-1] + 1)
+        list(self.all_raw_dbs[0].itermatch(a))
+        self.state.plan.append(a)
+        for dep in self.deps.get(str(a), ()):
+            self._rec_add_atom(dep, stack, dbs)
+        self.clock.append(self.clock[-1] + 1)
+
+
+class TestResolverProfiler(TestCase):
+
+    def setUp(self):
+        self.clock = [0]
+        foo, bar = atom('dev-util/foo'), atom('dev-util/bar')
+        self.plan = fake_plan({'dev-util/foo': [bar, bar]}, self.clock)
+        self.profiler = profiler.resolver_profiler(
+            timer=lambda: self.clock[-1])
+        self.profiler.attach(self.plan)
+        self.plan._rec_add_atom(foo, None, None)
+        self.plan.state.backtrack(1)
+        self.plan.state.backtrack(1)
+
+    def test_report(self):
+        report = self.profiler.report()
+        self.assertEqual(report['total_time'], 6)
+        self.assertEqual(report['max_depth'], 1)
+        self.assertEqual(report['backtracks'],
+            {'count': 1, 'reverted_ops': 2})
+        foo, bar = report['atoms']
+        self.assertEqual(foo, {'atom': 'dev-util/foo', 'calls': 1,
+            'total': 6, 'self': 2, 'max_depth': 0})
+        self.assertEqual(bar, {'atom': 'dev-util/bar', 'calls': 2,
+            'total': 4, 'self': 4, 'max_depth': 1})
+        db, = report['dbs']
+        self.assertEqual(db['queries'], 3)
+        self.assertEqual(db['cache_hits'], 1)
+        self.assertEqual(db['itermatch_calls'], 2)
+        self.assertEqual(db['cache_hit_ratio'], 1 / 3.0)
+
+    def test_output(self):
+        f = StringIO()
+        self.profiler.write(f)
+        self.assertEqual(json.loads(f.getvalue()),
+            json.loads(json.dumps(self.profiler.report())))
+        f = StringIO()
+        self.profiler.write(f, 'flamegraph')
+        self.assertEqual(f.getvalue(),
+            "dev-util/foo 2000000\n"
+            "dev-util/foo;dev-util/bar 4000000\n")
+        self.assertRaises(ValueError, self.profiler.write, f, 'foon')
@@ -0,0 +1,143 @@
+# License: GPL2/BSD
+
+import threading
+
+from pkgcore.test import TestCase
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.conditionals import DepSet
+from pkgcore.resolver import scheduler
+from pkgcore.test.misc import FakePkg
+
+
+def fake_pkg(cpv, depends=(), rdepends=()):
+    pkg = FakePkg(cpv)
+    object.__setattr__(pkg, "depends", DepSet.parse(' '.join(depends), atom))
+    object.__setattr__(pkg, "rdepends",
+        DepSet.parse(' '.join(rdepends), atom))
+    return pkg
+
+
+class fake_op(object):
+
+    choices = None
+
+    def __init__(self, desc, pkg):
+        self.desc = desc
+        self.pkg = pkg
+
+    def __repr__(self):
+        return '%s: %s' % (self.desc, self.pkg.cpvstr)
+
+
+def ops(*specs):
+    return [fake_op(desc, fake_pkg(cpv, *deps)) for desc, cpv, deps in specs]
+
+
+class TestOpDependencies(TestCase):
+
+    def test_edges(self):
+        l = ops(
+            ('add', 'dev-util/a-1', ()),
+            ('add', 'dev-util/b-1', (['dev-util/a'],)),
+            ('add', 'dev-util/c-1', ((), ['>=dev-util/b-1'])),
+            # doesn't match; nor do blockers or later ops count.
+            ('add', 'dev-util/d-1', (['>dev-util/a-1', '!dev-util/b',
+                'dev-util/e'],)),
+            ('remove', 'dev-util/f-1', ()),
+            ('add', 'dev-util/e-1', ()),
+        )
+        self.assertEqual(scheduler.op_dependencies(l),
+            [frozenset(), frozenset([0]), frozenset([1]), frozenset(),
+            frozenset(), frozenset([4])])
+
+
+class TestBuildScheduler(TestCase):
+
+    def run_scheduler(self, l, jobs, fail=(), **kwds):
+        events = []
+        lock = threading.Lock()
+        merged = set()
+        def build(op):
+            # everything this depends upon must be merged (or have
+            # failed) already.
+            for dep in scheduler.op_dependencies(l)[l.index(op)]:
+                self.assertTrue(l[dep] in merged or
+                    l[dep].pkg.package in fail)
+            with lock:
+                events.append(('build', op.pkg.package))
+            return op.pkg.package not in fail, op.pkg.package
+        def merge(op, result):
+            self.assertEqual(threading.current_thread(), main_thread)
+            self.assertEqual(result, op.pkg.package)
+            merged.add(op)
+            events.append(('merge', op.pkg.package))
+            return True
+        main_thread = threading.current_thread()
+        s = scheduler.build_scheduler(l, build, merge, jobs=jobs, **kwds)
+        return s, s.run(), events
+
+    def test_serial(self):
+        l = ops(
+            ('add', 'dev-util/a-1', ()),
+            ('add', 'dev-util/b-1', ()),
+            ('add', 'dev-util/c-1', (['dev-util/a'],)),
+        )
+        s, result, events = self.run_scheduler(l, 1)
+        self.assertTrue(result)
+        self.assertEqual(events,
+            [('build', 'a'), ('merge', 'a'), ('build', 'b'), ('merge', 'b'),
+            ('build', 'c'), ('merge', 'c')])
+
+    def test_parallel(self):
+        l = ops(*[('add', 'dev-util/%s-1' % x, ()) for x in 'abcdef'])
+        l.append(fake_op('add', fake_pkg('dev-util/g-1', ['dev-util/f'])))
+        started = threading.Event()
+        builds = []
+        def build(op):
+            builds.append(op)
+            if len(builds) == 2:
+                started.set()
+            # the first build can only finish if the second was started
+            # in parallel.
+            self.assertTrue(started.wait(10))
+            return True, None
+        merged = []
+        def merge(op, result):
+            merged.append(op)
+            return True
+        s = scheduler.build_scheduler(l, build, merge, jobs=2)
+        self.assertTrue(s.run())
+        self.assertEqual(merged, l)
+        self.assertEqual(builds[-1], l[-1])
+
+        # a merge failure stops everything.
+        s = scheduler.build_scheduler(l, build, lambda *a: False, jobs=3)
+        self.assertFalse(s.run())
+        self.assertEqual(s.failures, l[:1])
+
+    def test_failures(self):
+        l = ops(
+            ('add', 'dev-util/a-1', ()),
+            ('add', 'dev-util/b-1', (['dev-util/a'],)),
+            ('add', 'dev-util/c-1', ()),
+        )
+        failed = []
+        s, result, events = self.run_scheduler(l, 1, fail=('a',),
+            on_failure=lambda op, result: failed.append(result))
+        self.assertFalse(result)
+        self.assertEqual(events, [('build', 'a')])
+        self.assertEqual(failed, ['a'])
+        self.assertEqual(s.failures, l[:1])
+
+        s, result, events = self.run_scheduler(l, 2, fail=('a',),
+            fail_fast=False)
+        self.assertFalse(result)
+        self.assertEqual([x for x in events if x[0] == 'merge'],
+            [('merge', 'b'), ('merge', 'c')])
+
+    def test_exceptions(self):
+        l = ops(('add', 'dev-util/a-1', ()), ('add', 'dev-util/b-1', ()))
+        def build(op):
+            raise ValueError(op.pkg.package)
+        s = scheduler.build_scheduler(l, build, lambda *a: True, jobs=2)
+        self.assertRaises(ValueError, s.run)
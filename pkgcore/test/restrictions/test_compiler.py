@@ -0,0 +1,111 @@
+# License: BSD/GPL2
+
+from itertools import product
+
+from pkgcore import log
+from pkgcore.test import TestCase, malleable_obj, silence_logging
+from pkgcore.restrictions import packages, values, boolean, compiler
+from pkgcore.ebuild.atom import atom
+
+
+class counting_obj(object):
+
+    def __init__(self, **kwds):
+        self._vals = kwds
+        self.pulls = []
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        self.pulls.append(attr)
+        try:
+            return self._vals[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+
+class TestCompileMatch(TestCase):
+
+    def pkgs(self):
+        for cat, pkg, slot in product(('dev-util', 'dev-lib'),
+                                      ('foo', 'bar'), ('0', '1')):
+            yield malleable_obj(category=cat, package=pkg, slot=slot)
+
+    def assertEquivalent(self, restrict):
+        match = compiler.compile_match(restrict)
+        self.assertNotIdentical(match, restrict.match)
+        for pkg in self.pkgs():
+            self.assertEqual(match(pkg), restrict.match(pkg),
+                msg="%r: mismatch for %r" % (restrict, pkg.__dict__))
+
+    def test_equivalence(self):
+        cat = packages.PackageRestriction('category',
+            values.StrExactMatch('dev-util'))
+        ncat = packages.PackageRestriction('category',
+            values.StrExactMatch('dev-util'), negate=True)
+        pkg = packages.PackageRestriction('package',
+            values.StrExactMatch('foo'))
+        slot = packages.PackageRestriction('slot',
+            values.ContainmentMatch('1', '2'))
+        for kls1, kls2, neg1, neg2 in product(
+                (packages.AndRestriction, packages.OrRestriction),
+                (packages.AndRestriction, packages.OrRestriction),
+                (False, True), (False, True)):
+            inner = kls2(pkg, slot, negate=neg2)
+            self.assertEquivalent(kls1(cat, inner, negate=neg1))
+            self.assertEquivalent(kls1(ncat, inner, kls1(slot, cat),
+                negate=neg1))
+        self.assertEquivalent(packages.AndRestriction())
+        self.assertEquivalent(packages.OrRestriction())
+        self.assertEquivalent(ncat)
+        # leaves the compiler doesn't know about are invoked as is.
+        self.assertEquivalent(packages.OrRestriction(
+            atom('dev-util/foo'), atom('dev-lib/bar:1'),
+            packages.AlwaysTrue))
+
+    @silence_logging(log.logging.root)
+    def test_missing_attr(self):
+        for negate in (False, True):
+            r = packages.AndRestriction(packages.PackageRestriction('nonexistent',
+                values.AlwaysTrue, negate=negate), packages.AlwaysTrue)
+            self.assertEqual(compiler.compile_match(r)(malleable_obj()),
+                r.match(malleable_obj()))
+
+    def test_attr_pulled_once(self):
+        r = packages.AndRestriction(
+            packages.PackageRestriction('slot', values.StrExactMatch('1'),
+                negate=True),
+            packages.OrRestriction(
+                packages.PackageRestriction('package',
+                    values.StrExactMatch('bar')),
+                packages.PackageRestriction('slot',
+                    values.StrExactMatch('0'))))
+        match = compiler.compile_match(r)
+        pkg = counting_obj(package='foo', slot='0')
+        self.assertTrue(match(pkg))
+        self.assertEqual(sorted(pkg.pulls), ['package', 'slot'])
+        # short circuiting; package is never pulled.
+        pkg = counting_obj(package='foo', slot='1')
+        self.assertFalse(match(pkg))
+        self.assertEqual(pkg.pulls, ['slot'])
+
+    def test_caching(self):
+        r = packages.AndRestriction(
+            packages.PackageRestriction('slot', values.StrExactMatch('1')),
+            packages.PackageRestriction('package', values.StrExactMatch('1')))
+        self.assertIdentical(compiler.compile_match(r),
+            compiler.compile_match(r))
+        # nothing to gain for leaves the compiler doesn't handle.
+        a = atom('dev-util/foo')
+        self.assertEqual(compiler.compile_match(a), a.match)
+
+    def test_deep_nesting(self):
+        r = packages.PackageRestriction('slot', values.StrExactMatch('1'))
+        # deeper than the interpreter allows for indentation.
+        for x in xrange(60):
+            r = boolean.AndRestriction(
+                packages.OrRestriction(r, packages.AlwaysFalse),
+                packages.AlwaysTrue)
+        match = compiler.compile_match(r)
+        self.assertTrue(match(malleable_obj(slot='1')))
+        self.assertFalse(match(malleable_obj(slot='0')))
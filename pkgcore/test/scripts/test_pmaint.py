@@ -235,3 +235,8 @@ class TestRegen(TestCase, helpers.ArgParseMixin):
         self.assertEqual(
             [options.repo.__class__, options.threads],
             [TestSimpleTree, 2])
+
+        options = self.parse(
+            'spork', '--processes', '3', spork=basics.HardCodedConfigSection(
+                {'class': fake_repo}))
+        self.assertEqual(options.processes, 3)
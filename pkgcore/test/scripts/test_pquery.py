@@ -75,3 +75,67 @@ class CommandlineTest(TestCase, helpers.ArgParseMixin):
 
     def test_no_contents(self):
         self.assertOut([], '--contents', '--all', test_domain=domain_config)
+
+
+class fake_pkg(object):
+
+    def __init__(self, repo, cpvstr):
+        self.repo, self.cpvstr = repo, cpvstr
+
+
+class fake_namespace(object):
+
+    def __init__(self, repos):
+        self.repos = repos
+
+
+class RevdepCandidatesTest(TestCase):
+
+    def test_match(self):
+        from pkgcore.ebuild.revdep_index import RevdepIndex
+        indexed, other = object(), object()
+        index = RevdepIndex()
+        index.update('cat/a-1', 1, [], ['dev-util/foo'])
+        index.update('cat/b-1', 1, [], ['dev-util/bar'])
+        restrict = pquery.RevdepCandidates({id(indexed): index},
+            ['dev-util/foo'])
+        self.assertTrue(restrict.match(fake_pkg(indexed, 'cat/a-1')))
+        self.assertFalse(restrict.match(fake_pkg(indexed, 'cat/b-1')))
+        # what the index lacks is left to the exact restriction.
+        self.assertTrue(restrict.match(fake_pkg(indexed, 'cat/c-1')))
+        self.assertTrue(restrict.match(fake_pkg(other, 'cat/b-1')))
+
+
+    def test_unwritable(self):
+        from pkgcore.ebuild.revdep_index import RevdepIndex
+        locations = []
+        class indexed_repo(object):
+            location = '/usr/portage'
+            def get_revdep_index(self, location):
+                locations.append(location)
+                return RevdepIndex()
+        namespace = fake_namespace([indexed_repo()])
+        orig = pquery.access
+        try:
+            pquery.access = lambda *args: True
+            self.assertTrue(isinstance(pquery._revdep_candidates(namespace,
+                ['dev-util/foo']), pquery.RevdepCandidates))
+            self.assertEqual(len(locations), 1)
+            # refreshing the index would be repeated by every query.
+            pquery.access = lambda *args: False
+            self.assertEqual(pquery._revdep_candidates(namespace,
+                ['dev-util/foo']), None)
+            self.assertEqual(len(locations), 1)
+        finally:
+            pquery.access = orig
+
+
+class RevdepPkgsTest(TestCase):
+
+    def test_all_attrs(self):
+        repo = util.SimpleTree({'dev-util': {'foo': ['1']}})
+        restricts = pquery.revdep_pkgs_finalize([atom.atom('dev-util/foo')],
+            fake_namespace([repo]))
+        # each dependency attribute must match.
+        self.assertEqual(sorted(x.attr for x in restricts),
+            ['depends', 'post_rdepends', 'rdepends'])
@@ -0,0 +1,74 @@
+# License: GPL2/BSD 3 clause
+
+import os
+
+from pkgcore.test import TestCase
+from pkgcore.util import process_pool
+
+
+def _double(iterable, offset=0):
+    for x in iterable:
+        yield (os.getpid(), (x * 2) + offset)
+
+
+def _explode(iterable):
+    for x in iterable:
+        if x == 3:
+            raise ValueError("bad item %r" % (x,))
+        yield x
+
+
+def _die(iterable):
+    for x in iterable:
+        if x == 3:
+            # no chance to report anything back; as if killed.
+            os._exit(1)
+        yield x
+
+
+class TestMapAsync(TestCase):
+
+    def test_results(self):
+        results = list(process_pool.map_async(range(20), _double,
+            processes=3))
+        self.assertEqual(sorted(x[1] for x in results),
+            [x * 2 for x in range(20)])
+        # work must've been done outside of this process.
+        self.assertNotIn(os.getpid(), set(x[0] for x in results))
+
+    def test_args(self):
+        results = list(process_pool.map_async(range(5), _double, 1,
+            processes=2))
+        self.assertEqual(sorted(x[1] for x in results),
+            [(x * 2) + 1 for x in range(5)])
+        results = list(process_pool.map_async(range(5), _double,
+            processes=2, per_process_kwds=lambda:{'offset':3}))
+        self.assertEqual(sorted(x[1] for x in results),
+            [(x * 2) + 3 for x in range(5)])
+
+    def test_parallelism_limited_to_items(self):
+        self.assertEqual(list(process_pool.map_async([], _double,
+            processes=4)), [])
+        self.assertEqual([x[1] for x in process_pool.map_async([2],
+            _double, processes=4)], [4])
+
+    def test_child_failure(self):
+        try:
+            list(process_pool.map_async(range(5), _explode, processes=1))
+        except process_pool.ChildFailure as e:
+            self.assertIn("bad item 3", e.tb)
+        else:
+            self.fail("ChildFailure wasn't raised")
+
+    def test_child_death(self):
+        orig = process_pool._poll_interval
+        process_pool._poll_interval = 0.1
+        try:
+            try:
+                list(process_pool.map_async(range(5), _die, processes=2))
+            except process_pool.ChildFailure as e:
+                self.assertIn("exited with status 1", e.tb)
+            else:
+                self.fail("ChildFailure wasn't raised")
+        finally:
+            process_pool._poll_interval = orig
@@ -0,0 +1,98 @@
+# License: GPL2/BSD
+
+from pkgcore.test import TestCase
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.vdb import contents
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+
+class TestContentsFile(TempDirMixin, TestCase):
+
+    lines = (
+        "dir /usr",
+        "obj /usr/foo bar 0f343b0931126a20f133d67c2b018a3b 123",
+        "sym /usr/link -> /usr/foo bar 5",
+        "fif /usr/fifo",
+        "obj /usr/foo bar 00043b0931126a20f133d67c2b018a3b 124",
+    )
+
+    def mk_contents(self, lines=None, **kwds):
+        path = pjoin(self.dir, 'CONTENTS')
+        with open(path, 'w') as f:
+            f.write(''.join('%s\n' % x for x in (lines or self.lines)))
+        return contents.ContentsFile(path, **kwds)
+
+    def test_parsing(self):
+        cset = self.mk_contents()
+        self.assertEqual(len(cset), 4)
+        # later entries win.
+        obj = cset['/usr/foo bar']
+        self.assertTrue(obj.is_reg)
+        self.assertEqual(obj.mtime, 124)
+        self.assertEqual(obj.chksums,
+            {'md5': long('00043b0931126a20f133d67c2b018a3b', 16)})
+        link = cset['/usr/link']
+        self.assertEqual((link.target, link.mtime), ('/usr/foo bar', 5))
+        self.assertTrue(cset['/usr'].is_dir)
+        self.assertTrue(cset['/usr/fifo'].is_fifo)
+        self.assertNotIn('/usr/missing', cset)
+        self.assertRaises(KeyError, cset.__getitem__, '/usr/missing')
+        self.assertEqual([x.location for x in cset],
+            ['/usr', '/usr/fifo', '/usr/foo bar', '/usr/link'])
+        self.assertRaises(Exception, self.mk_contents, ["foo /usr"])
+
+    def test_equality(self):
+        cset = self.mk_contents()
+        self.assertEqual(cset, self.mk_contents())
+        self.assertEqual(contentsSet(cset, mutable=False),
+            contentsSet(self.mk_contents(), mutable=False))
+        other = self.mk_contents(self.lines[:2])
+        self.assertNotEqual(cset, other)
+
+    def test_mutation(self):
+        cset = self.mk_contents(mutable=True)
+        cset.remove('/usr/fifo')
+        cset.add(fs.fsDir('/usr/lib', strict=False))
+        self.assertEqual(sorted(x.location for x in cset),
+            ['/usr', '/usr/foo bar', '/usr/lib', '/usr/link'])
+        self.assertNotEqual(cset, self.mk_contents())
+        self.assertRaises(AttributeError, self.mk_contents().remove, '/usr')
+
+    def test_round_trip(self):
+        cset = self.mk_contents(mutable=True)
+        cset.remove('/usr/fifo')
+        cset.flush()
+        with open(pjoin(self.dir, 'CONTENTS')) as f:
+            self.assertEqual(f.read().splitlines(), [
+                "dir /usr",
+                "obj /usr/foo bar 00043b0931126a20f133d67c2b018a3b 124",
+                "sym /usr/link -> /usr/foo bar 5"])
+        self.assertEqual(contents.ContentsFile(pjoin(self.dir, 'CONTENTS')),
+            cset)
+
+    def test_odd_md5s(self):
+        long_md5 = '1' + '0f343b0931126a20f133d67c2b018a3b'
+        cset = self.mk_contents([
+            "obj /usr/a %s 1" % (long_md5,),
+            "obj /usr/b -5 2",
+            "obj /usr/c 00043b0931126a20f133d67c2b018a3b 3"])
+        self.assertEqual(cset['/usr/a'].chksums, {'md5': long(long_md5, 16)})
+        self.assertEqual(cset['/usr/b'].chksums, {'md5': -5L})
+        # later entries are unaffected.
+        self.assertEqual(cset['/usr/c'].chksums,
+            {'md5': long('00043b0931126a20f133d67c2b018a3b', 16)})
+
+    def test_unnormalized_locations(self):
+        cset = self.mk_contents([
+            "dir /usr/lib/",
+            "obj //usr/lib/foo 0f343b0931126a20f133d67c2b018a3b 1",
+            "obj /usr/lib/foo 00043b0931126a20f133d67c2b018a3b 2"])
+        # duplicates merge, the later entry winning.
+        self.assertEqual(len(cset), 2)
+        self.assertIn('/usr/lib', cset)
+        self.assertEqual(cset['/usr/lib/foo'].mtime, 2)
+        self.assertEqual([x.location for x in cset],
+            ['/usr/lib', '/usr/lib/foo'])
+        self.assertEqual(sorted(cset._dict), ['/usr/lib', '/usr/lib/foo'])
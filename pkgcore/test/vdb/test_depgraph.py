@@ -0,0 +1,124 @@
+# License: GPL2/BSD
+
+import errno
+import os
+import shutil
+
+from pkgcore.test import TestCase
+from pkgcore.vdb import depgraph, index, ondisk
+from snakeoil.osutils import pjoin, ensure_dirs
+from snakeoil.test.mixins import TempDirMixin
+
+
+class TestDependencyGraph(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb_dir = pjoin(self.dir, 'vdb')
+        self.loc = pjoin(self.dir, 'cache', 'depgraph')
+        self.add('dev-libs', 'lib', '1', slot='0/1')
+        self.add('dev-libs', 'lib', '2', slot='2/2.1')
+        self.add('dev-util', 'foo', '1', rdepend='dev-libs/lib:0/1= '
+            '!dev-util/old', depend='>=dev-libs/lib-2 dev-util/missing')
+        self.add('dev-util', 'bar', '1', use='x',
+            rdepend='x? ( dev-libs/lib:2 ) !x? ( dev-util/foo )')
+
+    def add(self, cat, pkg, ver, slot='0', depend='', rdepend='', use=''):
+        path = pjoin(self.vdb_dir, cat, '%s-%s' % (pkg, ver))
+        ensure_dirs(path)
+        for name, data in (('SLOT', slot), ('DEPEND', depend),
+                ('RDEPEND', rdepend), ('USE', use), ('EAPI', '5')):
+            with open(pjoin(path, name), 'w') as f:
+                f.write(data)
+
+    def mk_graph(self, location=None):
+        return depgraph.DependencyGraph(ondisk.tree(self.vdb_dir), location)
+
+    def test_edges(self):
+        g = self.mk_graph()
+        lib1, lib2 = ('dev-libs', 'lib', '1'), ('dev-libs', 'lib', '2')
+        foo, bar = ('dev-util', 'foo', '1'), ('dev-util', 'bar', '1')
+        self.assertEqual(g.dependencies(foo),
+            {'dev-libs/lib:0/1=': (lib1,), '>=dev-libs/lib-2': (lib2,),
+             'dev-util/missing': ()})
+        self.assertEqual(g.dependencies(foo, ('rdepends',)),
+            {'dev-libs/lib:0/1=': (lib1,)})
+        # conditionals are evaluated against the package's USE.
+        self.assertEqual(g.dependencies(bar), {'dev-libs/lib:2': (lib2,)})
+        # slot aware.
+        self.assertEqual(g.dependents(lib1),
+            {foo: frozenset(['dev-libs/lib:0/1='])})
+        self.assertEqual(g.dependents(lib2),
+            {foo: frozenset(['>=dev-libs/lib-2']),
+             bar: frozenset(['dev-libs/lib:2'])})
+        self.assertEqual(g.dependents(lib2, slot_operator=True), {})
+        self.assertEqual(g.dependents(lib1, slot_operator=True),
+            {foo: frozenset(['dev-libs/lib:0/1='])})
+        self.assertEqual(g.dependents(foo), {})
+        self.assertRaises(KeyError, g.dependents, ('dev-util', 'foo', '2'))
+        self.assertEqual(len(g), 4)
+
+    def test_persistence(self):
+        g = self.mk_graph(self.loc)
+        g.dependents(('dev-libs', 'lib', '2'))
+        self.assertTrue(os.path.isfile(self.loc))
+        g = self.mk_graph(self.loc)
+        g._scan = None
+        # nothing changed, thus no package is reparsed.
+        self.assertEqual(sorted(g.dependents(('dev-libs', 'lib', '2'))),
+            [('dev-util', 'bar', '1'), ('dev-util', 'foo', '1')])
+
+    def test_reconcile(self):
+        self.mk_graph(self.loc).reconcile()
+        shutil.rmtree(pjoin(self.vdb_dir, 'dev-util', 'bar-1'))
+        self.add('dev-util', 'baz', '1', rdepend='dev-libs/lib')
+        g = self.mk_graph(self.loc)
+        self.assertEqual(sorted(g.dependents(('dev-libs', 'lib', '2'))),
+            [('dev-util', 'baz', '1'), ('dev-util', 'foo', '1')])
+        self.assertNotIn(('dev-util', 'bar', '1'), g)
+
+    def test_add_remove(self):
+        g = self.mk_graph(self.loc)
+        lib2 = ('dev-libs', 'lib', '2')
+        g.dependents(lib2)
+        self.add('dev-util', 'baz', '1', rdepend='dev-libs/lib')
+        g.add(('dev-util', 'baz', '1'))
+        g.remove(('dev-util', 'foo', '1'))
+        self.assertEqual(sorted(g.dependents(lib2)),
+            [('dev-util', 'bar', '1'), ('dev-util', 'baz', '1')])
+        self.assertEqual(g.dependents(('dev-libs', 'lib', '1')),
+            {('dev-util', 'baz', '1'): frozenset(['dev-libs/lib'])})
+        # changes were written out.
+        g = self.mk_graph(self.loc)
+        g._reconciled = True
+        self.assertEqual(sorted(g.dependents(lib2)),
+            [('dev-util', 'bar', '1'), ('dev-util', 'baz', '1')])
+
+    def test_unwritable(self):
+        warnings = []
+        def unwritable(*args, **kwds):
+            raise IOError(errno.EACCES, "permission denied")
+        orig = index.AtomicWriteFile, index.logger
+        index.AtomicWriteFile = unwritable
+        index.logger = type('logger', (object,),
+            {'warning': staticmethod(lambda *a: warnings.append(a))})
+        try:
+            g = self.mk_graph(self.loc)
+            self.assertEqual(len(g), 4)
+        finally:
+            index.AtomicWriteFile, index.logger = orig
+        # not having write access is the norm for non root users.
+        self.assertEqual(warnings, [])
+        self.assertFalse(os.path.exists(self.loc))
+
+    def test_vdb_api(self):
+        vdb = ondisk.tree(self.vdb_dir, cache_location=pjoin(self.dir, 'cache'))
+        pkg = vdb.match(vdb.package_class('dev-libs', 'lib', '1'
+            ).versioned_atom)[0]
+        d = vdb.dependents(pkg)
+        self.assertEqual([x.cpvstr for x in d], ['dev-util/foo-1'])
+        foo = list(d)[0]
+        self.assertEqual(sorted((k, [x.cpvstr for x in v])
+            for k, v in vdb.dependencies(foo, ('rdepends',)).iteritems()),
+            [('dev-libs/lib:0/1=', ['dev-libs/lib-1'])])
+        self.assertTrue(os.path.isfile(pjoin(self.dir, 'cache', 'depgraph')))
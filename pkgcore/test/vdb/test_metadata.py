@@ -0,0 +1,110 @@
+# License: GPL2/BSD
+
+import os
+import shutil
+
+from pkgcore.test import TestCase
+from pkgcore.vdb import index, metadata
+from snakeoil.osutils import pjoin, ensure_dirs
+from snakeoil.test.mixins import TempDirMixin
+
+
+class fake_vdb(object):
+
+    def __init__(self, location):
+        self.location = location
+        self.versions = {}
+
+    def add(self, cat, pkg, ver, **files):
+        path = pjoin(self.location, cat, '%s-%s' % (pkg, ver))
+        ensure_dirs(path)
+        for name, data in files.iteritems():
+            with open(pjoin(path, name), 'w') as f:
+                f.write(data)
+        self.versions.setdefault((cat, pkg), []).append(ver)
+
+    def remove(self, cat, pkg, ver):
+        shutil.rmtree(pjoin(self.location, cat, '%s-%s' % (pkg, ver)))
+        self.versions[(cat, pkg)].remove(ver)
+
+
+class TestMetadataCache(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = fake_vdb(pjoin(self.dir, 'vdb'))
+        self.loc = pjoin(self.dir, 'cache', 'metadata')
+        self.vdb.add('dev-util', 'foo', '1', SLOT='0\n',
+            RDEPEND='dev-util/bar\n\tdev-util/baz \\n', CONTENTS='dir /usr\n')
+        self.vdb.add('dev-util', 'bar', '2', SLOT='2', USE='')
+        self.vdb.versions[('dev-util', 'missing')] = ['1']
+
+    def test_get(self):
+        c = metadata.MetadataCache(self.vdb, self.loc)
+        self.assertEqual(c.get('dev-util/foo-1'),
+            {'SLOT': '0\n', 'RDEPEND': 'dev-util/bar\n\tdev-util/baz \\n',
+             'CONTENTS': None})
+        self.assertEqual(c.get('dev-util/bar-2'), {'SLOT': '2', 'USE': ''})
+        self.assertEqual(c.get('dev-util/missing-1'), None)
+        self.assertEqual(c.get('dev-util/foo-2'), None)
+
+    def test_persistence(self):
+        metadata.MetadataCache(self.vdb, self.loc).reconcile()
+        self.assertTrue(os.path.isfile(self.loc))
+        c = metadata.MetadataCache(self.vdb, self.loc)
+        c._scan = None
+        # nothing changed, thus nothing is reread.
+        self.assertEqual(c.get('dev-util/foo-1')['RDEPEND'],
+            'dev-util/bar\n\tdev-util/baz \\n')
+        self.assertEqual(c.get('dev-util/bar-2'), {'SLOT': '2', 'USE': ''})
+
+    def test_reconcile(self):
+        metadata.MetadataCache(self.vdb, self.loc).reconcile()
+        self.vdb.remove('dev-util', 'foo', '1')
+        self.vdb.add('dev-util', 'foo', '2', SLOT='1')
+        c = metadata.MetadataCache(self.vdb, self.loc)
+        self.assertEqual(c.get('dev-util/foo-1'), None)
+        self.assertEqual(c.get('dev-util/foo-2'), {'SLOT': '1'})
+
+    def test_add_remove(self):
+        c = metadata.MetadataCache(self.vdb, self.loc)
+        c.reconcile()
+        self.vdb.add('dev-util', 'foo', '2', SLOT='1')
+        c.add('dev-util/foo-2')
+        c.remove('dev-util/bar-2')
+        # changes were written out.
+        c = metadata.MetadataCache(self.vdb, self.loc)
+        c._reconciled = True
+        self.assertEqual(c.get('dev-util/foo-2'), {'SLOT': '1'})
+        self.assertEqual(c.get('dev-util/bar-2'), None)
+
+    def test_large_files(self):
+        self.vdb.add('dev-util', 'big', '1',
+            DESCRIPTION='x' * (metadata.MetadataCache.max_size + 1))
+        c = metadata.MetadataCache(self.vdb, self.loc)
+        self.assertEqual(c.get('dev-util/big-1'), {'DESCRIPTION': None})
+
+    def test_unwritable(self):
+        metadata.MetadataCache(self.vdb, self.loc).reconcile()
+        self.vdb.add('dev-util', 'foo', '2', SLOT='1')
+        orig = index.access
+        index.access = lambda *args: False
+        try:
+            c = metadata.MetadataCache(self.vdb, self.loc)
+            self.assertFalse(c.persistent)
+            c._scan = None
+            # valid entries are used; nothing is scanned.
+            self.assertEqual(c.get('dev-util/bar-2'), {'SLOT': '2', 'USE': ''})
+            self.assertEqual(c.get('dev-util/foo-2'), None)
+            with open(pjoin(self.vdb.location, 'dev-util', 'bar-2', 'USE'),
+                    'w') as f:
+                f.write('x')
+            os.utime(pjoin(self.vdb.location, 'dev-util', 'bar-2'),
+                (0, 0))
+            c = metadata.MetadataCache(self.vdb, self.loc)
+            # stale entries are left to the vdb.
+            self.assertEqual(c.get('dev-util/bar-2'), None)
+        finally:
+            index.access = orig
+        self.assertTrue(
+            metadata.MetadataCache(self.vdb, self.loc).persistent)
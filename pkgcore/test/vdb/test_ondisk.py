@@ -0,0 +1,148 @@
+# License: GPL2/BSD
+
+import os
+import shutil
+
+from pkgcore.test import TestCase
+from pkgcore.ebuild import triggers
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.merge import errors
+from pkgcore.restrictions import packages, values
+from pkgcore.util import parserestrict
+from pkgcore.vdb import ondisk
+from snakeoil.currying import partial
+from snakeoil.osutils import pjoin, ensure_dirs
+from snakeoil.test.mixins import TempDirMixin
+
+
+owns = parserestrict.comma_separated_containment('contents',
+    values_kls=contentsSet, token_kls=partial(fs.fsBase, strict=False))
+
+
+class TestTree(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb_dir = pjoin(self.dir, 'vdb')
+        self.cache_dir = pjoin(self.dir, 'cache')
+        self.add('dev-libs', 'lib', '1', ['/usr/lib/libfoo.so'])
+        self.add('dev-util', 'foo', '1', ['/usr/bin/foo', '/usr/share/foo'],
+            rdepend='dev-libs/lib')
+        self.add('dev-util', 'bar', '1', ['/usr/bin/bar', '/usr/share/foo'])
+        self.tree = self.mk_tree()
+
+    def add(self, cat, pkg, ver, paths, rdepend=''):
+        path = pjoin(self.vdb_dir, cat, '%s-%s' % (pkg, ver))
+        ensure_dirs(path)
+        for name, data in (('SLOT', '0'), ('EAPI', '5'),
+                ('RDEPEND', rdepend), ('CONTENTS', ''.join(
+                    'obj %s d41d8cd98f00b204e9800998ecf8427e 1\n' % (x,)
+                    for x in paths))):
+            with open(pjoin(path, name), 'w') as f:
+                f.write(data)
+
+    def mk_tree(self):
+        return ondisk.tree(self.vdb_dir, cache_location=self.cache_dir)
+
+    def owners(self, tree, paths):
+        return dict((path, sorted(x.cpvstr for x in pkgs))
+            for path, pkgs in tree.owners(paths).iteritems())
+
+    def test_owners(self):
+        self.assertEqual(self.owners(self.tree,
+            ['/usr/bin/foo', '/usr/share/foo', '/usr/missing']),
+            {'/usr/bin/foo': ['dev-util/foo-1'],
+             '/usr/share/foo': ['dev-util/bar-1', 'dev-util/foo-1']})
+        self.assertTrue(os.path.isfile(pjoin(self.cache_dir, 'owners')))
+        # package instances of the tree are returned.
+        pkg = self.tree.owners(['/usr/bin/foo'])['/usr/bin/foo'][0]
+        self.assertEqual(pkg.rdepends.restrictions[0].key, 'dev-libs/lib')
+
+    def candidates(self, restrict):
+        return sorted(self.tree._identify_candidates(restrict, iter))
+
+    def test_identify_candidates(self):
+        fast = [('dev-util', 'foo')]
+        every = [('dev-libs', 'lib'), ('dev-util', 'bar'), ('dev-util', 'foo')]
+        restrict = owns('/usr/bin/foo')
+        self.assertEqual(self.candidates(restrict), fast)
+        self.assertEqual([x.cpvstr for x in self.tree.itermatch(restrict)],
+            ['dev-util/foo-1'])
+        # each solution requiring an owned path is enough.
+        cat = packages.PackageRestriction('category',
+            values.StrExactMatch('dev-util'))
+        self.assertEqual(self.candidates(
+            packages.AndRestriction(cat, restrict)), fast)
+        self.assertEqual(self.candidates(packages.OrRestriction(restrict,
+            owns('/usr/bin/bar'))), [('dev-util', 'bar'), ('dev-util', 'foo')])
+        # anything else falls back to the package names.
+        self.assertEqual(self.candidates(
+            packages.OrRestriction(cat, restrict)), every)
+        self.assertEqual(self.candidates(packages.PackageRestriction(
+            'contents', restrict.restriction, negate=True)), every)
+        self.assertEqual(self.candidates(packages.PackageRestriction(
+            'contents', values.ContainmentMatch2(restrict.restriction.vals,
+                negate=True))), every)
+        self.assertEqual(self.candidates(packages.PackageRestriction(
+            'contents', values.AnyMatch(values.GetAttrRestriction('location',
+                values.StrExactMatch('/usr/bin/foo'))))), every)
+        self.assertEqual(sorted(x.cpvstr for x in self.tree.itermatch(
+            packages.PackageRestriction('contents', restrict.restriction,
+                negate=True))),
+            ['dev-libs/lib-1', 'dev-util/bar-1'])
+
+    def test_notify(self):
+        lib = self.tree.match(owns('/usr/lib/libfoo.so'))[0]
+        self.assertEqual([x.cpvstr for x in self.tree.dependents(lib)],
+            ['dev-util/foo-1'])
+        self.add('dev-util', 'baz', '1', ['/usr/bin/baz', '/usr/bin/foo'],
+            rdepend='dev-libs/lib')
+        baz = self.tree.package_class('dev-util', 'baz', '1')
+        self.tree.notify_add_package(baz)
+        self.assertEqual(self.owners(self.tree, ['/usr/bin/foo']),
+            {'/usr/bin/foo': ['dev-util/baz-1', 'dev-util/foo-1']})
+        self.assertEqual(sorted(x.cpvstr for x in self.tree.dependents(lib)),
+            ['dev-util/baz-1', 'dev-util/foo-1'])
+        foo = self.tree.match(owns('/usr/bin/foo'))
+        self.assertEqual(sorted(x.cpvstr for x in foo),
+            ['dev-util/baz-1', 'dev-util/foo-1'])
+
+        shutil.rmtree(pjoin(self.vdb_dir, 'dev-util', 'baz-1'))
+        self.tree.notify_remove_package(baz)
+        self.assertEqual(self.owners(self.tree, ['/usr/bin/baz']), {})
+        self.assertEqual([x.cpvstr for x in self.tree.dependents(lib)],
+            ['dev-util/foo-1'])
+        # the persisted indexes were updated; nothing is rescanned.
+        tree = self.mk_tree()
+        tree._owners_index._scan = tree._dependency_graph._scan = None
+        self.assertEqual(self.owners(tree, ['/usr/bin/foo']),
+            {'/usr/bin/foo': ['dev-util/foo-1']})
+        self.assertEqual([x.cpvstr for x in tree.dependents(lib)],
+            ['dev-util/foo-1'])
+        self.assertEqual(tree._metadata_cache.get('dev-util/foo-1')['RDEPEND'],
+            'dev-libs/lib')
+
+    def test_protect_owned(self):
+        lookups = []
+        tree_owners = self.tree.owners
+        def owners(paths):
+            paths = list(paths)
+            lookups.append(sorted(paths))
+            return tree_owners(paths)
+        self.tree.owners = owners
+        trigger = triggers.ProtectOwned([self.tree])
+        colliding = contentsSet([fs.fsFile(x, strict=False)
+            for x in ('/usr/share/foo', '/usr/bin/unowned')])
+        try:
+            trigger.collision(colliding)
+        except errors.BlockModification as e:
+            msg = str(e)
+        else:
+            self.fail("owned files didn't block the merge")
+        self.assertIn("'dev-util/bar-1'", msg)
+        self.assertIn("'dev-util/foo-1'", msg)
+        self.assertNotIn('unowned', msg)
+        self.assertEqual(lookups, [['/usr/bin/unowned', '/usr/share/foo']])
+        trigger.collision(contentsSet([fs.fsFile('/usr/bin/unowned',
+            strict=False)]))
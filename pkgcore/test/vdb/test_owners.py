@@ -0,0 +1,86 @@
+# License: GPL2/BSD
+
+import os
+
+from pkgcore.test import TestCase
+from pkgcore.vdb import owners
+from snakeoil.osutils import pjoin, ensure_dirs
+from snakeoil.test.mixins import TempDirMixin
+
+
+class fake_vdb(object):
+
+    def __init__(self, location):
+        self.location = location
+        self.versions = {}
+
+    def add(self, cat, pkg, ver, contents):
+        path = pjoin(self.location, cat, '%s-%s' % (pkg, ver))
+        ensure_dirs(path)
+        with open(pjoin(path, 'CONTENTS'), 'w') as f:
+            for x in contents:
+                f.write('dir %s\n' % (x,))
+        self.versions.setdefault((cat, pkg), []).append(ver)
+
+    def remove(self, cat, pkg, ver):
+        os.unlink(pjoin(self.location, cat, '%s-%s' % (pkg, ver), 'CONTENTS'))
+        self.versions[(cat, pkg)].remove(ver)
+
+
+class TestOwnersIndex(TempDirMixin, TestCase):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = fake_vdb(pjoin(self.dir, 'vdb'))
+        self.loc = pjoin(self.dir, 'cache', 'owners')
+        self.vdb.add('dev-util', 'foo', '1', ['/usr', '/usr/foo'])
+        self.vdb.add('dev-util', 'bar', '2', ['/usr', '/usr/bar'])
+
+    def test_lookup(self):
+        i = owners.OwnersIndex(self.vdb, self.loc)
+        d = i.owners(['/usr', '/usr/foo', '/usr/nonexistent'])
+        self.assertEqual(sorted(d), ['/usr', '/usr/foo'])
+        self.assertEqual(sorted(d['/usr']),
+            [('dev-util', 'bar', '2'), ('dev-util', 'foo', '1')])
+        self.assertEqual(d['/usr/foo'], (('dev-util', 'foo', '1'),))
+
+    def test_persistence(self):
+        i = owners.OwnersIndex(self.vdb, self.loc)
+        i.owners(['/usr'])
+        self.assertTrue(os.path.isfile(self.loc))
+        i = owners.OwnersIndex(self.vdb, self.loc)
+        i._scan = None
+        # nothing changed, thus no contents are reparsed.
+        self.assertEqual(i.owners(['/usr/bar']),
+            {'/usr/bar': (('dev-util', 'bar', '2'),)})
+
+    def test_reconcile(self):
+        owners.OwnersIndex(self.vdb, self.loc).owners(['/usr'])
+        self.vdb.remove('dev-util', 'foo', '1')
+        self.vdb.add('dev-util', 'foo', '2', ['/usr/foo2'])
+        i = owners.OwnersIndex(self.vdb, self.loc)
+        self.assertEqual(i.owners(['/usr/foo', '/usr/foo2']),
+            {'/usr/foo2': (('dev-util', 'foo', '2'),)})
+
+    def test_add_remove(self):
+        i = owners.OwnersIndex(self.vdb, self.loc)
+        i.owners(['/usr'])
+        self.vdb.add('dev-util', 'foo', '2', ['/usr/foo2'])
+        i.add(('dev-util', 'foo', '2'))
+        self.assertEqual(i.owners(['/usr/foo2']),
+            {'/usr/foo2': (('dev-util', 'foo', '2'),)})
+        i.remove(('dev-util', 'bar', '2'))
+        self.assertEqual(i.owners(['/usr']),
+            {'/usr': (('dev-util', 'foo', '1'),)})
+        # changes were written out.
+        i = owners.OwnersIndex(self.vdb, self.loc)
+        i._reconciled = True
+        self.assertEqual(i.owners(['/usr', '/usr/foo2']),
+            {'/usr': (('dev-util', 'foo', '1'),),
+             '/usr/foo2': (('dev-util', 'foo', '2'),)})
+
+    def test_memory_only(self):
+        i = owners.OwnersIndex(self.vdb)
+        self.assertEqual(sorted(i.owners(['/usr'])['/usr']),
+            [('dev-util', 'bar', '2'), ('dev-util', 'foo', '1')])
+        self.assertFalse(os.path.exists(self.loc))
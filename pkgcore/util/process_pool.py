@@ -0,0 +1,176 @@
+# License: GPL2/BSD 3 clause
+
+"""
+process based analog of :obj:`pkgcore.util.thread_pool`
+
+Work is farmed out to forked children; each child runs the given functor
+against an iterable fed from the parent, and anything the functor yields
+is shipped back to the parent.  Since the children are forks, they start
+with the parent's state, but everything passed through the queues (the
+items of the iterable, and the yielded results) must be picklable.
+"""
+
+__all__ = ("map_async",)
+
+import multiprocessing
+import traceback
+from Queue import Empty
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'snakeoil.process:get_proc_count',
+)
+
+
+class _ChildFinished(object):
+
+    """sent by a child once it's done; tells the parent which child it was"""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+
+class ChildFailure(Exception):
+
+    """A child raised an unhandled exception; the traceback is stored."""
+
+    def __init__(self, pid, tb):
+        Exception.__init__(self,
+            "child process %i failed:\n%s" % (pid, tb))
+        self.pid, self.tb = pid, tb
+        # required for this to survive pickling back to the parent.
+        self.args = (pid, tb)
+
+
+# seconds to wait on results before checking for dead children.
+_poll_interval = 1
+
+
+def iter_queue(queue, empty_signal):
+    while True:
+        item = queue.get()
+        if item == empty_signal:
+            return
+        yield item
+
+
+def _child_main(functor, in_queue, out_queue, empty_signal, args, kwds):
+    # note the finished marker is always sent; the parent relies on it to
+    # know when a child is done.
+    pid = multiprocessing.current_process().pid
+    try:
+        try:
+            for result in functor(iter_queue(in_queue, empty_signal),
+                                  *args, **kwds):
+                out_queue.put(result)
+        except compatibility.IGNORED_EXCEPTIONS as e:
+            if not isinstance(e, KeyboardInterrupt):
+                out_queue.put(ChildFailure(pid, traceback.format_exc()))
+        except Exception:
+            out_queue.put(ChildFailure(pid, traceback.format_exc()))
+    finally:
+        out_queue.put(_ChildFinished(pid))
+        out_queue.close()
+        out_queue.join_thread()
+
+
+def map_async(iterable, functor, *args, **kwds):
+    """
+    fork a pool of children, feeding iterable to them; yields their results
+
+    Note this is a generator; children aren't started till it's iterated.
+
+    :param iterable: items to hand off to the children; these must be
+        picklable
+    :param functor: generator function ran in each child; it's invoked
+        with an iterable of the items that child should process as the first
+        argument, followed by args and kwds.  Anything it yields is sent
+        back to the parent (thus must be picklable).
+    :keyword processes: number of children to use; defaults to the number of
+        processors.
+    :keyword per_process_args: callable returning a tuple of extra
+        positional args for each child; invoked in the parent.
+    :keyword per_process_kwds: callable returning a dict of extra keyword
+        args for each child; invoked in the parent.
+    :raise ChildFailure: if a child hit an unhandled exception, or died
+        without finishing.
+    """
+    per_process_args = kwds.pop("per_process_args", lambda:())
+    per_process_kwds = kwds.pop("per_process_kwds", lambda:{})
+    parallelism = kwds.pop("processes", None)
+    if parallelism is None:
+        parallelism = get_proc_count()
+
+    if hasattr(iterable, '__len__'):
+        # if there are less items than parallelism, don't
+        # fork pointless children.
+        parallelism = max(min(len(iterable), parallelism), 0)
+
+    # a plain marker string; object() instances don't survive pickling
+    # with their identity intact.
+    empty_signal = "__pkgcore_process_pool_empty_signal__"
+    in_queue = multiprocessing.Queue()
+    out_queue = multiprocessing.Queue()
+
+    children = []
+    for x in xrange(parallelism):
+        ckwds = kwds.copy()
+        ckwds.update(per_process_kwds())
+        cargs = args + per_process_args()
+        children.append(multiprocessing.Process(target=_child_main,
+            args=(functor, in_queue, out_queue, empty_signal, cargs, ckwds)))
+
+    failure = None
+    try:
+        for child in children:
+            child.start()
+        # the queue is unbounded and fed via a background thread, thus
+        # this won't block on the children consuming it.
+        for item in iterable:
+            in_queue.put(item)
+        for x in xrange(parallelism):
+            in_queue.put(empty_signal)
+
+        running = parallelism
+        finished = set()
+        suspects = ()
+        while running:
+            try:
+                result = out_queue.get(timeout=_poll_interval)
+            except Empty:
+                # a child killed outright (oom killer, segfault) never
+                # sends its finished marker.  Whatever a dead child did
+                # send is readable by the next poll, so it's only deemed
+                # failed if it's still unaccounted for then.
+                dead = dict((child.pid, child.exitcode) for child in children
+                    if child.pid not in finished
+                    and child.exitcode is not None)
+                for pid in suspects:
+                    if pid in dead:
+                        finished.add(pid)
+                        running -= 1
+                        if failure is None:
+                            failure = ChildFailure(pid, "exited with status "
+                                "%r without finishing" % (dead[pid],))
+                suspects = [pid for pid in dead if pid not in finished]
+                continue
+            if isinstance(result, _ChildFinished):
+                finished.add(result.pid)
+                running -= 1
+            elif isinstance(result, ChildFailure):
+                if failure is None:
+                    failure = result
+            else:
+                yield result
+    except:
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+        raise
+    finally:
+        for child in children:
+            if child.pid is not None:
+                child.join()
+
+    if failure is not None:
+        raise failure
@@ -3,16 +3,21 @@
 
 __all__ = ("LookupFsDev", "ContentsFile")
 
+from array import array
+from bisect import bisect_left
+
 from pkgcore.fs.contents import contentsSet
 from pkgcore.fs import fs
 from snakeoil import data_source
 
 from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import normpath
 from snakeoil.demandload import demandload
 demandload(globals(),
     'os',
     'stat',
     'errno',
+    'binascii',
     'snakeoil.chksum:get_handler',
     'snakeoil.fileutils:readlines_ascii',
     'pkgcore:os_data',
@@ -41,6 +46,196 @@ class LookupFsDev(fs.fsDev):
         fs.fsDev.__init__(self, path, **kwds)
 
 
+def _parse_line(line):
+    """
+    parse a CONTENTS line
+
+    :return: (type, location, md5 hex, mtime, symlink target); type is one
+        of 'obj', 'sym', 'dir', 'dev', 'fif'; fields the type lacks are None.
+        The location is normalized, as fs objects' locations are.
+    """
+    s = line.split(" ")
+    if s[0] in ("dir", "dev", "fif"):
+        return (s[0], normpath(' '.join(s[1:])), None, None, None)
+    elif s[0] == "obj":
+        return ("obj", normpath(' '.join(s[1:-2])), s[-2], long(s[-1]), None)
+    elif s[0] == "sym":
+        # XXX throw a corruption error if there's no "->"
+        p = s.index("->")
+        return ("sym", normpath(' '.join(s[1:p])), None, long(s[-1]),
+            ' '.join(s[p+1:-1]))
+    raise Exception("unknown entry type %r" % (line,))
+
+
+class _CompactContents(object):
+
+    """
+    location -> fs object mapping of a CONTENTS file, stored compactly
+
+    Entries are held as a sorted array of locations with parallel arrays of
+    their types, mtimes, and md5s; fs objects are created as they're
+    accessed rather than for every entry up front, and aren't retained.
+    The first mutation converts it into a plain dict.  Checksums that don't
+    fit an md5 (a corrupted CONTENTS) are held aside as is.
+    """
+
+    __slots__ = ("_locations", "_types", "_mtimes", "_md5s", "_targets",
+        "_odd_md5s", "_dict")
+
+    _md5_len = 16
+    _null_md5 = '\0' * 16
+
+    def __init__(self, entries):
+        """
+        :param entries: iterable of :obj:`_parse_line` results; later
+            entries for a location override earlier ones
+        """
+        latest = {}
+        for entry in entries:
+            latest[entry[1]] = entry
+        self._locations = sorted(latest)
+        self._types = array('c')
+        self._mtimes = array('l')
+        md5s = []
+        self._targets = {}
+        self._odd_md5s = {}
+        for i, location in enumerate(self._locations):
+            kind, location, md5, mtime, target = latest[location]
+            self._types.append(kind[0])
+            self._mtimes.append(mtime or 0)
+            if md5 is None:
+                md5s.append(self._null_md5)
+            else:
+                md5 = long(md5, 16)
+                if 0 <= md5 < 1 << (self._md5_len * 8):
+                    md5s.append(binascii.unhexlify("%032x" % (md5,)))
+                else:
+                    # keeping it in the array would shift later entries.
+                    md5s.append(self._null_md5)
+                    self._odd_md5s[i] = md5
+            if target is not None:
+                self._targets[i] = target
+        self._md5s = ''.join(md5s)
+        self._dict = None
+
+    def _index(self, location):
+        i = bisect_left(self._locations, location)
+        if i != len(self._locations) and self._locations[i] == location:
+            return i
+        return None
+
+    def _materialize(self, i):
+        kind, location = self._types[i], self._locations[i]
+        if kind == 'o':
+            md5 = self._odd_md5s.get(i)
+            if md5 is None:
+                md5 = long(binascii.hexlify(
+                    self._md5s[i * self._md5_len:(i + 1) * self._md5_len]), 16)
+            return fs.fsFile(location, chksums={"md5":md5},
+                mtime=long(self._mtimes[i]), strict=False)
+        elif kind == 's':
+            return fs.fsLink(location, self._targets[i],
+                mtime=long(self._mtimes[i]), strict=False)
+        elif kind == 'd':
+            return fs.fsDir(location, strict=False)
+        elif kind == 'f':
+            return fs.fsFifo(location, strict=False)
+        return LookupFsDev(location, strict=False)
+
+    def _spill(self):
+        if self._dict is None:
+            self._dict = dict(self.iteritems())
+            self._locations = self._types = self._mtimes = None
+            self._md5s = self._targets = self._odd_md5s = None
+        return self._dict
+
+    def __len__(self):
+        if self._dict is not None:
+            return len(self._dict)
+        return len(self._locations)
+
+    def __iter__(self):
+        if self._dict is not None:
+            return iter(self._dict)
+        return iter(self._locations)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def itervalues(self):
+        if self._dict is not None:
+            return self._dict.itervalues()
+        return (self._materialize(i) for i in xrange(len(self._locations)))
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        if self._dict is not None:
+            return self._dict.iteritems()
+        return ((x.location, x) for x in self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __contains__(self, location):
+        if self._dict is not None:
+            return location in self._dict
+        return self._index(location) is not None
+
+    has_key = __contains__
+
+    def __getitem__(self, location):
+        if self._dict is not None:
+            return self._dict[location]
+        i = self._index(location)
+        if i is None:
+            raise KeyError(location)
+        return self._materialize(i)
+
+    def get(self, location, default=None):
+        try:
+            return self[location]
+        except KeyError:
+            return default
+
+    def __setitem__(self, location, obj):
+        self._spill()[location] = obj
+
+    def __delitem__(self, location):
+        del self._spill()[location]
+
+    def pop(self, location, *default):
+        return self._spill().pop(location, *default)
+
+    def update(self, *args, **kwds):
+        self._spill().update(*args, **kwds)
+
+    def setdefault(self, location, default=None):
+        return self._spill().setdefault(location, default)
+
+    def clear(self):
+        self._spill().clear()
+
+    def __eq__(self, other):
+        if not isinstance(other, (dict, _CompactContents)):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        return all(location in other and other[location] == obj
+            for location, obj in self.iteritems())
+
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        if ret is NotImplemented:
+            return ret
+        return not ret
+
+    __hash__ = None
+
+
 class ContentsFile(contentsSet):
     """class wrapping a contents file"""
 
@@ -52,7 +247,8 @@ class ContentsFile(contentsSet):
         self._source = source
 
         if not create:
-            self.update(self._iter_contents())
+            # fs objects are only created as they're accessed.
+            self._dict = _CompactContents(self._iter_entries())
 
         self.mutable = mutable
 
@@ -86,39 +282,10 @@ class ContentsFile(contentsSet):
     def flush(self):
         return self._write()
 
-    def _iter_contents(self):
-        self.clear()
+    def _iter_entries(self):
         for line in self._get_fd():
-            if not line:
-                continue
-            s = line.split(" ")
-            if s[0] in ("dir", "dev", "fif"):
-                path = ' '.join(s[1:])
-                if s[0] == 'dir':
-                    obj = fs.fsDir(path, strict=False)
-                elif s[0] == 'dev':
-                    obj = LookupFsDev(path, strict=False)
-                else:
-                    obj = fs.fsFifo(path, strict=False)
-            elif s[0] == "obj":
-                path = ' '.join(s[1:-2])
-                obj = fs.fsFile(
-                    path, chksums={"md5":long(s[-2], 16)},
-                        mtime=long(s[-1]), strict=False)
-            elif s[0] == "sym":
-                try:
-                    p = s.index("->")
-                    obj = fs.fsLink(' '.join(s[1:p]), ' '.join(s[p+1:-1]),
-                        mtime=long(s[-1]), strict=False)
-
-                except ValueError:
-                    # XXX throw a corruption error
-                    raise
-            else:
-                raise Exception(
-                    "unknown entry type %r" % (line,))
-
-            yield obj
+            if line:
+                yield _parse_line(line)
 
     def _write(self):
         md5_handler = get_handler('md5')
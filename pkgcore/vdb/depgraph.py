@@ -0,0 +1,230 @@
+# License: GPL2/BSD
+
+"""
+installed package dependency graph for the vdb
+
+Answering what an installed package depends upon, or what depends upon it,
+otherwise requires loading and parsing every installed package's DEPEND,
+RDEPEND, and PDEPEND.  This records the atoms each package depends upon;
+the edges are resolved against the installed packages' versions and slots
+in memory.
+"""
+
+__all__ = ("DependencyGraph",)
+
+from pkgcore.vdb import index
+from snakeoil.lists import iflatten_instance
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'pkgcore.ebuild:atom,cpv',
+    'pkgcore.log:logger',
+)
+
+
+class _node(object):
+
+    """
+    minimal stand in for an installed package, sufficient for matching
+    atoms lacking use deps
+    """
+
+    __slots__ = ("cpv", "slot", "subslot")
+
+    def __init__(self, key, fullslot):
+        self.cpv = cpv.versioned_CPV("%s/%s-%s" % key)
+        slot, sep, subslot = fullslot.partition('/')
+        self.slot = slot
+        self.subslot = subslot or slot
+
+    def __getattr__(self, attr):
+        return getattr(self.cpv, attr)
+
+
+class DependencyGraph(index.base):
+
+    """
+    dependency edges between installed (category, package, fullver) keys
+
+    Persisted entries are of the form::
+
+      category<TAB>package<TAB>fullver<TAB>stamp<TAB>slot
+      <TAB>depends<TAB>atom atom
+      <TAB>rdepends<TAB>atom
+
+    Blockers aren't dependencies, thus aren't recorded.
+    """
+
+    magic = 'pkgcore vdb dependency graph 1'
+    description = 'dependency graph'
+    dep_attrs = ('depends', 'rdepends', 'post_rdepends')
+
+    def __init__(self, vdb, location=None):
+        """
+        :param vdb: :obj:`pkgcore.vdb.ondisk.tree` instance to index
+        :param location: file path to persist the graph to; if None, it's
+            rebuilt in memory for each instance
+        """
+        index.base.__init__(self, vdb, location)
+        self._atoms = {}
+        # built on first query, maintained from then on.
+        self._nodes = None
+        self._by_key = None
+        self._reverse = None
+
+    def _parse(self, f):
+        # (cat, pkg, fullver) -> (stamp, fullslot, {attr: atom strings})
+        d = {}
+        deps = None
+        for line in f:
+            line = line.rstrip('\n').split('\t')
+            if not line[0]:
+                if deps is not None and len(line) == 3:
+                    deps[line[1]] = tuple(line[2].split())
+                continue
+            if len(line) != 5:
+                # corrupted header; ignore its edges.
+                deps = None
+                continue
+            deps = {}
+            d[tuple(line[:3])] = (line[3], line[4], deps)
+        return d
+
+    def _serialize(self, f):
+        for key, (stamp, fullslot, deps) in sorted(self._entries.iteritems()):
+            f.write("%s\t%s\t%s\n" % ('\t'.join(key), stamp, fullslot))
+            for attr, atoms in sorted(deps.iteritems()):
+                f.write("\t%s\t%s\n" % (attr, ' '.join(atoms)))
+
+    def _scan(self, key, stamp):
+        if stamp == '-':
+            return (stamp, '0', {})
+        try:
+            pkg = self.vdb.package_class(*key)
+            deps = {}
+            for attr in self.dep_attrs:
+                atoms = set(str(x) for x in
+                    iflatten_instance(getattr(pkg, attr), atom.atom)
+                    if not x.blocks)
+                if atoms:
+                    deps[attr] = tuple(sorted(atoms))
+            return (stamp, pkg.fullslot, deps)
+        except compatibility.IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            logger.warning("failed reading dependencies of %s/%s-%s: %s",
+                *(key + (e,)))
+            return ('-', '0', {})
+
+    def _build(self):
+        if self._nodes is None:
+            self.reconcile()
+            self._nodes, self._by_key, self._reverse = {}, {}, {}
+            for key, entry in self._entries.iteritems():
+                self._link(key, entry)
+
+    def _link(self, key, entry):
+        self._nodes[key] = _node(key, entry[1])
+        self._by_key.setdefault("%s/%s" % key[:2], set()).add(key)
+        for attr, atoms in entry[2].iteritems():
+            for x in atoms:
+                self._reverse.setdefault(self._atom(x).key, {}).setdefault(
+                    key, set()).add((attr, x))
+
+    def _unlink(self, key, entry):
+        del self._nodes[key]
+        pkgkey = "%s/%s" % key[:2]
+        self._by_key[pkgkey].discard(key)
+        if not self._by_key[pkgkey]:
+            del self._by_key[pkgkey]
+        for attr, atoms in entry[2].iteritems():
+            for x in atoms:
+                target = self._atom(x).key
+                dependents = self._reverse.get(target)
+                if dependents is not None:
+                    dependents.pop(key, None)
+                    if not dependents:
+                        del self._reverse[target]
+
+    def _atom(self, atom_str):
+        a = self._atoms.get(atom_str)
+        if a is None:
+            a = self._atoms[atom_str] = atom.atom(atom_str)
+        return a
+
+    def _match(self, a, key):
+        if a.use is not None:
+            # needs the package's use/iuse state; check the package itself.
+            return a.match(self.vdb.package_class(*key))
+        return a.match(self._nodes[key])
+
+    @property
+    def _built(self):
+        return self._nodes is not None
+
+    def _update(self, key, old, new):
+        if self._nodes is None:
+            return
+        if old is not None:
+            self._unlink(key, old)
+        if new is not None:
+            self._link(key, new)
+
+    def dependencies(self, key, attrs=None):
+        """
+        forward edges of an installed package
+
+        :param key: (category, package, fullver) tuple
+        :param attrs: dependency attributes to consider; defaults to
+            :obj:`dep_attrs`
+        :return: dict of atom string -> tuple of the installed keys
+            satisfying it; unsatisfied atoms map to an empty tuple
+        """
+        self._build()
+        deps = self._entries[key][2]
+        d = {}
+        for attr in (attrs or self.dep_attrs):
+            for x in deps.get(attr, ()):
+                a = self._atom(x)
+                d[x] = tuple(sorted(k for k in self._by_key.get(a.key, ())
+                    if self._match(a, k)))
+        return d
+
+    def dependents(self, key, attrs=None, slot_operator=False):
+        """
+        reverse edges of an installed package
+
+        :param key: (category, package, fullver) tuple
+        :param attrs: dependency attributes to consider; defaults to
+            :obj:`dep_attrs`
+        :param slot_operator: if True, only consider atoms using the ``:=``
+            slot operator- those bound to the package's subslot
+        :return: dict of installed key -> frozenset of the atom strings by
+            which it depends on key
+        """
+        self._build()
+        if key not in self._nodes:
+            raise KeyError(key)
+        if attrs is None:
+            attrs = self.dep_attrs
+        d = {}
+        for dependent, atoms in \
+                self._reverse.get("%s/%s" % key[:2], {}).iteritems():
+            matched = frozenset(x for attr, x in atoms if attr in attrs
+                and (not slot_operator or self._atom(x).slot_operator == '=')
+                and self._match(self._atom(x), key))
+            if matched:
+                d[dependent] = matched
+        return d
+
+    def __contains__(self, key):
+        self.reconcile()
+        return key in self._entries
+
+    def __iter__(self):
+        self.reconcile()
+        return iter(self._entries)
+
+    def __len__(self):
+        self.reconcile()
+        return len(self._entries)
@@ -0,0 +1,200 @@
+# License: GPL2/BSD
+
+"""
+base class for indexes derived from the vdb, persisted across runs
+
+Deriving data from every installed package (the files each owns, its
+dependencies, ...) requires reading every package's vdb entry.  Indexes
+based on :obj:`base` persist the data of each package alongside a stamp of
+its vdb entry; on load they're reconciled against the vdb, so only packages
+merged/unmerged outside of the vdb instance (or by another package manager)
+are rescanned.
+"""
+
+__all__ = ("base",)
+
+import os
+
+from pkgcore.os_data import portage_gid
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import access, ensure_dirs, pjoin
+from snakeoil import klass
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'errno',
+    'pkgcore.log:logger',
+)
+
+
+class base(object):
+
+    """
+    mapping of installed package key -> (stamp, data...) entries
+
+    Keys are (category, package, fullver) tuples unless :obj:`_installed`
+    and :obj:`_path` are overridden.  Derivatives must define
+    :obj:`magic` and :obj:`description`, and implement :obj:`_parse`,
+    :obj:`_scan`, and :obj:`_serialize`.  A stamp of ``-`` marks an
+    entry that couldn't be read.
+    """
+
+    magic = None
+    description = None
+
+    def __init__(self, vdb, location=None):
+        """
+        :param vdb: :obj:`pkgcore.vdb.ondisk.tree` instance to index
+        :param location: file path to persist the index to; if None, it's
+            rebuilt in memory for each instance
+        """
+        self.vdb = vdb
+        self.location = location
+        self._reconciled = False
+
+    @klass.jit_attr
+    def persistent(self):
+        """whether the index can be written out to :obj:`location`"""
+        if self.location is None:
+            return False
+        parent = os.path.dirname(os.path.abspath(self.location))
+        while not os.path.exists(parent):
+            parent = os.path.dirname(parent)
+        return access(parent, os.W_OK|os.X_OK)
+
+    @klass.jit_attr
+    def _entries(self):
+        if self.location is None:
+            return {}
+        try:
+            f = open(self.location, 'r')
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                logger.warning("failed reading %s %r: %s",
+                    self.description, self.location, e)
+            return {}
+        with f:
+            if f.readline().rstrip('\n') != self.magic:
+                return {}
+            return self._parse(f)
+
+    def _parse(self, f):
+        """
+        :param f: file object positioned after the magic line
+        :return: dict of key -> entry
+        """
+        raise NotImplementedError(self, '_parse')
+
+    def _serialize(self, f):
+        """write all entries to file object f, after the magic line"""
+        raise NotImplementedError(self, '_serialize')
+
+    def _path(self, key):
+        return pjoin(self.vdb.location, key[0], "%s-%s" % key[1:])
+
+    def _stamp_path(self, key):
+        """path whose stat validates the entry of key"""
+        return self._path(key)
+
+    def _stamp(self, key):
+        try:
+            st = os.stat(self._stamp_path(key))
+        except EnvironmentError:
+            return '-'
+        return "%r:%i:%i" % (st.st_mtime, st.st_size, st.st_ino)
+
+    def _scan(self, key, stamp):
+        """
+        :return: entry of key, read from the vdb; the entry's first item
+            is the stamp, ``-`` if reading it failed
+        """
+        raise NotImplementedError(self, '_scan')
+
+    def _installed(self):
+        return set((cat, pkg, ver)
+            for (cat, pkg), vers in self.vdb.versions.iteritems()
+            for ver in vers)
+
+    @property
+    def _built(self):
+        """whether in memory state derived from the entries exists"""
+        return False
+
+    def _update(self, key, old, new):
+        """
+        maintain in memory state derived from the entries
+
+        :param old: previous entry of key, None if it had none
+        :param new: new entry of key, None if it's being removed
+        """
+
+    def reconcile(self):
+        """
+        bring the index in sync with the vdb
+
+        Only packages whose vdb entry changed since they were indexed are
+        rescanned.
+        """
+        if self._reconciled:
+            return
+        entries = self._entries
+        installed = self._installed()
+        dirty = False
+        for key in set(entries).difference(installed):
+            del entries[key]
+            dirty = True
+        for key in installed:
+            stamp = self._stamp(key)
+            entry = entries.get(key)
+            if entry is None or entry[0] != stamp:
+                entries[key] = self._scan(key, stamp)
+                dirty = True
+        self._reconciled = True
+        if dirty:
+            self.commit()
+
+    def add(self, key):
+        """
+        (re)index an installed package, writing the index out
+
+        :param key: key of the package
+        """
+        if self.location is None and not self._built:
+            # nothing built yet, thus nothing to maintain.
+            return
+        entry = self._scan(key, self._stamp(key))
+        self._update(key, self._entries.get(key), entry)
+        self._entries[key] = entry
+        self.commit()
+
+    def remove(self, key):
+        """
+        drop a package from the index, writing the index out
+
+        :param key: key of the package
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._update(key, entry, None)
+        self.commit()
+
+    def commit(self):
+        """write the index out"""
+        if self.location is None:
+            return
+        f = None
+        try:
+            if not ensure_dirs(os.path.dirname(self.location),
+                               gid=portage_gid, mode=0775):
+                return
+            f = AtomicWriteFile(self.location, gid=portage_gid, perms=0664)
+            f.write("%s\n" % (self.magic,))
+            self._serialize(f)
+            f.close()
+        except EnvironmentError as e:
+            if f is not None:
+                f.discard()
+            # not being root is the norm for query usage; stay quiet.
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.warning("unable to update %s %r: %s",
+                    self.description, self.location, e)
@@ -0,0 +1,141 @@
+# License: GPL2/BSD
+
+"""
+consolidated metadata cache for the vdb
+
+Each installed package's metadata is stored as one small file per key
+(SLOT, USE, RDEPEND, ...) in its vdb directory; accessing a few keys across
+all installed packages thus costs a file read per key per package.  This
+aggregates the small files of every package into a single file.
+"""
+
+__all__ = ("MetadataCache",)
+
+import os
+import re
+
+from pkgcore.vdb import index
+from snakeoil.fileutils import readfile
+from snakeoil.osutils import listdir_files, pjoin
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'pkgcore.log:logger',
+)
+
+_escapes = {'\\': '\\\\', '\n': '\\n', '\t': '\\t'}
+_unescapes = dict((v, k) for k, v in _escapes.iteritems())
+_escape_re = re.compile(r'[\\\n\t]')
+_unescape_re = re.compile(r'\\[\\nt]')
+
+
+def _escape(s):
+    return _escape_re.sub(lambda m: _escapes[m.group()], s)
+
+def _unescape(s):
+    return _unescape_re.sub(lambda m: _unescapes[m.group()], s)
+
+
+class MetadataCache(index.base):
+
+    """
+    mapping of installed category/PF -> {metadata file: content}
+
+    Persisted entries are of the form::
+
+      category/PF<TAB>stamp
+      <TAB>KEY<TAB>escaped content
+      <TAB>KEY
+
+    Files excluded from caching (:obj:`uncached`, or larger than
+    :obj:`max_size`) are listed without content; their content is read from
+    the vdb on request.
+    """
+
+    magic = 'pkgcore vdb metadata cache 1'
+    description = 'vdb metadata cache'
+    uncached = frozenset(["CONTENTS", "environment", "environment.bz2",
+        "NEEDED", "NEEDED.ELF.2"])
+    max_size = 65536
+
+    def __init__(self, vdb, location):
+        """
+        :param vdb: :obj:`pkgcore.vdb.ondisk.tree` instance to cache
+        :param location: file path to persist the cache to
+        """
+        index.base.__init__(self, vdb, location)
+
+    def _parse(self, f):
+        # category/PF -> (stamp, {key: content, or None if uncached})
+        d = {}
+        data = None
+        for line in f:
+            line = line.rstrip('\n').split('\t')
+            if not line[0]:
+                if data is None:
+                    continue
+                if len(line) == 3:
+                    data[line[1]] = _unescape(line[2])
+                elif len(line) == 2:
+                    data[line[1]] = None
+                continue
+            if len(line) != 2:
+                # corrupted header; ignore its keys.
+                data = None
+                continue
+            data = {}
+            d[line[0]] = (line[1], data)
+        return d
+
+    def _serialize(self, f):
+        for cpv, (stamp, data) in sorted(self._entries.iteritems()):
+            f.write("%s\t%s\n" % (cpv, stamp))
+            for key, val in sorted(data.iteritems()):
+                if val is None:
+                    f.write("\t%s\n" % (key,))
+                else:
+                    f.write("\t%s\t%s\n" % (key, _escape(val)))
+
+    def _installed(self):
+        return set("%s/%s-%s" % (cat, pkg, ver)
+            for (cat, pkg), vers in self.vdb.versions.iteritems()
+            for ver in vers)
+
+    def _path(self, cpv):
+        return pjoin(self.vdb.location, cpv)
+
+    def _scan(self, cpv, stamp):
+        if stamp == '-':
+            return (stamp, {})
+        path = self._path(cpv)
+        pf = os.path.basename(cpv)
+        data = {}
+        try:
+            for key in listdir_files(path):
+                if key in self.uncached or key == pf + ".ebuild" or \
+                        os.path.getsize(pjoin(path, key)) > self.max_size:
+                    data[key] = None
+                else:
+                    data[key] = readfile(pjoin(path, key))
+        except EnvironmentError as e:
+            logger.warning("failed reading metadata of %s: %s", cpv, e)
+            return ('-', {})
+        return (stamp, data)
+
+    def get(self, cpv):
+        """
+        :param cpv: category/PF of an installed package
+        :return: dict of metadata file -> content, None for files whose
+            content isn't cached; None if the package isn't cached
+        """
+        if self.persistent:
+            self.reconcile()
+            entry = self._entries.get(cpv)
+        else:
+            # a reconcile can't be written out, thus would be repeated by
+            # every process; use the entry only if it's still valid.
+            entry = self._entries.get(cpv)
+            if entry is not None and entry[0] != self._stamp(cpv):
+                entry = None
+        if entry is None or entry[0] == '-':
+            return None
+        return entry[1]
@@ -4,9 +4,11 @@
 __all__ = ("tree", "ConfiguredTree")
 
 import os, stat, errno
+from itertools import izip
 
-from pkgcore.repository import prototype, errors
-from pkgcore.vdb import virtuals
+from pkgcore.repository import prototype, errors, index
+from pkgcore.vdb import virtuals, owners, depgraph, metadata
+from pkgcore.restrictions import boolean, packages, values
 from pkgcore.plugin import get_plugin
 from snakeoil import data_source
 from pkgcore.repository import multiplex
@@ -40,10 +42,19 @@ class tree(prototype.tree):
 
     pkgcore_config_type = ConfigHint({'location': 'str',
         'cache_location': 'str', 'repo_id':'str',
-        'disable_cache': 'bool'}, typename='repo')
+        'disable_cache': 'bool', 'index_location': 'str'}, typename='repo')
 
     def __init__(self, location, cache_location=None, repo_id='vdb',
-                 disable_cache=False):
+                 disable_cache=False, index_location=None):
+        """
+        :param location: on disk location of the vdb
+        :param cache_location: location to store the vdb's caches in;
+            defaults to a path under /var/cache/edb/dep
+        :param disable_cache: if True, don't use on disk caches
+        :param index_location: if not None, file path to store a persistent
+            :obj:`pkgcore.repository.index.DirectoryIndex` of the installed
+            packages in, used instead of listing every category on startup
+        """
         prototype.tree.__init__(self, frozen=False)
         self.repo_id = repo_id
         self.location = location
@@ -54,6 +65,9 @@ class tree(prototype.tree):
                 location.lstrip("/"))
         self.cache_location = cache_location
         self._versions_tmp_cache = {}
+        self._index = None
+        if index_location is not None:
+            self._index = index.DirectoryIndex(index_location)
         try:
             st = os.stat(self.location)
             if not stat.S_ISDIR(st.st_mode):
@@ -73,19 +87,35 @@ class tree(prototype.tree):
         # return if optional_category is passed... cause it's not yet supported
         if optional_category:
             return {}
+        if self._index is not None:
+            return self._index.get('', self.location, self._scan_categories)
+        return self._scan_categories()
+
+    def _scan_categories(self):
         try:
-            try:
-                return tuple(x for x in listdir_dirs(self.location) if not
-                             x.startswith('.'))
-            except EnvironmentError as e:
-                compatibility.raise_from(KeyError("failed fetching categories: %s" % str(e)))
-        finally:
-            pass
+            return tuple(x for x in listdir_dirs(self.location) if not
+                         x.startswith('.'))
+        except EnvironmentError as e:
+            compatibility.raise_from(KeyError("failed fetching categories: %s" % str(e)))
 
     def _get_packages(self, category):
-        cpath = pjoin(self.location, category.lstrip(os.path.sep))
-        l = set()
+        if self._index is not None:
+            cpath = pjoin(self.location, category.lstrip(os.path.sep))
+            # stored as a flat sequence of package, fullver pairs.
+            data = self._index.get(category, cpath,
+                partial(self._scan_category, category))
+        else:
+            data = self._scan_category(category)
         d = {}
+        i = iter(data)
+        for package, fullver in izip(i, i):
+            d.setdefault((category, package), []).append(fullver)
+        self._versions_tmp_cache.update(d)
+        return tuple(package for (cat, package) in d)
+
+    def _scan_category(self, category):
+        cpath = pjoin(self.location, category.lstrip(os.path.sep))
+        l = []
         bad = False
         try:
             for x in listdir_dirs(cpath):
@@ -115,14 +145,11 @@ class tree(prototype.tree):
                         "unmerge it." % (bad, category, x, bad, bad))
                     raise InvalidCPV("%s/%s: -%s version component is "
                         "not standard." % (category, x, bad))
-                l.add(pkg.package)
-                d.setdefault((category, pkg.package), []).append(pkg.fullver)
+                l.extend((pkg.package, pkg.fullver))
         except EnvironmentError as e:
             compatibility.raise_from(KeyError("failed fetching packages for category %s: %s" % \
             (pjoin(self.location, category.lstrip(os.path.sep)), str(e))))
-
-        self._versions_tmp_cache.update(d)
-        return tuple(l)
+        return l
 
     def _get_versions(self, catpkg):
         return tuple(self._versions_tmp_cache.pop(catpkg))
@@ -165,18 +192,132 @@ class tree(prototype.tree):
             data = data_source.local_source(fp)
         elif key == 'repo':
             # try both, for portage/paludis compatibility.
-            data = readfile(pjoin(path, 'repository'), True)
+            data = self._read_key(path, 'repository')
             if data is None:
-                data = readfile(pjoin(path, 'REPOSITORY'), True)
+                data = self._read_key(path, 'REPOSITORY')
                 if data is None:
                     raise KeyError(key)
         else:
-            data = readfile(pjoin(path, key), True)
+            data = self._read_key(path, key)
             if data is None:
                 raise KeyError((path, key))
         return data
 
+    @klass.jit_attr
+    def _metadata_cache(self):
+        if self.cache_location is None:
+            return None
+        return metadata.MetadataCache(self,
+            pjoin(self.cache_location, "metadata"))
+
+    def _read_key(self, path, key):
+        # content of a package's metadata file, or None if it doesn't exist
+        cache = self._metadata_cache
+        if cache is not None:
+            data = cache.get(os.path.relpath(path, self.location))
+            if data is not None:
+                if key not in data:
+                    return None
+                elif data[key] is not None:
+                    return data[key]
+        return readfile(pjoin(path, key), True)
+
+    @klass.jit_attr
+    def _owners_index(self):
+        location = None
+        if self.cache_location is not None:
+            location = pjoin(self.cache_location, "owners")
+        return owners.OwnersIndex(self, location)
+
+    def owners(self, paths):
+        """
+        look up which installed packages own the given paths
+
+        :param paths: iterable of absolute filesystem locations
+        :return: dict of location -> tuple of owning package instances
+        """
+        pkls = self.package_class
+        return dict((path, tuple(pkls(*key) for key in keys))
+            for path, keys in self._owners_index.owners(paths).iteritems())
+
+    @klass.jit_attr
+    def _dependency_graph(self):
+        location = None
+        if self.cache_location is not None:
+            location = pjoin(self.cache_location, "depgraph")
+        return depgraph.DependencyGraph(self, location)
+
+    def dependencies(self, pkg, attrs=None):
+        """
+        look up the installed packages an installed package depends upon
+
+        :param pkg: installed package instance
+        :param attrs: dependency attributes to consider; defaults to
+            depends, rdepends, and post_rdepends
+        :return: dict of atom string -> tuple of installed package instances
+            satisfying it; unsatisfied atoms map to an empty tuple
+        """
+        pkls = self.package_class
+        return dict((atom_str, tuple(pkls(*key) for key in keys))
+            for atom_str, keys in self._dependency_graph.dependencies(
+                (pkg.category, pkg.package, pkg.fullver), attrs).iteritems())
+
+    def dependents(self, pkg, attrs=None, slot_operator=False):
+        """
+        look up the installed packages depending upon an installed package
+
+        :param pkg: installed package instance
+        :param attrs: dependency attributes to consider; defaults to
+            depends, rdepends, and post_rdepends
+        :param slot_operator: if True, only consider dependencies bound to
+            the package's subslot via the ``:=`` slot operator
+        :return: dict of installed package instance -> frozenset of the atom
+            strings by which it depends upon pkg
+        """
+        pkls = self.package_class
+        return dict((pkls(*key), atoms)
+            for key, atoms in self._dependency_graph.dependents(
+                (pkg.category, pkg.package, pkg.fullver), attrs,
+                slot_operator).iteritems())
+
+    def _identify_candidates(self, restrict, sorter):
+        # if every solution requires owning specific paths, the candidates
+        # can be pulled straight from the owners index.
+        if isinstance(restrict, boolean.base):
+            solutions = restrict.iter_dnf_solutions(True)
+        else:
+            solutions = [[restrict]]
+        paths = set()
+        for solution in solutions:
+            for r in solution:
+                if (isinstance(r, packages.PackageRestriction)
+                        and r.attr == 'contents' and not r.negate
+                        and isinstance(r.restriction, values.ContainmentMatch2)
+                        and not r.restriction.negate):
+                    paths.update(getattr(x, 'location', x)
+                        for x in r.restriction.vals)
+                    break
+            else:
+                return prototype.tree._identify_candidates(self, restrict,
+                    sorter)
+        return set((key[0], key[1]) for keys in
+            self._owners_index.owners(paths).itervalues() for key in keys)
+
+    def notify_add_package(self, pkg):
+        prototype.tree.notify_add_package(self, pkg)
+        key = (pkg.category, pkg.package, pkg.fullver)
+        # first, since the other indexes read the package's metadata.
+        if self._metadata_cache is not None:
+            self._metadata_cache.add("%s/%s-%s" % key)
+        self._owners_index.add(key)
+        self._dependency_graph.add(key)
+
     def notify_remove_package(self, pkg):
+        key = (pkg.category, pkg.package, pkg.fullver)
+        self._owners_index.remove(key)
+        self._dependency_graph.remove(key)
+        if self._metadata_cache is not None:
+            self._metadata_cache.remove("%s/%s-%s" % key)
         remove_it = len(self.packages[pkg.category]) == 1
         prototype.tree.notify_remove_package(self, pkg)
         if remove_it:
@@ -210,5 +351,8 @@ class ConfiguredTree(multiplex.tree):
         multiplex.tree.__init__(self, raw_vdb, self.old_style_virtuals)
 
     frozen = klass.alias_attr("raw_vdb.frozen")
+    owners = klass.alias_method("raw_vdb.owners")
+    dependencies = klass.alias_method("raw_vdb.dependencies")
+    dependents = klass.alias_method("raw_vdb.dependents")
 
 tree.configure = ConfiguredTree
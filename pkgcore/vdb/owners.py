@@ -0,0 +1,132 @@
+# License: GPL2/BSD
+
+"""
+inverted path -> installed package index for the vdb
+
+Finding what owns a path otherwise requires parsing every installed
+package's CONTENTS; this maintains the reverse mapping.  Entries are
+validated against the stat of the package's CONTENTS file rather than its
+vdb directory.
+"""
+
+__all__ = ("OwnersIndex",)
+
+from pkgcore.vdb import index
+from snakeoil.osutils import pjoin
+from snakeoil.demandload import demandload
+demandload(globals(),
+    'pkgcore.log:logger',
+    'pkgcore.vdb.contents:ContentsFile',
+)
+
+
+class OwnersIndex(index.base):
+
+    """
+    mapping of filesystem location -> installed (category, package, fullver)
+
+    Persisted entries are of the form::
+
+      category<TAB>package<TAB>fullver<TAB>stamp
+      /path/owned
+      /another/path
+
+    Paths are always absolute, thus distinguishable from the headers.
+    """
+
+    magic = 'pkgcore vdb owners index 1'
+    description = 'owners index'
+
+    def __init__(self, vdb, location=None):
+        """
+        :param vdb: :obj:`pkgcore.vdb.ondisk.tree` instance to index
+        :param location: file path to persist the index to; if None, the
+            index is rebuilt in memory for each instance
+        """
+        index.base.__init__(self, vdb, location)
+        # path -> list of keys; built on first lookup.
+        self._owners = None
+
+    def _parse(self, f):
+        # (cat, pkg, fullver) -> (stamp, paths)
+        d = {}
+        paths = None
+        for line in f:
+            line = line.rstrip('\n')
+            if line[:1] == '/':
+                if paths is not None:
+                    paths.append(line)
+                continue
+            line = line.split('\t')
+            if len(line) != 4:
+                # corrupted header; ignore its paths.
+                paths = None
+                continue
+            paths = []
+            d[tuple(line[:3])] = (line[3], paths)
+        return d
+
+    def _serialize(self, f):
+        for key, (stamp, paths) in sorted(self._entries.iteritems()):
+            f.write("%s\t%s\n" % ('\t'.join(key), stamp))
+            if paths:
+                f.write("%s\n" % ('\n'.join(paths),))
+
+    def _get_owners(self):
+        if self._owners is None:
+            self.reconcile()
+            d = {}
+            for key, (stamp, paths) in self._entries.iteritems():
+                for path in paths:
+                    d.setdefault(path, []).append(key)
+            self._owners = d
+        return self._owners
+
+    def _stamp_path(self, key):
+        return pjoin(self._path(key), "CONTENTS")
+
+    def _scan(self, key, stamp):
+        if stamp == '-':
+            return (stamp, [])
+        try:
+            cset = ContentsFile(self._stamp_path(key))
+        except EnvironmentError as e:
+            logger.warning("failed reading contents of %s/%s-%s: %s",
+                *(key + (e,)))
+            return ('-', [])
+        return (stamp, [x.location for x in cset])
+
+    @property
+    def _built(self):
+        return self._owners is not None
+
+    def _update(self, key, old, new):
+        owners = self._owners
+        if owners is None:
+            return
+        if old is not None:
+            for path in old[1]:
+                l = owners.get(path)
+                if l is not None and key in l:
+                    l.remove(key)
+                    if not l:
+                        del owners[path]
+        if new is not None:
+            for path in new[1]:
+                owners.setdefault(path, []).append(key)
+
+    def owners(self, paths):
+        """
+        look up the owners of the given locations
+
+        :param paths: iterable of absolute filesystem locations
+        :return: dict of location -> tuple of (category, package, fullver)
+            for each location that is owned
+        """
+        owners = self._get_owners()
+        d = {}
+        for path in paths:
+            l = owners.get(path)
+            if l:
+                d[path] = tuple(l)
+        return d